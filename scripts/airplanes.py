@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+"""Single entry point for the airplanes pipeline and route queries.
+
+    airplanes.py clean | merge | geo
+    airplanes.py run [--geo] [--tiles 6] [--persist itinerary ...]
+    airplanes.py delta [--added raw/routes_added.csv] [--compact]
+    airplanes.py route FLN LIM [--airline LA] [--same-airline] ...
+    airplanes.py route "Sao Paulo" Peru
+    airplanes.py reach FLN [--max-stops 2] [--max-km 3000]
+    airplanes.py places florianopo [--kind airport]
+    airplanes.py geo --tiles 6
+    airplanes.py viewport -75 -35 -35 0 --zoom 4
+    airplanes.py serve [--port 8000]
+
+Every subcommand imports only the modules it needs, so route queries on a
+prebuilt graph snapshot never load pandas, geopandas or shapely.
+"""
+import argparse
+import logging
+import os
+import sys
+
+STOP_LABELS = {0: "Direct", 1: "1-stop", 2: "2-stop"}
+# The clean lookup tables are kept because delta and geo read them
+DEFAULT_PERSIST = ["clean_airlines", "clean_planes", "clean_airports",
+                   "clean_countries", "clean_cities", "itinerary",
+                   "route_graph", "place_index", "geo_points"]
+
+
+def run_clean(args):
+    from data_cleaner import main
+    main()
+
+
+def run_merge(args):
+    from data_merger import FlightItineraryCrafter
+    FlightItineraryCrafter(
+        database_path="merged/itinerary.sqlite" if args.sqlite else None
+    ).execute()
+
+
+def geo_crafter(args):
+    from geo_shape_crafter import GeoShapeCrafter
+    return GeoShapeCrafter(
+        tile_zooms=None if args.tiles is None else range(args.tiles + 1),
+        max_tile_features=args.tile_features
+    )
+
+
+def run_geo(args):
+    geo_crafter(args).execute()
+
+
+def run_pipeline(args):
+    from data_cleaner import cleaning_stages
+    from data_handler import Pipeline
+    from data_merger import FlightItineraryCrafter
+    from place_index import PlaceIndex
+    from route_graph import RouteGraph
+
+    stages = cleaning_stages() + [
+        FlightItineraryCrafter(
+            database_path="merged/itinerary.sqlite" if args.sqlite else None),
+        RouteGraph(),
+        PlaceIndex()
+    ]
+    if args.geo or args.tiles is not None:
+        stages.append(geo_crafter(args))
+    persist = args.persist_all or set(args.persist or DEFAULT_PERSIST)
+    Pipeline(stages, persist=persist).run()
+
+
+def run_delta(args):
+    from route_delta import RouteDeltaIngestor
+    ingestor = RouteDeltaIngestor(added_path=args.added,
+                                  removed_path=args.removed)
+    if args.compact:
+        ingestor.compact()
+        return
+    try:
+        ingestor.load_data()
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    ingestor.process_data()
+    ingestor.save_data()
+
+
+def route_filters(args):
+    return {
+        "airlines": args.airline,
+        "equipment": args.equipment,
+        "exclude_codeshare": args.exclude_codeshare,
+        "same_airline": args.same_airline
+    }
+
+
+def run_route(args):
+    import numpy as np
+    from route_graph import RouteGraph
+    from route_query import RouteFinder
+
+    finder = RouteFinder(start_airport=args.start,
+                         end_airport=args.end,
+                         snapshot_path=args.snapshot,
+                         expand_flights=args.expand,
+                         backend=args.backend,
+                         exclude_group_stops=args.exclude_group_stops,
+                         **route_filters(args))
+    if args.save:
+        finder.execute()
+        return
+    if args.backend == "sqlite":
+        try:
+            finder.load_data()
+            finder.process_data()
+        except (FileNotFoundError, ValueError) as e:
+            print(e)
+            return 1
+        for stops, table in finder.df.groupby("Stops"):
+            print(f"{STOP_LABELS[stops]}: {len(table)} airport paths, "
+                  f"{int(table['Combinations'].sum())} airline combinations")
+            for row in table.head(args.limit).itertuples(index=False):
+                airlines = " x ".join(
+                    str(getattr(row, f"Airlines_{leg + 1}"))
+                    for leg in range(stops + 1)
+                )
+                print(f"  {row.Route:<28} airlines {airlines:<14} "
+                      f"combinations {row.Combinations}")
+        return
+
+    graph = RouteGraph.load_or_build(args.snapshot, mmap=True)
+    finder.graph = graph
+    finder.compile_filters()
+    start, end = finder.resolve(args.start), finder.resolve(args.end)
+    for place, airports in ((args.start, start), (args.end, end)):
+        if not len(airports):
+            print(f"Unknown airport, city or country: {place}")
+            return 1
+
+    paths, leg_counts, combinations = finder.search(start, end)
+    for stops in sorted(paths):
+        columns = finder.path_columns(stops, paths[stops], leg_counts[stops],
+                                      combinations[stops])
+        print(f"{STOP_LABELS[stops]}: {len(paths[stops])} airport paths, "
+              f"{int(combinations[stops].sum())} airline combinations")
+        order = np.argsort(-combinations[stops], kind="stable")
+        for row in order[:args.limit]:
+            airlines = " x ".join(
+                str(columns[f"Airlines_{leg + 1}"][row])
+                for leg in range(stops + 1)
+            )
+            print(f"  {columns['Route'][row]:<28} airlines {airlines:<14} "
+                  f"combinations {columns['Combinations'][row]}")
+
+
+def run_reach(args):
+    from route_graph import RouteGraph
+    from route_reach import ReachabilityFinder
+
+    filters = route_filters(args)
+    del filters["same_airline"]
+    finder = ReachabilityFinder(start_airport=args.start,
+                                max_stops=(None if args.max_stops < 0
+                                           else args.max_stops),
+                                max_km=args.max_km,
+                                snapshot_path=args.snapshot,
+                                **filters)
+    finder.graph = RouteGraph.load_or_build(args.snapshot, mmap=True)
+    finder.compile_filters()
+    if finder.graph.airport_id(args.start) < 0:
+        print(f"Unknown airport: {args.start}")
+        return 1
+    finder.process_data()
+    if args.save:
+        finder.save_data()
+        return
+    for stops, table in finder.df.groupby("Stops"):
+        print(f"{STOP_LABELS.get(stops, f'{stops}-stop')}: "
+              f"{len(table)} airports")
+        for row in table.head(args.limit).itertuples(index=False):
+            print(f"  {row[0]:<4} {row[1]:<24} {row[4]:>9.1f} km")
+
+
+def run_places(args):
+    from place_index import PlaceIndex
+    index = PlaceIndex.load_or_build(args.index, mmap=True)
+    for place in index.records(args.text, args.limit, args.kind):
+        print(f"  {place['Kind']:<8} {place['Code']:<4} "
+              f"{place['Name'][:40]:<40} {place['Detail'][:30]:<30} "
+              f"{place['Score']:.3f}")
+
+
+def run_viewport(args):
+    from data_handler import DataHandler
+    from geo_tiles import TileSet
+    tiles = TileSet(os.path.join(DataHandler.data_dir, args.tiles_dir))
+    airports, routes = tiles.viewport(args.bbox, args.zoom)
+    print(f"{len(airports)} airports and {len(routes)} routes from "
+          f"{len(tiles.tiles(args.bbox, args.zoom))} tiles")
+    if len(airports):
+        busiest = airports.sort_values("Degree", ascending=False)[
+            ["Airport-IATA", "Airport-Name", "Degree"]]
+        for code, name, degree in busiest.head(args.limit).itertuples(
+                index=False):
+            print(f"  {code:<4} {name[:40]:<40} {degree:>6} routes")
+
+
+def run_serve(args):
+    from route_server import serve
+    serve(args.host, args.port, args.snapshot)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="airplanes", description=__doc__,
+                                     formatter_class=argparse.
+                                     RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only log warnings and errors")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "clean", help="clean the raw OpenFlights and Natural Earth files"
+    ).set_defaults(func=run_clean)
+    merge = commands.add_parser(
+        "merge", help="merge the clean tables into the itinerary")
+    merge.add_argument("--sqlite", action="store_true",
+                       help="also write the indexed itinerary store")
+    merge.set_defaults(func=run_merge)
+    geo = commands.add_parser(
+        "geo", help="build the point and polygon shapefiles")
+    geo.add_argument("--tiles", type=int, metavar="MAX_ZOOM",
+                     help="also write quadkey tiles of airports and routes "
+                          "for zooms 0 to MAX_ZOOM")
+    geo.add_argument("--tile-features", type=int, default=256,
+                     help="airports and routes kept per tile below "
+                          "MAX_ZOOM, busiest first")
+    geo.set_defaults(func=run_geo)
+
+    pipeline = commands.add_parser(
+        "run", help="clean, merge and build the route graph in one process, "
+                    "passing tables between stages in memory")
+    pipeline.add_argument("--geo", action="store_true",
+                          help="also build the shapefiles")
+    pipeline.add_argument("--tiles", type=int, metavar="MAX_ZOOM",
+                          help="also build the shapefiles and quadkey "
+                               "tiles for zooms 0 to MAX_ZOOM")
+    pipeline.add_argument("--tile-features", type=int, default=256,
+                          help="airports and routes kept per tile below "
+                               "MAX_ZOOM, busiest first")
+    pipeline.add_argument("--sqlite", action="store_true",
+                          help="also write the indexed itinerary store")
+    pipeline.add_argument("--persist", action="append", metavar="STAGE",
+                          help="stage output to save, e.g. clean_routes "
+                               "(repeatable; default: the clean lookup "
+                               "tables, itinerary, route_graph, "
+                               "place_index and geo_points)")
+    pipeline.add_argument("--persist-all", action="store_true",
+                          help="save every intermediate file as well")
+    pipeline.set_defaults(func=run_pipeline)
+
+    delta = commands.add_parser(
+        "delta", help="apply added/removed raw route rows incrementally")
+    delta.add_argument("--added", default="raw/routes_added.csv")
+    delta.add_argument("--removed", default="raw/routes_removed.csv")
+    delta.add_argument("--compact", action="store_true",
+                       help="fold the delta log into the itinerary")
+    delta.set_defaults(func=run_delta)
+
+    route = commands.add_parser("route",
+                                help="direct, 1-stop and 2-stop routes")
+    route.add_argument("start", help="departure airport IATA code, "
+                                     "city or country")
+    route.add_argument("end", help="arrival airport IATA code, city or "
+                                   "country")
+    route.add_argument("--airline", action="append",
+                       help="only fly this airline IATA code (repeatable)")
+    route.add_argument("--equipment", action="append",
+                       help="only fly this aircraft IATA code (repeatable)")
+    route.add_argument("--exclude-codeshare", action="store_true")
+    route.add_argument("--same-airline", action="store_true",
+                       help="connections must stay on one airline")
+    route.add_argument("--exclude-group-stops", action="store_true",
+                       help="for a city or country, leave out paths that "
+                            "stop at another of its airports (by default "
+                            "every airport pair's paths are listed)")
+    route.add_argument("--limit", type=int, default=10,
+                       help="paths shown per number of stops")
+    route.add_argument("--save", action="store_true",
+                       help="write route_paths.csv instead of printing")
+    route.add_argument("--expand", action="store_true",
+                       help="with --save, also write per-flight CSVs")
+    route.add_argument("--snapshot", default="merged/route_graph.npz")
+    route.add_argument("--backend", choices=["graph", "sqlite"],
+                       default="graph",
+                       help="search the graph snapshot or the itinerary "
+                            "store written by merge --sqlite (IATA codes "
+                            "only; refused if older than the itinerary)")
+    route.set_defaults(func=run_route)
+
+    reach = commands.add_parser(
+        "reach", help="all airports reachable from an origin")
+    reach.add_argument("start", help="origin airport IATA code")
+    reach.add_argument("--max-stops", type=int, default=2,
+                       help="stops allowed (-1 for any number)")
+    reach.add_argument("--max-km", type=float,
+                       help="maximum flown distance in km")
+    reach.add_argument("--airline", action="append")
+    reach.add_argument("--equipment", action="append")
+    reach.add_argument("--exclude-codeshare", action="store_true")
+    reach.add_argument("--limit", type=int, default=10,
+                       help="airports shown per number of stops")
+    reach.add_argument("--save", action="store_true",
+                       help="write reachable_from_<IATA>.csv instead")
+    reach.add_argument("--snapshot", default="merged/route_graph.npz")
+    reach.set_defaults(func=run_reach, same_airline=False)
+
+    places = commands.add_parser(
+        "places", help="fuzzy lookup of airports and airlines by name")
+    places.add_argument("text", help="free text, e.g. florianopo or latam")
+    places.add_argument("--kind", choices=["airport", "airline"])
+    places.add_argument("--limit", type=int, default=10)
+    places.add_argument("--index", default="merged/place_index.npz")
+    places.set_defaults(func=run_places)
+
+    viewport = commands.add_parser(
+        "viewport", help="airports and routes of a map viewport, read "
+                         "from the tiles written by geo --tiles")
+    viewport.add_argument("bbox", type=float, nargs=4,
+                          metavar=("MIN_LON", "MIN_LAT", "MAX_LON",
+                                   "MAX_LAT"))
+    viewport.add_argument("--zoom", type=int, default=4)
+    viewport.add_argument("--limit", type=int, default=10,
+                          help="busiest airports shown")
+    viewport.add_argument("--tiles-dir", default="merged/tiles")
+    viewport.set_defaults(func=run_viewport)
+
+    serve = commands.add_parser("serve", help="serve route queries as JSON")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--snapshot", default="merged/route_graph.npz")
+    serve.set_defaults(func=run_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
+import os
 import pandas as pd
-import geopandas as gpd
-from data_handler import DataHandler
+from data_validator import (AIRLINE_IATA, AIRLINE_ICAO, AIRPORT_IATA,
+                            AIRPORT_ICAO, EQUIPMENT, PLANE_IATA, PLANE_ICAO,
+                            ValidatedProcessor, bad_format, duplicate,
+                            out_of_range, unknown)
 
 
-class AirlineDataProcessor(DataHandler):
+class AirlineDataProcessor(ValidatedProcessor):
     def __init__(self,
                  input_path="raw/raw_airlines.csv",
                  output_path="processed/clean_airlines.csv"
@@ -56,19 +59,26 @@ class AirlineDataProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        """Drop rows with any NA values."""
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        df = self.df
+        return {
+            "missing_id": df["Airline-ID"].isna(),
+            "duplicate_id": duplicate(df["Airline-ID"]),
+            "missing_name": df["Airline-Name"].isna(),
+            "bad_iata": bad_format(df["Airline-IATA"], AIRLINE_IATA),
+            "bad_icao": bad_format(df["Airline-ICAO"], AIRLINE_ICAO),
+            "bad_active": bad_format(df["Active-Airline"], r"[YN]")
+        }
 
     def process_data(self):
         self.df.columns = self.column_names
         self.df.replace("\\N", pd.NA, inplace=True)
         self.df.replace("", pd.NA, inplace=True)
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-class AirplaneModelsProcessor(DataHandler):
+class AirplaneModelsProcessor(ValidatedProcessor):
     def __init__(self,
                  input_path="raw/raw_planes.csv",
                  output_path="processed/clean_planes.csv"
@@ -111,19 +121,24 @@ class AirplaneModelsProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        """Drop rows with any NA values."""
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        df = self.df
+        return {
+            "missing_model": df["Airplane-Model"].isna(),
+            "missing_iata": df["Airplane-IATA"].isna(),
+            "bad_iata": bad_format(df["Airplane-IATA"], PLANE_IATA),
+            "bad_icao": bad_format(df["Airplane-ICAO"], PLANE_ICAO)
+        }
 
     def process_data(self):
         self.df.columns = self.column_names
         self.df.replace("\\N", pd.NA, inplace=True)
         self.df.replace("", pd.NA, inplace=True)
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-class AirportCoordinatesProcessor(DataHandler):
+class AirportCoordinatesProcessor(ValidatedProcessor):
     def __init__(self, input_path="raw/raw_airports.csv",
                  output_path="processed/clean_airports.csv"
                  ):
@@ -187,23 +202,35 @@ class AirportCoordinatesProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        """Drop rows with any NA values."""
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        df = self.df
+        return {
+            "missing_id": df["Airport-ID"].isna(),
+            "duplicate_id": duplicate(df["Airport-ID"]),
+            "missing_iata": df["Airport-IATA"].isna(),
+            "bad_iata": bad_format(df["Airport-IATA"], AIRPORT_IATA),
+            "bad_icao": bad_format(df["Airport-ICAO"], AIRPORT_ICAO),
+            "missing_coordinates": (df["Airport-Latitude"].isna()
+                                    | df["Airport-Longitude"].isna()),
+            "bad_latitude": out_of_range(df["Airport-Latitude"], -90, 90),
+            "bad_longitude": out_of_range(df["Airport-Longitude"],
+                                          -180, 180)
+        }
 
     def process_data(self):
         self.df.columns = self.column_names
         self.df.replace("\\N", pd.NA, inplace=True)
         self.df.replace("", pd.NA, inplace=True)
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-class CountryCodesProcessor(DataHandler):
+class CountryCodesProcessor(ValidatedProcessor):
     def __init__(self,
                  input_path="raw/shapefiles/ne_110m_admin_0_countries.shp",
                  output_path="processed/clean_countries.csv"
                  ):
+        import geopandas as gpd
         super().__init__(input_path, output_path)
         self.filtered_columns = [
             "GEOUNIT",
@@ -225,6 +252,7 @@ class CountryCodesProcessor(DataHandler):
         }
 
     def load_data(self):
+        import geopandas as gpd
         self.df = gpd.read_file(self.input_path)
 
     def strip_data(self):
@@ -252,9 +280,12 @@ class CountryCodesProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        """Drop rows with any NA values."""
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        shape = self.df["Country-Shape"]
+        return {
+            "missing_name": self.df["Airport-Country"].isna(),
+            "bad_shape": shape.isna() | shape.is_empty | ~shape.is_valid
+        }
 
     def process_data(self):
         """Execute all processing steps."""
@@ -263,14 +294,15 @@ class CountryCodesProcessor(DataHandler):
         self.df.replace("\\N", pd.NA, inplace=True)
         self.rename_columns()
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-class CityCodesProcessor(DataHandler):
+class CityCodesProcessor(ValidatedProcessor):
     def __init__(self,
                  input_path="raw/shapefiles/ne_110m_populated_places.shp",
                  output_path="processed/clean_cities.csv"
                  ):
+        import geopandas as gpd
         super().__init__(input_path, output_path)
         self.filtered_columns = [
             "NAME",
@@ -292,6 +324,7 @@ class CityCodesProcessor(DataHandler):
         }
 
     def load_data(self):
+        import geopandas as gpd
         self.df = gpd.read_file(self.input_path)
 
     def strip_data(self):
@@ -318,9 +351,12 @@ class CityCodesProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        """Drop rows with any NA values."""
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        shape = self.df["City-Shape"]
+        return {
+            "missing_name": self.df["Airport-City"].isna(),
+            "bad_shape": shape.isna() | shape.is_empty
+        }
 
     def process_data(self):
         """Execute all processing steps."""
@@ -329,14 +365,21 @@ class CityCodesProcessor(DataHandler):
         self.df.replace("\\N", pd.NA, inplace=True)
         self.rename_columns()
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-class RoutesDataProcessor(DataHandler):
+class RoutesDataProcessor(ValidatedProcessor):
     def __init__(self, input_path="raw/raw_routes.csv",
-                 output_path="processed/clean_routes.csv"
+                 output_path="processed/clean_routes.csv",
+                 airports_path="processed/clean_airports.csv",
+                 airlines_path="processed/clean_airlines.csv"
                  ):
         super().__init__(input_path, output_path)
+        self.airports_path = self.resolve_path(airports_path)
+        self.airlines_path = self.resolve_path(airlines_path)
+        # Referenced keys: airline IDs, airport IATA codes by airport ID
+        self.airline_ids = None
+        self.airport_iata = None
         self.column_names = [
             "Airline-IATA",
             "Airline-ID",
@@ -362,6 +405,27 @@ class RoutesDataProcessor(DataHandler):
 
     def load_data(self):
         self.df = pd.read_csv(self.input_path, header=None)
+        if self.airline_ids is None and os.path.exists(self.airlines_path):
+            self.airline_ids = pd.read_csv(
+                self.airlines_path, usecols=["Airline-ID"])["Airline-ID"]
+        if self.airport_iata is None and os.path.exists(self.airports_path):
+            self.airport_iata = self.reference_airports(pd.read_csv(
+                self.airports_path, usecols=["Airport-ID", "Airport-IATA"]))
+
+    def receive(self, outputs):
+        """Take the clean airline and airport tables of the same run as
+        references; the raw routes are still read by load_data."""
+        if "df_clean_airlines" in outputs:
+            self.airline_ids = outputs["df_clean_airlines"]["Airline-ID"]
+        if "df_clean_airports" in outputs:
+            self.airport_iata = self.reference_airports(
+                outputs["df_clean_airports"])
+        return False
+
+    @staticmethod
+    def reference_airports(airports):
+        return pd.Series(airports["Airport-IATA"].to_numpy(),
+                         index=airports["Airport-ID"].to_numpy())
 
     def ensure_dtypes(self):
         """Ensure proper data types for each column."""
@@ -379,19 +443,49 @@ class RoutesDataProcessor(DataHandler):
             else:
                 self.df[col] = self.df[col].astype(dtype)
 
-    def drop_na_rows(self):
-        self.df.dropna(inplace=True)
+    def validation_rules(self):
+        """Route rules, plus references to the clean airline and airport
+        tables when they are available."""
+        df = self.df
+        rules = {
+            "missing_airline_id": df["Airline-ID"].isna(),
+            "missing_departure": df["Departure-IATA"].isna(),
+            "missing_arrival": df["Arrival-IATA"].isna(),
+            "bad_airline_iata": bad_format(df["Airline-IATA"],
+                                           AIRLINE_IATA),
+            "bad_departure_iata": bad_format(df["Departure-IATA"],
+                                             AIRPORT_IATA),
+            "bad_arrival_iata": bad_format(df["Arrival-IATA"],
+                                           AIRPORT_IATA),
+            "bad_codeshare": bad_format(df["Codeshare"], r"Y"),
+            "bad_stops": df["Stops"].isna() | (df["Stops"] < 0),
+            "bad_equipment": bad_format(df["Airplane-IATA"], EQUIPMENT)
+        }
+        if self.airline_ids is not None:
+            rules["unknown_airline"] = (
+                df["Airline-ID"].notna()
+                & unknown(df["Airline-ID"], self.airline_ids))
+        if self.airport_iata is not None:
+            for side in ("Departure", "Arrival"):
+                # The merge looks airports up by ID, the graph by IATA
+                rules[f"unknown_{side.lower()}"] = unknown(
+                    df[f"{side}-ID"], self.airport_iata.index)
+                rules[f"{side.lower()}_mismatch"] = (
+                    df[f"{side}-ID"].map(self.airport_iata)
+                    .ne(df[f"{side}-IATA"]).fillna(False)
+                    & ~rules[f"unknown_{side.lower()}"])
+        return rules
 
     def process_data(self):
         self.df.columns = self.column_names
         self.df.replace("", pd.NA, inplace=True)
         self.df.replace("\\N", pd.NA, inplace=True)
         self.ensure_dtypes()
-        self.drop_na_rows()
+        self.validate()
 
 
-def main():
-    handlers = [
+def cleaning_stages():
+    return [
         AirlineDataProcessor(),
         AirplaneModelsProcessor(),
         AirportCoordinatesProcessor(),
@@ -400,7 +494,9 @@ def main():
         RoutesDataProcessor()
     ]
 
-    for handler in handlers:
+
+def main():
+    for handler in cleaning_stages():
         handler.execute()
 
 
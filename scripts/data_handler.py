@@ -1,7 +1,8 @@
 import logging
 import os
-import pandas as pd
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -48,11 +49,120 @@ class DataHandler(ABC):
         self.process_data()
         self.save_data()
 
+    @property
+    def name(self):
+        """Stage name: the stem of the output file, e.g. clean_routes."""
+        return os.path.splitext(os.path.basename(self.output_path))[0]
+
+    def outputs(self):
+        """In-memory outputs a Pipeline hands to downstream stages.
+
+        Frames are keyed like the loaders name them (df_clean_routes) and
+        look as they would after a CSV round trip.
+        """
+        if self.df is None:
+            return {}
+        return {f"df_{self.name}": as_read_back(self.df)}
+
+    def receive(self, outputs):
+        """Take upstream outputs from a Pipeline.
+
+        Returns True when everything load_data would read is in memory,
+        so the pipeline can skip it.
+        """
+        return False
+
+
+# Strings read_csv parses as missing by default
+CSV_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null"
+]
+
+
+def as_read_back(df):
+    """A frame as read_csv would return it after to_csv: default
+    missing-value strings become NA and the index is reset."""
+    df = df.reset_index(drop=True)
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        df[col] = df[col].mask(df[col].isin(CSV_NA_VALUES))
+    return df
+
+
+def read_csv_files(files, max_workers=None):
+    """Read CSV files concurrently on a thread pool.
+
+    `files` maps a name to (path, usecols); usecols None reads every
+    column. Returns the frames by name, leaving out files that failed,
+    and logs how long each file took.
+    """
+    import pandas as pd
+
+    def read(item):
+        name, (path, usecols) = item
+        started = time.perf_counter()
+        try:
+            df = pd.read_csv(path, usecols=usecols)
+        except Exception as e:
+            logging.error(f"Failed to load {path}: {e}")
+            df = None
+        return name, path, df, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers) as pool:
+        results = list(pool.map(read, files.items()))
+    elapsed = time.perf_counter() - started
+
+    frames = {}
+    for name, path, df, seconds in sorted(results, key=lambda r: -r[3]):
+        if df is None:
+            continue
+        frames[name] = df
+        logging.info(f"Loaded {path} into {name}: {len(df)} rows, "
+                     f"{df.shape[1]} columns in {seconds:.3f}s")
+    slowest = max((r[3] for r in results), default=0.0)
+    logging.info(f"Loaded {len(frames)}/{len(files)} files in "
+                 f"{elapsed:.3f}s (slowest file {slowest:.3f}s)")
+    return frames
+
+
+class Pipeline:
+    """Runs handlers in order, handing each one's outputs downstream in
+    memory instead of through files.
+
+    `persist` is True to save every stage, False to save none, or a
+    collection of stage names (clean_routes, itinerary, route_graph)
+    to save only those.
+    """
+    def __init__(self, stages, persist=False):
+        self.stages = stages
+        self.persist = persist
+        self.outputs = {}
+
+    def persists(self, handler):
+        if isinstance(self.persist, bool):
+            return self.persist
+        return handler.name in self.persist
+
+    def run(self):
+        for handler in self.stages:
+            if handler.receive(self.outputs):
+                logging.info(f"{handler.name}: inputs taken from memory")
+            else:
+                handler.load_data()
+            handler.process_data()
+            if self.persists(handler):
+                handler.save_data()
+            self.outputs.update(handler.outputs())
+        return self.outputs
+
 
 # Example Implementation of a Concrete DataHandler Subclass
 class CityDataProcessor(DataHandler):
     def load_data(self):
         """Loads data from a CSV file into a DataFrame."""
+        import pandas as pd
         if self.input_path and os.path.exists(self.input_path):
             self.df = pd.read_csv(self.input_path)
             logging.info(f"Data loaded from {self.input_path}")
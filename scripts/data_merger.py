@@ -1,63 +1,78 @@
-import pandas as pd
-import glob
 import os
 import logging
-from data_handler import DataHandler
+from fnmatch import fnmatch
+from data_handler import DataHandler, read_csv_files
 
 
 class FlightItineraryCrafter(DataHandler):
+    # Input tables and the columns the merge reads (None: all of them)
+    required_dfs = {
+        'df_clean_routes': None,
+        'df_clean_airlines': ['Airline-ID', 'Airline-Name'],
+        'df_clean_airports': ['Airport-ID', 'Airport-Name',
+                              'Airport-City', 'Airport-Country'],
+        'df_clean_cities': ['Airport-City', 'City-ISO-3'],
+        'df_clean_countries': ['Airport-Country', 'Country-ISO-3'],
+        'df_clean_planes': ['Airplane-IATA', 'Airplane-Model']
+    }
+
     def __init__(self, directory="processed",
                  file_pattern="*.csv",
-                 output_path="merged/itinerary.csv"):
+                 output_path="merged/itinerary.csv",
+                 database_path=None):
         """
         Call DataHandler.__init__ with a dummy input_path
         (since we load multiple files)
         Use output_path for the eventual merged output
+        With database_path (e.g. "merged/itinerary.sqlite") the
+        itinerary is also written to an indexed SQLite store
         """
         super().__init__(input_path=directory, output_path=output_path)
         self.directory = directory  # Store directory for load_data
         self.file_pattern = file_pattern
+        self.database_path = (
+            self.resolve_path(database_path) if database_path else None
+        )
         self.dataframes = {}  # Dictionary to store named DataFrames
 
+    def input_files(self, columns=None):
+        """Paths and column subsets of the declared inputs that match
+        `file_pattern`, keyed like "df_clean_airlines"."""
+        files = {}
+        for df_name, usecols in (columns or self.required_dfs).items():
+            filename = f"{df_name[len('df_'):]}.csv"
+            if fnmatch(filename, self.file_pattern):
+                path = os.path.join(self.data_dir, self.directory, filename)
+                files[df_name] = (path, usecols)
+        return files
+
     def load_data(self):
-        """Load all CSV files from the specified directory
-        and assign to df_variables.
+        """Load the declared input tables, only the columns the merge
+        uses, concurrently, and assign to df_variables.
         """
-        # Use DataHandler's data_dir as the base
-        full_path = os.path.join(self.data_dir,
-                                 self.directory,
-                                 self.file_pattern)
-        files = glob.glob(full_path)
-
+        files = self.input_files()
         if not files:
-            logging.warning(f"No files found matching {full_path}")
+            logging.warning(f"No inputs match {self.file_pattern}")
             self.df = None
             return
 
-        for file in files:
-            """
-            # Extract the base filename
-            without path and extension
-            """
-            filename = os.path.splitext(os.path.basename(file))[0]
-            """
-            e.g., "clean_airlines"
-            Create a variable name like "df_clean_airlines"
-            """
-            df_name = f"df_{filename}"
-            try:
-                df = pd.read_csv(file)
-                # Assign to instance attribute dynamically
-                setattr(self, df_name, df)
-                # Also store in a dictionary for easier access
-                self.dataframes[df_name] = df
-                logging.info(f"Loaded {file} into {df_name}")
-            except Exception as e:
-                logging.error(f"Failed to load {file}: {e}")
+        for df_name, df in read_csv_files(files).items():
+            # Assign to instance attribute dynamically
+            setattr(self, df_name, df)
+            # Also store in a dictionary for easier access
+            self.dataframes[df_name] = df
 
         # Set self.df to None or a default DataFrame
         self.df = None
 
+    def receive(self, outputs):
+        """Take the clean tables from upstream stages when all are there."""
+        self.dataframes.update({
+            name: outputs[name] for name in self.required_dfs
+            if name in outputs
+        })
+        return all(name in self.dataframes for name in self.required_dfs)
+
     def process_data(self):
         """
         Merge DataFrames to
@@ -68,16 +83,8 @@ class FlightItineraryCrafter(DataHandler):
             logging.warning("No dataframes to process!")
             return
 
-        required_dfs = {
-            'df_clean_routes': 'routes',
-            'df_clean_airlines': 'airlines',
-            'df_clean_airports': 'airports',
-            'df_clean_cities': 'cities',
-            'df_clean_countries': 'countries',
-            'df_clean_planes': 'planes'
-        }
         missing = [
-            name for name in required_dfs
+            name for name in self.required_dfs
             if name not in
             self.dataframes
             ]
@@ -85,8 +92,19 @@ class FlightItineraryCrafter(DataHandler):
             logging.error(f"Missing required DataFrames: {missing}")
             return
 
-        # Get DataFrames
-        routes = self.dataframes['df_clean_routes']
+        itineraries = self.enrich(self.dataframes['df_clean_routes'])
+        self.df = itineraries
+        logging.info(
+            "Itineraries dataset created with columns: %s",
+            list(itineraries.columns)
+            )
+
+    def enrich(self, routes):
+        """
+        Join clean route rows with the airline, airport, city,
+        country and plane tables. Rows are enriched independently,
+        so a handful of new routes can be merged on their own.
+        """
         airlines = self.dataframes['df_clean_airlines']
         airports = self.dataframes['df_clean_airports']
         cities = self.dataframes['df_clean_cities']
@@ -163,12 +181,14 @@ class FlightItineraryCrafter(DataHandler):
             itineraries['Airline-Name']
             .fillna('Unknown Airline')
         )
-
-        self.df = itineraries
-        logging.info(
-            "Itineraries dataset created with columns: %s",
-            list(itineraries.columns)
-            )
+        return itineraries
+
+    def save_data(self):
+        """Save the itinerary CSV and, if requested, the SQLite store."""
+        super().save_data()
+        if self.df is not None and self.database_path is not None:
+            from itinerary_store import write_itinerary_store
+            write_itinerary_store(self.df, self.database_path)
 
     def get_dataframe(self, name):
         """Helper method to access a specific DataFrame by name."""
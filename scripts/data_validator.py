@@ -0,0 +1,125 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from data_handler import DataHandler
+
+# Code formats of the OpenFlights tables
+AIRLINE_IATA = r"[A-Z0-9]{2}"
+AIRLINE_ICAO = r"[A-Z]{3}"
+AIRPORT_IATA = r"[A-Z0-9]{3}"
+AIRPORT_ICAO = r"[A-Z0-9]{4}"
+PLANE_IATA = r"[A-Z0-9]{3}"
+PLANE_ICAO = r"[A-Z0-9]{3,4}"
+EQUIPMENT = r"[A-Z0-9]{3}( [A-Z0-9]{3})*"
+
+
+def bad_format(column, pattern):
+    """Values present that do not fully match `pattern`."""
+    return column.notna() & ~column.str.fullmatch(pattern).fillna(False)
+
+
+def out_of_range(column, low, high):
+    """Values present outside [low, high]."""
+    return column.notna() & ~column.between(low, high).fillna(False)
+
+
+def unknown(column, known):
+    """Values, missing ones included, that are not among `known`."""
+    return ~column.isin(known)
+
+
+def duplicate(column):
+    """Repeats of a key already seen in an earlier row."""
+    return column.notna() & column.duplicated(keep="first")
+
+
+def split_valid(df, rules):
+    """Split rows into those passing every rule and the rejected ones.
+
+    `rules` maps a reason code to a boolean mask of the rows breaking
+    it. Returns (valid rows, rejected rows with a Reason column listing
+    their codes, rows broken per rule).
+    """
+    codes = list(rules)
+    broken = [pd.Series(rules[code]).to_numpy(dtype=bool, na_value=False)
+              for code in codes]
+    # One bit per rule, set where the row breaks it
+    bits = np.zeros(len(df), dtype=np.int64)
+    for i, mask in enumerate(broken):
+        bits |= mask.astype(np.int64) << i
+    rejected = bits != 0
+    counts = pd.Series([int(mask.sum()) for mask in broken], index=codes,
+                       name="Rows", dtype=np.int64)
+
+    # Label each distinct combination of broken rules once
+    combinations, inverse = np.unique(bits[rejected], return_inverse=True)
+    labels = np.array([
+        ";".join(code for i, code in enumerate(codes)
+                 if combination >> i & 1)
+        for combination in combinations.tolist()
+    ], dtype=object)
+    quarantined = df[rejected].copy()
+    quarantined["Reason"] = labels[inverse]
+    return df[~rejected], quarantined, counts
+
+
+class ValidatedProcessor(DataHandler):
+    """A cleaning stage that quarantines rows instead of dropping them.
+
+    Subclasses declare `validation_rules`, vectorized masks keyed by
+    reason code. `validate` evaluates them all in one pass over the
+    table, keeps the rows breaking none, and writes the others with
+    their reason codes to quarantine/<stage>.csv and the per-rule counts
+    next to them, whether or not the clean table itself is saved.
+    """
+    # Add to the quarantine instead of replacing it, as route deltas do
+    append_quarantine = False
+
+    def __init__(self, input_path, output_path,
+                 quarantine_dir="quarantine"):
+        super().__init__(input_path, output_path)
+        self.quarantine_dir = self.resolve_path(quarantine_dir)
+        self.rejected = None
+        self.rejections = None
+
+    def validation_rules(self):
+        return {}
+
+    def validate(self):
+        """Quarantine the rows that break a validation rule."""
+        total = len(self.df)
+        self.df, self.rejected, self.rejections = split_valid(
+            self.df, self.validation_rules())
+        logging.info(f"{self.name}: kept {len(self.df)} of {total} rows, "
+                     f"quarantined {len(self.rejected)}")
+        for code, rows in self.rejections[self.rejections > 0].items():
+            logging.info(f"{self.name}: {rows} rows {code}")
+        self.save_quarantine()
+
+    @property
+    def quarantine_path(self):
+        return os.path.join(self.quarantine_dir, f"{self.name}.csv")
+
+    @property
+    def counts_path(self):
+        root, extension = os.path.splitext(self.quarantine_path)
+        return f"{root}_counts{extension}"
+
+    def save_quarantine(self):
+        """Save the quarantined rows and the rows broken per rule."""
+        if self.rejected is None:
+            return
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        counts = self.rejections.rename_axis("Rule")
+        append = (self.append_quarantine
+                  and os.path.exists(self.quarantine_path))
+        if append and os.path.exists(self.counts_path):
+            counts = pd.read_csv(self.counts_path, index_col="Rule")[
+                "Rows"].add(counts, fill_value=0).astype(np.int64)
+        self.rejected.to_csv(self.quarantine_path, index=False,
+                             mode="a" if append else "w", header=not append)
+        counts.to_csv(self.counts_path)
+        logging.info(f"{len(self.rejected)} quarantined rows "
+                     f"{'added' if append else 'saved'} to "
+                     f"{self.quarantine_path}")
@@ -1,62 +1,181 @@
 import pandas as pd
 import geopandas as gpd
-import glob
+import numpy as np
 import os
 import logging
+import shapely
 from shapely.geometry import Point  # noqa: F401
-from data_handler import DataHandler
+from data_handler import DataHandler, read_csv_files
+from geo_tiles import write_tiles
+from route_graph import RouteGraph
+
+# Simplification tolerance (degrees) of each country polygon resolution
+COUNTRY_RESOLUTIONS = {"high": 0.01, "medium": 0.05, "low": 0.25}
+# Attribute columns of the country polygons, which shapefiles truncate
+COUNTRY_COLUMNS = ['Airport-Country', 'Country-ISO-2', 'Country-ISO-3',
+                   'Type']
+
+
+def shapes(column):
+    """Geometries of a shape column: parsed from WKT when it was read from
+    CSV, used as they are when handed over in memory by a Pipeline."""
+    if column.dtype.name == "geometry":
+        return gpd.GeoSeries(column)
+    return gpd.GeoSeries.from_wkt(column)
+
+
+def polygons_path(path, resolution):
+    """Shapefile of one resolution next to the full polygons at `path`:
+    the file itself for "full", geo_polygons_<resolution>.shp else."""
+    if resolution == "full":
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{resolution}{extension}"
+
+
+def read_countries(path):
+    """Country polygons saved by GeoShapeCrafter, with their column names
+    restored."""
+    countries = gpd.read_file(path)
+    return countries.rename(columns=dict(zip(
+        countries.columns.drop("geometry"), COUNTRY_COLUMNS)))
+
+
+def simplify_coverage(geometries, tolerance):
+    """Simplify polygons that tile the map together as one coverage.
+
+    Each border shared by two neighbours is simplified once, so the
+    simplified countries still meet without gaps or overlaps. Shapely
+    before 2.1 has no coverage simplification; there every polygon is
+    simplified on its own, which keeps each polygon valid but may open
+    slivers along borders.
+    """
+    geometries = np.asarray(geometries)
+    if hasattr(shapely, "coverage_simplify"):
+        return shapely.coverage_simplify(geometries, tolerance)
+    logging.warning("shapely.coverage_simplify needs shapely 2.1, "
+                    "simplifying countries one by one")
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+class CountryIndex:
+    """Point-in-country lookups on one resolution of the country shapes.
+
+    Polygons are prepared and their bounding boxes go into an STRtree,
+    so a batch of points costs one tree query: only the polygons whose
+    box holds a point are tested, against prepared geometries. Points
+    that simplification left just outside their country are matched to
+    the nearest polygon within `tolerance`.
+    """
+    def __init__(self, countries, tolerance=0.0):
+        self.countries = countries.reset_index(drop=True)
+        self.geometries = np.asarray(self.countries.geometry)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.tolerance = tolerance
+
+    @classmethod
+    def from_file(cls, resolution="medium",
+                  polygons="merged/geo_polygons.shp", resolutions=None):
+        """Index a resolution saved by GeoShapeCrafter, with the
+        tolerance it was simplified with, without rebuilding it."""
+        tolerance = (COUNTRY_RESOLUTIONS if resolutions is None
+                     else resolutions).get(resolution, 0.0)
+        path = polygons_path(os.path.join(DataHandler.data_dir, polygons),
+                             resolution)
+        logging.info(f"Loading {resolution} resolution polygons from {path}")
+        return cls(read_countries(path), tolerance)
+
+    def locate(self, lon, lat):
+        """Row of `countries` holding each point, -1 where none does."""
+        points = shapely.points(np.asarray(lon, dtype=float),
+                                np.asarray(lat, dtype=float))
+        found = np.full(len(points), -1, dtype=np.int64)
+        point, country = self.tree.query(points, predicate="intersects")
+        found[point] = country
+        missing = np.flatnonzero(found < 0)
+        if self.tolerance and len(missing):
+            point, country = self.tree.query_nearest(
+                points[missing], max_distance=self.tolerance,
+                all_matches=False)
+            found[missing[point]] = country
+        return found
 
 
 class GeoShapeCrafter(DataHandler):
+    # Input tables and the columns the shapes are built from
+    required_dfs = {
+        'df_clean_airports': ['Airport-ID', 'Airport-Name', 'Airport-City',
+                              'Airport-Country', 'Airport-IATA',
+                              'Airport-Latitude', 'Airport-Longitude'],
+        'df_clean_cities': ['Airport-City', 'City-ISO-3', 'City-ISO-2',
+                            'City-Shape'],
+        'df_clean_countries': ['Airport-Country', 'Country-ISO-2',
+                               'Country-ISO-3', 'Country-Shape']
+    }
+
     def __init__(self, directory="processed",
                  output_points="merged/geo_points.shp",
-                 output_polygons="merged/geo_polygons.shp"):
+                 output_polygons="merged/geo_polygons.shp",
+                 resolutions=None,
+                 tile_zooms=None,
+                 tiles_dir="merged/tiles",
+                 max_tile_features=256,
+                 snapshot_path="merged/route_graph.npz"):
         # Prepend data_dir to output paths to make them absolute
         super().__init__(input_path=directory, output_path=output_points)
         self.directory = directory
         self.output_points = os.path.join(self.data_dir, output_points)
         self.output_polygons = os.path.join(self.data_dir, output_polygons)
         self.dataframes = {}
+        # Named simplification tolerances, saved as geo_polygons_<name>
+        self.resolutions = (COUNTRY_RESOLUTIONS if resolutions is None
+                            else resolutions)
+        self.country_levels = {}
+        self.country_indexes = {}
+        # Quadkey tiles of airports and routes, e.g. tile_zooms=range(7)
+        self.tile_zooms = list(tile_zooms) if tile_zooms else []
+        self.tiles_dir = os.path.join(self.data_dir, tiles_dir)
+        self.max_tile_features = max_tile_features
+        self.snapshot_path = snapshot_path
+        self.graph = None
+        self.tile_features = None
 
     def load_data(self):
-        """Loads airports, cities, and countries CSVs."""
-        patterns = [
-            "clean_airports.csv",
-            "clean_cities.csv",
-            "clean_countries.csv"
-        ]
-        files = []
-        for pattern in patterns:
-            full_path = os.path.join(self.data_dir, self.directory, pattern)
-            matched = glob.glob(full_path)
-            files.extend(matched)
-            logging.info(f"Searching for {pattern}: found {matched}")
-
-        if not files:
+        """Loads airports, cities, and countries CSVs concurrently,
+        only the columns the shapes are built from."""
+        files = {
+            df_name: (os.path.join(self.data_dir, self.directory,
+                                   f"{df_name[len('df_'):]}.csv"), usecols)
+            for df_name, usecols in self.required_dfs.items()
+        }
+        for df_name, df in read_csv_files(files).items():
+            setattr(self, df_name, df)
+            self.dataframes[df_name] = df
+        if not self.dataframes:
             logging.warning(
                 f"No target files found in {self.data_dir}/{self.directory}"
                 )
-            self.df = None
-            return
-
-        for file in files:
-            filename = os.path.splitext(os.path.basename(file))[0]
-            df_name = f"df_{filename}"
-            try:
-                df = pd.read_csv(file)
-                setattr(self, df_name, df)
-                self.dataframes[df_name] = df
-                logging.info(f"Loaded {file} into {df_name}")
-            except Exception as e:
-                logging.error(f"Failed to load {file}: {e}")
+        if self.tile_zooms:
+            self.graph = RouteGraph.load_or_build(self.snapshot_path,
+                                                  mmap=True)
         self.df = None
 
+    def receive(self, outputs):
+        """Take the clean tables from upstream stages when all are there."""
+        self.dataframes.update({
+            name: outputs[name] for name in self.required_dfs
+            if name in outputs
+        })
+        self.graph = outputs.get("route_graph", self.graph)
+        if self.tile_zooms and self.graph is None:
+            return False
+        return all(name in self.dataframes for name in self.required_dfs)
+
     def process_data(self):
         """Convert data to GeoDataFrames and separate by geometry type."""
-        required = ['df_clean_airports',
-                    'df_clean_cities',
-                    'df_clean_countries']
-        missing = [name for name in required if name not in self.dataframes]
+        missing = [name for name in self.required_dfs
+                   if name not in self.dataframes]
         if missing:
             logging.error(f"Missing required DataFrames: {missing}")
             return
@@ -79,13 +198,13 @@ class GeoShapeCrafter(DataHandler):
 
         cities_gdf = gpd.GeoDataFrame(
             cities[['Airport-City', 'City-ISO-3', 'City-ISO-2']],
-            geometry=gpd.GeoSeries.from_wkt(cities['City-Shape']),
+            geometry=shapes(cities['City-Shape']),
             crs="EPSG:4326"
         )
 
         countries_gdf = gpd.GeoDataFrame(
             countries[['Airport-Country', 'Country-ISO-2', 'Country-ISO-3']],
-            geometry=gpd.GeoSeries.from_wkt(countries['Country-Shape']),
+            geometry=shapes(countries['Country-Shape']),
             crs="EPSG:4326"
         )
 
@@ -98,6 +217,9 @@ class GeoShapeCrafter(DataHandler):
             crs="EPSG:4326"
         )
         self.polygons_gdf = countries_gdf
+        self.simplify_countries()
+        if self.tile_zooms:
+            self.tile_features = self.route_layers(airports_gdf, airports)
         logging.info(
             "Points GeoDataFrame created with %d features",
             len(self.points_gdf)
@@ -108,6 +230,80 @@ class GeoShapeCrafter(DataHandler):
             )
         self.df = None
 
+    def simplify_countries(self):
+        """Precompute every resolution of the country polygons."""
+        self.country_levels = {"full": self.polygons_gdf}
+        self.country_indexes = {}
+        vertices = shapely.get_num_coordinates(
+            np.asarray(self.polygons_gdf.geometry)).sum()
+        for name, tolerance in self.resolutions.items():
+            level = self.polygons_gdf.copy()
+            level.geometry = gpd.GeoSeries(
+                simplify_coverage(level.geometry, tolerance),
+                index=level.index, crs=level.crs)
+            self.country_levels[name] = level
+            kept = shapely.get_num_coordinates(
+                np.asarray(level.geometry)).sum()
+            logging.info(f"Country polygons at {name} resolution "
+                         f"(tolerance {tolerance}): {kept} of {vertices} "
+                         f"vertices")
+
+    def route_layers(self, airports_gdf, airports):
+        """Airport points weighted by the routes they serve and one line
+        per airport pair weighted by its airline services, from the
+        route graph."""
+        graph = self.graph
+        if graph is None or graph.indptr is None:
+            logging.warning("No route graph, tiles are not built")
+            return None
+        degree = (np.bincount(graph.route_src, minlength=graph.n_airports)
+                  + np.bincount(graph.route_dst, minlength=graph.n_airports))
+        ids = np.array([graph.airport_id(code) for code
+                        in airports['Airport-IATA'].tolist()], dtype=np.int64)
+        points = airports_gdf[airports[['Airport-Latitude',
+                                        'Airport-Longitude']]
+                              .notna().all(axis=1).to_numpy()].copy()
+        points.insert(4, 'Airport-IATA', airports['Airport-IATA'])
+        points['Degree'] = np.where(ids >= 0, degree[ids], 0)[points.index]
+        points['Layer'] = 'airport'
+        points = points.drop(columns='Type')
+
+        src, dst = graph.edge_src, graph.indices
+        ends = np.stack([graph.airport_lon[src], graph.airport_lat[src],
+                         graph.airport_lon[dst], graph.airport_lat[dst]],
+                        axis=1)
+        located = np.flatnonzero(~np.isnan(ends).any(axis=1))
+        routes = gpd.GeoDataFrame({
+            'Route-ID': located,
+            'Departure-IATA': graph.airports[src[located]],
+            'Arrival-IATA': graph.airports[dst[located]],
+            'Routes': graph.edge_multiplicity[located],
+            'Layer': 'route'
+        }, geometry=shapely.linestrings(ends[located].reshape(-1, 2, 2)),
+            crs="EPSG:4326")
+        return points.reset_index(drop=True), routes
+
+    def countries(self, resolution="full"):
+        """Country polygons at a resolution: "full" or a named level.
+
+        Levels not built in this run are read from the saved shapefile.
+        """
+        if resolution not in self.country_levels:
+            self.country_levels[resolution] = read_countries(
+                self.polygons_path(resolution))
+        return self.country_levels[resolution]
+
+    def country_index(self, resolution="full"):
+        """Prepared, STRtree-indexed CountryIndex of one resolution."""
+        if resolution not in self.country_indexes:
+            self.country_indexes[resolution] = CountryIndex(
+                self.countries(resolution),
+                self.resolutions.get(resolution, 0.0))
+        return self.country_indexes[resolution]
+
+    def polygons_path(self, resolution):
+        return polygons_path(self.output_polygons, resolution)
+
     def save_data(self):
         """Save as separate shapefiles for points and polygons."""
         # Use absolute paths directly, no need to recompute dirname
@@ -125,6 +321,17 @@ class GeoShapeCrafter(DataHandler):
         else:
             logging.warning("No polygons GeoDataFrame to save!")
 
+        if self.tile_features is not None:
+            write_tiles(self.tiles_dir, *self.tile_features,
+                        self.tile_zooms, self.max_tile_features)
+
+        for name in self.resolutions:
+            if name in self.country_levels:
+                path = self.polygons_path(name)
+                self.country_levels[name].to_file(path)
+                logging.info(f"{name.capitalize()} resolution polygons "
+                             f"saved to {path}")
+
     def get_dataframe(self, name):
         """Helper method to access a specific DataFrame by name."""
         return getattr(self, f"df_{name}", None)
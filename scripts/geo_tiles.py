@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.05112878
+
+
+def tile_xy(lon, lat, zoom):
+    """Web Mercator tile column and row of points at a zoom level."""
+    n = 1 << zoom
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float),
+                             -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n
+    return (np.clip(np.floor(x), 0, n - 1).astype(np.int64),
+            np.clip(np.floor(y), 0, n - 1).astype(np.int64))
+
+
+def quadkeys(x, y, zoom):
+    """Quadkey strings of tiles, one base-4 digit per zoom level."""
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    if zoom == 0:
+        return np.full(len(x), "", dtype=object)
+    shifts = np.arange(zoom - 1, -1, -1)
+    digits = ((x[:, None] >> shifts) & 1) + 2 * ((y[:, None] >> shifts) & 1)
+    return (digits + ord("0")).astype(np.uint8).view(f"S{zoom}").ravel() \
+        .astype(str).astype(object)
+
+
+def tile_path(directory, quadkey):
+    return os.path.join(directory, f"q{quadkey}.geojson")
+
+
+def feature_strings(gdf, properties):
+    """GeoJSON Feature text of every row, so tiles can be written by
+    joining the rows they hold."""
+    geometries = json.loads(gdf.geometry.to_json())["features"]
+    records = gdf[properties].astype(object).where(
+        gdf[properties].notna(), None).to_dict("records")
+    return np.array([
+        json.dumps({"type": "Feature", "properties": record,
+                    "geometry": geometry["geometry"]})
+        for record, geometry in zip(records, geometries)
+    ], dtype=object)
+
+
+def thin(tiles, weight, limit):
+    """Rows to keep: at most `limit` per tile, heaviest first."""
+    order = np.lexsort((-weight, tiles))
+    starts = np.flatnonzero(np.r_[True, tiles[order][1:]
+                                  != tiles[order][:-1]])
+    rank = np.arange(len(order)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(order[rank < limit])
+
+
+def group_rows(rows, at, n):
+    """Split `rows` into `n` groups by their group number `at`."""
+    order = np.argsort(at, kind="stable")
+    return np.split(rows[order], np.searchsorted(at[order], np.arange(1, n)))
+
+
+def write_tiles(directory, airports, routes, zooms, max_features=256):
+    """Partition airport points and route lines into quadkey tiles.
+
+    `airports` are points weighted by their Degree (routes served) and
+    `routes` two-point lines weighted by Routes (airline services).
+    Airports fall in the tile holding them and a route in the tiles of
+    both its endpoints, so a viewport gets every route touching an
+    airport in view. Below the deepest zoom each tile keeps its
+    `max_features` busiest airports and routes; the deepest zoom keeps
+    them all. Tiles are written as GeoJSON next to an index.csv listing
+    every tile with its feature counts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    airport_text = feature_strings(airports, [
+        column for column in airports.columns if column != "geometry"])
+    route_text = feature_strings(routes, [
+        column for column in routes.columns if column != "geometry"])
+    airport_lon, airport_lat = airports.geometry.x, airports.geometry.y
+    # Endpoints of every route, first ends then second ends
+    ends = shapely.get_coordinates(
+        np.asarray(routes.geometry)).reshape(-1, 2, 2)
+    route_lon = np.r_[ends[:, 0, 0], ends[:, 1, 0]]
+    route_lat = np.r_[ends[:, 0, 1], ends[:, 1, 1]]
+    index = []
+    for zoom in zooms:
+        limit = None if zoom == max(zooms) else max_features
+        ax, ay = tile_xy(airport_lon, airport_lat, zoom)
+        airport_tile = (ax << zoom) | ay
+        route_rows = np.tile(np.arange(len(routes)), 2)
+        rx, ry = tile_xy(route_lon, route_lat, zoom)
+        route_tile = (rx << zoom) | ry
+        # A route inside one tile is listed there once; tile ids take
+        # 2 * zoom bits, so the pairs are compared as two columns
+        _, unique = np.unique(np.stack([route_tile, route_rows], axis=1),
+                              axis=0, return_index=True)
+        route_rows, route_tile = route_rows[unique], route_tile[unique]
+        airport_rows = np.arange(len(airports))
+        if limit is not None:
+            keep = thin(airport_tile, airports["Degree"].to_numpy(), limit)
+            airport_rows, airport_tile = keep, airport_tile[keep]
+            keep = thin(route_tile,
+                        routes["Routes"].to_numpy()[route_rows], limit)
+            route_rows, route_tile = route_rows[keep], route_tile[keep]
+
+        tiles = np.union1d(airport_tile, route_tile)
+        keys = quadkeys(tiles >> zoom, tiles & ((1 << zoom) - 1), zoom)
+        airport_groups = group_rows(
+            airport_rows, np.searchsorted(tiles, airport_tile), len(tiles))
+        route_groups = group_rows(
+            route_rows, np.searchsorted(tiles, route_tile), len(tiles))
+        for tile, key, in_airports, in_routes in zip(
+                tiles, keys, airport_groups, route_groups):
+            with open(tile_path(directory, key), "w") as handle:
+                handle.write('{"type": "FeatureCollection", "features": [')
+                handle.write(", ".join(np.r_[airport_text[in_airports],
+                                             route_text[in_routes]]))
+                handle.write("]}")
+            index.append((key, zoom, tile >> zoom, tile & ((1 << zoom) - 1),
+                          len(in_airports), len(in_routes)))
+        logging.info(f"Zoom {zoom}: {len(tiles)} tiles")
+    index = pd.DataFrame(index, columns=["Quadkey", "Zoom", "X", "Y",
+                                         "Airports", "Routes"])
+    index.to_csv(os.path.join(directory, "index.csv"), index=False)
+    logging.info(f"Wrote {len(index)} tiles to {directory}")
+    return index
+
+
+class TileSet:
+    """Viewport reads from tiles written by `write_tiles`.
+
+    Only the index is read up front; a viewport opens just the tiles
+    that intersect it at the requested zoom.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = pd.read_csv(os.path.join(directory, "index.csv"),
+                                 dtype={"Quadkey": str},
+                                 keep_default_na=False)
+        self.zooms = np.unique(self.index["Zoom"])
+        self.quadkeys = set(self.index["Quadkey"])
+
+    def tiles(self, bbox, zoom):
+        """Quadkeys of the written tiles intersecting a (min lon, min
+        lat, max lon, max lat) box, at the deepest zoom up to `zoom`."""
+        zoom = int(self.zooms[max(np.searchsorted(self.zooms, zoom,
+                                                  side="right") - 1, 0)])
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y1 = tile_xy(min_lon, min_lat, zoom)
+        x1, y0 = tile_xy(max_lon, max_lat, zoom)
+        x, y = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        return [key for key in quadkeys(x.ravel(), y.ravel(), zoom)
+                if key in self.quadkeys]
+
+    def viewport(self, bbox, zoom):
+        """Airports inside the box and the routes touching them or any
+        other airport of the tiles read, as a GeoDataFrame each."""
+        layers = {"airport": [], "route": []}
+        for key in self.tiles(bbox, zoom):
+            with open(tile_path(self.directory, key)) as handle:
+                for feature in json.load(handle)["features"]:
+                    layers[feature["properties"]["Layer"]].append(feature)
+        airports, routes = (
+            gpd.GeoDataFrame.from_features(layers[layer], crs="EPSG:4326")
+            if layers[layer] else gpd.GeoDataFrame(geometry=[],
+                                                   crs="EPSG:4326")
+            for layer in ("airport", "route"))
+        if len(airports):
+            airports = airports.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+        if len(routes):
+            # Routes with both ends in view come from two tiles
+            routes = routes.drop_duplicates("Route-ID")
+        return (airports.reset_index(drop=True),
+                routes.reset_index(drop=True))
@@ -0,0 +1,258 @@
+import logging
+import os
+import sqlite3
+import numpy as np
+from route_graph import DELTA_KEY, delta_log_path, newer_sources
+
+TABLE = "itinerary"
+INDEXED_COLUMNS = ["Departure-IATA", "Arrival-IATA", "Airline-ID"]
+
+
+def write_itinerary_store(itinerary, path, chunksize=50000):
+    """Write itinerary rows to a SQLite file, replacing its table.
+
+    Departure-IATA, Arrival-IATA and Airline-ID are indexed, plus the
+    (Departure-IATA, Arrival-IATA) pair that direct lookups hit.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with sqlite3.connect(path) as connection:
+        itinerary.to_sql(TABLE, connection, if_exists="replace",
+                         index=False, chunksize=chunksize)
+        for column in INDEXED_COLUMNS:
+            connection.execute(
+                f'CREATE INDEX "idx_{column}" ON {TABLE} ("{column}")')
+        connection.execute(
+            f'CREATE INDEX "idx_Departure-Arrival" ON {TABLE} '
+            f'("Departure-IATA", "Arrival-IATA")')
+        connection.execute("ANALYZE")
+    logging.info(f"Itinerary store with {len(itinerary)} routes "
+                 f"written to {path}")
+
+
+def apply_store_delta(path, added=None, removed=None):
+    """Apply a route delta to an itinerary store in one transaction.
+
+    As in the delta log, every route with the Airline-ID, Departure-IATA
+    and Arrival-IATA of a `removed` row is deleted before the `added`
+    itinerary rows are inserted.
+    """
+    deleted = inserted = 0
+    with sqlite3.connect(path) as connection:
+        if removed is not None:
+            keys = removed.dropna(subset=DELTA_KEY)[DELTA_KEY]
+            conditions = " AND ".join(f'"{column}" = ?'
+                                      for column in DELTA_KEY)
+            for airline, dep, arr in keys.itertuples(index=False):
+                deleted += connection.execute(
+                    f"DELETE FROM {TABLE} WHERE {conditions}",
+                    (int(airline), dep, arr)).rowcount
+        if added is not None and len(added):
+            columns = [row[1] for row in connection.execute(
+                f"PRAGMA table_info({TABLE})")]
+            added.reindex(columns=columns).to_sql(
+                TABLE, connection, if_exists="append", index=False)
+            inserted = len(added)
+    logging.info(f"Itinerary store {path} patched: {deleted} routes "
+                 f"removed, {inserted} added")
+
+
+class ItineraryStore:
+    """Direct, 1-stop and 2-stop search as indexed joins in SQLite.
+
+    Every leg is an aggregate over the routes leaving or entering one
+    airport, so a search only reads the index ranges of the airports on
+    its paths and never the whole table. Results have the same columns
+    as RouteFinder's graph search.
+
+    Given `itinerary_path`, a store older than that itinerary or its
+    delta log is refused, as it would answer from outdated routes.
+    """
+    def __init__(self, path, airlines=None, exclude_codeshare=False,
+                 same_airline=False, equipment=None, itinerary_path=None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Itinerary store {path} not found")
+        if itinerary_path is not None:
+            newer = newer_sources(path, [itinerary_path,
+                                         delta_log_path(itinerary_path)])
+            if newer:
+                raise ValueError(f"Itinerary store {path} is older than "
+                                 f"{newer[0]}, rebuild it with "
+                                 f"merge --sqlite")
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.same_airline = same_airline
+
+        # Route constraints, shared by every leg of every query
+        conditions = ['"Airline-ID" IS NOT NULL']
+        self.params = {}
+        if airlines is not None:
+            names = [f":airline{i}" for i in range(len(airlines))]
+            conditions.append(f'"Airline-IATA" IN ({", ".join(names)})')
+            self.params.update(zip((n[1:] for n in names), airlines))
+        if exclude_codeshare:
+            conditions.append("COALESCE(\"Codeshare\", '') != 'Y'")
+        if equipment is not None:
+            names = [f":equipment{i}" for i in range(len(equipment))]
+            conditions.append("(" + " OR ".join(
+                f"' ' || COALESCE(\"Airplane-IATA\", '') || ' ' LIKE {name}"
+                for name in names) + ")")
+            self.params.update(zip((n[1:] for n in names),
+                                   (f"% {code} %" for code in equipment)))
+        self.where = " AND ".join(conditions)
+
+    def query(self, sql, **params):
+        return self.connection.execute(sql, {**self.params, **params})
+
+    def has_airport(self, code):
+        """Whether any route departs from or arrives at `code`."""
+        return self.connection.execute(
+            f'SELECT 1 FROM {TABLE} WHERE "Departure-IATA" = :code OR '
+            f'"Arrival-IATA" = :code LIMIT 1', {"code": code}
+        ).fetchone() is not None
+
+    def legs(self, by_airline=False):
+        """CTEs `first` (out of :start) and `last` (into :end), keyed by
+        the connecting airport, or `first_airline` and `last_airline`
+        keyed by airport and airline."""
+        airline = ', "Airline-ID" AS airline' if by_airline else ""
+        group = ", airline" if by_airline else ""
+        suffix = "_airline" if by_airline else ""
+        return (
+            f'first{suffix} AS (SELECT "Arrival-IATA" AS via{airline}, '
+            f'COUNT(*) AS n FROM {TABLE} WHERE "Departure-IATA" = :start '
+            f'AND {self.where} GROUP BY via{group}), '
+            f'last{suffix} AS (SELECT "Departure-IATA" AS via{airline}, '
+            f'COUNT(*) AS n FROM {TABLE} WHERE "Arrival-IATA" = :end '
+            f'AND {self.where} GROUP BY via{group})'
+        )
+
+    def find_paths(self, start, end):
+        """Airport paths start -> end with allowed routes per leg.
+
+        Returns dicts keyed by stops: the airports of every path, the
+        per-leg route counts and the airline combinations per path.
+        """
+        rows = {0: [], 1: [], 2: []}
+        if start != end:
+            direct = self.query(
+                f'SELECT COUNT(*) FROM {TABLE} WHERE "Departure-IATA" = '
+                f':start AND "Arrival-IATA" = :end AND {self.where}',
+                start=start, end=end).fetchone()[0]
+            if direct:
+                rows[0].append((start, end, direct, direct))
+            if self.same_airline:
+                rows[1], rows[2] = self._same_airline(start, end)
+            else:
+                rows[1], rows[2] = self._any_airline(start, end)
+
+        paths, leg_counts, combinations = {}, {}, {}
+        for stops, found in rows.items():
+            found.sort(key=lambda row: -row[-1])
+            paths[stops] = [row[:stops + 2] for row in found]
+            leg_counts[stops] = np.array(
+                [row[stops + 2:-1] for row in found],
+                dtype=np.int64).reshape(-1, stops + 1)
+            combinations[stops] = np.array([row[-1] for row in found],
+                                           dtype=np.int64)
+        return paths, leg_counts, combinations
+
+    def _any_airline(self, start, end):
+        params = {"start": start, "end": end}
+        one_stop = self.query(
+            f"WITH {self.legs()} "
+            f"SELECT :start, via, :end, first.n, last.n, first.n * last.n "
+            f"FROM first JOIN last USING (via) "
+            f"WHERE via NOT IN (:start, :end)", **params).fetchall()
+        two_stop = self.query(
+            f"WITH {self.legs()}, middle AS ("
+            f'SELECT "Departure-IATA" AS a, "Arrival-IATA" AS b, '
+            f"COUNT(*) AS n FROM {TABLE} "
+            f'WHERE "Departure-IATA" IN (SELECT via FROM first) '
+            f'AND "Arrival-IATA" IN (SELECT via FROM last) '
+            f"AND {self.where} GROUP BY a, b) "
+            f"SELECT :start, a, b, :end, first.n, middle.n, last.n, "
+            f"first.n * middle.n * last.n "
+            f"FROM middle JOIN first ON first.via = a "
+            f"JOIN last ON last.via = b "
+            f"WHERE a != b AND a NOT IN (:start, :end) "
+            f"AND b NOT IN (:start, :end)", **params).fetchall()
+        return one_stop, two_stop
+
+    def _same_airline(self, start, end):
+        """Legs report all allowed routes; combinations only count
+        connections that stay on one airline."""
+        params = {"start": start, "end": end}
+        by_airline = self.legs(by_airline=True)
+        one_stop = self.query(
+            f"WITH {self.legs()}, {by_airline} "
+            f"SELECT :start, f.via, :end, first.n, last.n, "
+            f"SUM(f.n * l.n) FROM first_airline f "
+            f"JOIN last_airline l ON l.via = f.via "
+            f"AND l.airline = f.airline "
+            f"JOIN first ON first.via = f.via "
+            f"JOIN last ON last.via = f.via "
+            f"WHERE f.via NOT IN (:start, :end) GROUP BY f.via",
+            **params).fetchall()
+        two_stop = self.query(
+            f"WITH {self.legs()}, {by_airline}, middle AS ("
+            f'SELECT "Departure-IATA" AS a, "Arrival-IATA" AS b, '
+            f'"Airline-ID" AS airline, COUNT(*) AS n FROM {TABLE} '
+            f'WHERE "Departure-IATA" IN (SELECT via FROM first) '
+            f'AND "Arrival-IATA" IN (SELECT via FROM last) '
+            f"AND {self.where} GROUP BY a, b, airline), "
+            f"pairs AS (SELECT a, b, SUM(n) AS n FROM middle GROUP BY a, b) "
+            f"SELECT :start, m.a, m.b, :end, first.n, pairs.n, last.n, "
+            f"SUM(f.n * m.n * l.n) FROM middle m "
+            f"JOIN first_airline f ON f.via = m.a AND f.airline = m.airline "
+            f"JOIN last_airline l ON l.via = m.b AND l.airline = m.airline "
+            f"JOIN pairs ON pairs.a = m.a AND pairs.b = m.b "
+            f"JOIN first ON first.via = m.a JOIN last ON last.via = m.b "
+            f"WHERE m.a != m.b AND m.a NOT IN (:start, :end) "
+            f"AND m.b NOT IN (:start, :end) GROUP BY m.a, m.b",
+            **params).fetchall()
+        return one_stop, two_stop
+
+    def path_columns(self, stops, paths, leg_counts, combinations):
+        """Path rows in the column layout of RouteFinder.path_columns."""
+        columns = {
+            "Stops": np.full(len(paths), stops),
+            "Path": np.arange(len(paths)),
+            "Route": np.array(["_to_".join(path) for path in paths],
+                              dtype=object)
+        }
+        for leg in range(stops + 1):
+            columns[f"Airlines_{leg + 1}"] = leg_counts[:, leg]
+        columns["Combinations"] = combinations
+        return columns
+
+    def iter_flights(self, airports, page_size=100000):
+        """Stream the airline combinations of one airport path in pages
+        of NumPy columns, as RouteFinder.flight_columns lays them out."""
+        legs = list(zip(airports[:-1], airports[1:]))
+        selects, joins, params = [], [], {}
+        for leg, (dep, arr) in enumerate(legs, start=1):
+            selects.append(f'l{leg}."Airline-IATA", l{leg}."Airline-Name"')
+            source = (f'(SELECT * FROM {TABLE} WHERE "Departure-IATA" = '
+                      f':dep{leg} AND "Arrival-IATA" = :arr{leg} '
+                      f'AND {self.where}) l{leg}')
+            if leg > 1 and self.same_airline:
+                source += f' ON l{leg}."Airline-ID" = l1."Airline-ID"'
+            joins.append(source)
+            params.update({f"dep{leg}": dep, f"arr{leg}": arr})
+        join = " JOIN " if self.same_airline else " CROSS JOIN "
+        cursor = self.query(
+            f"SELECT {', '.join(selects)} FROM {join.join(joins)}", **params)
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            values = np.array(rows, dtype=object).reshape(len(rows), -1)
+            page = {}
+            for leg, (dep, arr) in enumerate(legs, start=1):
+                page[f"Airline-IATA_{leg}"] = values[:, 2 * leg - 2]
+                page[f"Airline-Name_{leg}"] = values[:, 2 * leg - 1]
+                page[f"Route_{leg}"] = np.full(len(rows), f"{dep}_to_{arr}")
+            yield page
+
+    def close(self):
+        self.connection.close()
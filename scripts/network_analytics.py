@@ -0,0 +1,283 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from data_handler import DataHandler
+from route_graph import RouteGraph, csr_expand
+
+
+def pagerank(indptr, indices, weights, damping=0.85,
+             tol=1e-10, max_iter=100):
+    """Weighted PageRank by power iteration over CSR arrays.
+
+    Dangling airports (no outgoing routes) redistribute their rank
+    uniformly, so the result always sums to one.
+    """
+    n = len(indptr) - 1
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    out_weight = np.bincount(src, weights=weights, minlength=n)
+    dangling = out_weight == 0
+    inv_out = np.zeros(n)
+    inv_out[~dangling] = 1.0 / out_weight[~dangling]
+    edge_share = weights * inv_out[src]
+
+    rank = np.full(n, 1.0 / n)
+    for iteration in range(max_iter):
+        spread = np.bincount(indices, weights=rank[src] * edge_share,
+                             minlength=n)
+        new_rank = (damping * (spread + rank[dangling].sum() / n)
+                    + (1.0 - damping) / n)
+        error = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if error < tol:
+            break
+    logging.info(f"PageRank converged after {iteration + 1} iterations "
+                 f"(error {error:.2e})")
+    return rank
+
+
+def betweenness_from_sources(indptr, indices, sources):
+    """Unnormalized Brandes dependencies accumulated over `sources`.
+
+    Each BFS is level-synchronous: a whole frontier is expanded with one
+    CSR gather, and path counts and dependencies are propagated per level
+    with `np.bincount` instead of per-vertex loops.
+    """
+    n = len(indptr) - 1
+    centrality = np.zeros(n)
+    for source in sources:
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[source] = 0
+        sigma[source] = 1.0
+        frontier = np.array([source])
+        levels = []
+        depth = 0
+        while frontier.size:
+            positions, u = csr_expand(indptr, frontier)
+            v = indices[positions]
+            unseen = v[dist[v] < 0]
+            dist[unseen] = depth + 1
+            on_dag = dist[v] == depth + 1
+            u, v = u[on_dag], v[on_dag]
+            sigma += np.bincount(v, weights=sigma[u], minlength=n)
+            levels.append((u, v))
+            frontier = np.unique(unseen)
+            depth += 1
+
+        delta = np.zeros(n)
+        for u, v in reversed(levels):
+            delta += np.bincount(
+                u, weights=sigma[u] / sigma[v] * (1.0 + delta[v]),
+                minlength=n
+            )
+        delta[source] = 0.0
+        centrality += delta
+    return centrality
+
+
+_worker_graph = None
+
+
+def _init_betweenness_worker(indptr, indices):
+    global _worker_graph
+    _worker_graph = (indptr, indices)
+
+
+def _betweenness_chunk(sources):
+    indptr, indices = _worker_graph
+    return betweenness_from_sources(indptr, indices, sources)
+
+
+def approximate_betweenness(indptr, indices, samples=256, seed=0,
+                            processes=None):
+    """Betweenness estimated from a uniform sample of BFS sources.
+
+    The accumulated dependencies are scaled by n / samples. With
+    `processes` > 1 the sampled sources are split across a process pool.
+    """
+    n = len(indptr) - 1
+    samples = min(samples, n)
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(n, size=samples, replace=False)
+
+    if processes and processes > 1:
+        chunks = [c for c in np.array_split(sources, processes) if c.size]
+        with Pool(processes, initializer=_init_betweenness_worker,
+                  initargs=(indptr, indices)) as pool:
+            centrality = np.sum(pool.map(_betweenness_chunk, chunks),
+                                axis=0)
+    else:
+        centrality = betweenness_from_sources(indptr, indices, sources)
+    return centrality * (n / samples) if samples else centrality
+
+
+class NetworkAnalytics(DataHandler):
+    """Hub rankings and airline network share computed on the route graph.
+
+    PageRank and betweenness are cached in the graph snapshot keyed by
+    their parameters, so repeated runs on an unchanged graph reuse them.
+    """
+    def __init__(self, input_path="merged/route_graph.npz",
+                 output_dir="ready",
+                 itinerary_path="merged/itinerary.csv",
+                 damping=0.85,
+                 betweenness_samples=256,
+                 seed=0,
+                 processes=None):
+        super().__init__(
+            input_path=input_path,
+            output_path=os.path.join(output_dir, "airport_centrality.csv")
+        )
+        self.snapshot_path = input_path
+        self.output_dir = os.path.join(self.data_dir, output_dir)
+        self.itinerary_path = itinerary_path
+        self.damping = damping
+        self.betweenness_samples = betweenness_samples
+        self.seed = seed
+        self.processes = processes
+        self.graph = None
+        self.cache_updated = False
+        self.airline_degree = None
+        self.airline_share = None
+
+    def load_data(self):
+        self.graph = RouteGraph.load_or_build(self.snapshot_path,
+                                              self.itinerary_path)
+
+    def receive(self, outputs):
+        """Rank a route graph built upstream in the same process."""
+        self.graph = outputs.get("route_graph")
+        return self.graph is not None
+
+    def cached(self, key, compute):
+        """Return a cached graph result, computing and storing on a miss."""
+        if key in self.graph.cache:
+            logging.info(f"Using cached {key} from graph snapshot")
+            return self.graph.cache[key]
+        value = compute()
+        self.graph.cache[key] = value
+        self.cache_updated = True
+        return value
+
+    def process_data(self):
+        graph = self.graph
+        if graph is None or graph.indptr is None:
+            logging.warning("No route graph loaded!")
+            return
+        n = graph.n_airports
+        edge_src = graph.edge_src
+        multiplicity = graph.edge_multiplicity.astype(np.float64)
+
+        rank = self.cached(
+            f"pagerank_{self.damping}",
+            lambda: pagerank(graph.indptr, graph.indices, multiplicity,
+                             damping=self.damping)
+        )
+        betweenness = self.cached(
+            f"betweenness_{self.betweenness_samples}_{self.seed}",
+            lambda: approximate_betweenness(
+                graph.indptr, graph.indices,
+                samples=self.betweenness_samples,
+                seed=self.seed,
+                processes=self.processes)
+        )
+
+        self.df = pd.DataFrame({
+            "Airport-IATA": graph.airports,
+            "Out-Degree": np.diff(graph.indptr),
+            "In-Degree": np.diff(graph.rev_indptr),
+            "Out-Routes": np.bincount(edge_src, weights=multiplicity,
+                                      minlength=n).astype(np.int64),
+            "In-Routes": np.bincount(graph.indices, weights=multiplicity,
+                                     minlength=n).astype(np.int64),
+            "PageRank": rank,
+            "Betweenness": betweenness
+        }).sort_values("PageRank", ascending=False, ignore_index=True)
+
+        self.airline_degree = self.weighted_airline_degree()
+        self.airline_share = self.network_share()
+        logging.info(
+            "Top hubs by PageRank: %s",
+            ", ".join(self.df["Airport-IATA"].head(10))
+        )
+
+    def weighted_airline_degree(self):
+        """Routes per (airport, airline) in both directions."""
+        graph = self.graph
+        n_airlines = len(graph.airline_ids)
+        frames = []
+        for column, airports in (("Out-Routes", graph.route_src),
+                                 ("In-Routes", graph.route_dst)):
+            keys = airports.astype(np.int64) * n_airlines + graph.route_airline
+            keys, counts = np.unique(keys, return_counts=True)
+            frames.append(pd.DataFrame({
+                "airport": keys // n_airlines,
+                "airline": keys % n_airlines,
+                column: counts
+            }))
+        degree = frames[0].merge(frames[1], on=["airport", "airline"],
+                                 how="outer").fillna(0)
+        return pd.DataFrame({
+            "Airport-IATA": graph.airports[degree["airport"]],
+            "Airline-IATA": graph.airline_iata[degree["airline"]],
+            "Airline-Name": graph.airline_names[degree["airline"]],
+            "Out-Routes": degree["Out-Routes"].astype(np.int64),
+            "In-Routes": degree["In-Routes"].astype(np.int64)
+        })
+
+    def network_share(self):
+        """Share of all routes, airport pairs and airports per airline."""
+        graph = self.graph
+        n_airlines = len(graph.airline_ids)
+        routes = np.bincount(graph.route_airline, minlength=n_airlines)
+
+        # Airports served: distinct (airline, airport) over both endpoints
+        served = np.unique(np.concatenate([
+            graph.route_airline.astype(np.int64) * graph.n_airports
+            + endpoint for endpoint in (graph.route_src, graph.route_dst)
+        ]))
+        airports = np.bincount(served // graph.n_airports,
+                               minlength=n_airlines)
+
+        pairs = np.unique(graph.route_airline.astype(np.int64)
+                          * graph.n_edges + graph.route_edge)
+        airport_pairs = np.bincount(pairs // graph.n_edges,
+                                    minlength=n_airlines)
+
+        share = pd.DataFrame({
+            "Airline-IATA": graph.airline_iata,
+            "Airline-Name": graph.airline_names,
+            "Routes": routes,
+            "Route-Share": routes / max(graph.n_routes, 1),
+            "Airport-Pairs": airport_pairs,
+            "Pair-Share": airport_pairs / max(graph.n_edges, 1),
+            "Airports-Served": airports
+        })
+        return share.sort_values("Routes", ascending=False,
+                                 ignore_index=True)
+
+    def save_data(self):
+        """Save the rankings and refresh the snapshot cache if it grew."""
+        if self.df is None:
+            logging.warning("No data to save!")
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        outputs = {
+            "airport_centrality.csv": self.df,
+            "airline_degree.csv": self.airline_degree,
+            "airline_share.csv": self.airline_share
+        }
+        for filename, frame in outputs.items():
+            path = os.path.join(self.output_dir, filename)
+            frame.to_csv(path, index=False)
+            logging.info(f"Saved {len(frame)} rows to {path}")
+        if self.cache_updated:
+            self.graph.save_snapshot(self.graph.output_path)
+            self.cache_updated = False
+
+
+if __name__ == "__main__":
+    analytics = NetworkAnalytics()
+    analytics.execute()
@@ -0,0 +1,294 @@
+import logging
+import os
+import numpy as np
+from data_handler import DataHandler, read_csv_files
+from route_graph import csr_gather, fold_name, mmap_npz, save_npz
+
+
+def trigrams(texts):
+    """Distinct character trigrams of folded texts as integer codes.
+
+    Each text is padded as "  text " so that prefixes and whole words
+    get grams of their own. Returns the codes and the index of the text
+    each code belongs to, sorted by text.
+    """
+    padded = [f"  {text} " for text in texts]
+    lengths = np.array([len(text) for text in padded], dtype=np.int64)
+    buffer = np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8)
+    counts = lengths - 2
+    starts = np.cumsum(lengths) - lengths
+    offsets = np.cumsum(counts) - counts
+    text = np.repeat(np.arange(len(padded)), counts)
+    position = (np.repeat(starts - offsets, counts)
+                + np.arange(int(counts.sum()), dtype=np.int64))
+    codes = ((buffer[position].astype(np.int64) << 14)
+             | (buffer[position + 1].astype(np.int64) << 7)
+             | buffer[position + 2])
+    pairs = np.unique((text << 21) | codes)
+    return pairs & ((1 << 21) - 1), pairs >> 21
+
+
+def query_trigrams(text):
+    """`trigrams` of a single folded text, without the array set-up."""
+    padded = f"  {text} "
+    return np.array(sorted({
+        (ord(a) << 14) | (ord(b) << 7) | ord(c)
+        for a, b, c in zip(padded, padded[1:], padded[2:])
+    }), dtype=np.int64)
+
+
+class PlaceIndex(DataHandler):
+    """Trigram inverted index for type-ahead airport and airline lookup.
+
+    Airport names, cities, countries and codes and airline names,
+    aliases, callsigns and codes are folded like RouteGraph.resolve_place
+    folds place names and split into trigrams. Postings are kept in CSR
+    form (trigram -> terms), so a lookup is a few binary searches and a
+    gather over the postings of the query's trigrams. Terms are scored by
+    their Dice coefficient with the query, weighted by field, and every
+    place keeps its best term. The index is one .npz file that can be
+    memory-mapped like the route graph snapshot.
+    """
+    # Relative weight of a match per field
+    airport_fields = {
+        "Airport-IATA": 1.0,
+        "Airport-Name": 1.0,
+        "Airport-City": 0.9,
+        "Airport-ICAO": 0.9,
+        "Airport-Country": 0.6
+    }
+    airline_fields = {
+        "Airline-IATA": 1.0,
+        "Airline-Name": 1.0,
+        "Airline-ICAO": 0.9,
+        "Airline-Alias": 0.8,
+        "Airline-Callsign": 0.7
+    }
+    array_names = [
+        "place_kind",
+        "place_code",
+        "place_name",
+        "place_detail",
+        "term_place",
+        "term_weight",
+        "term_grams",
+        "grams",
+        "gram_indptr",
+        "gram_terms"
+    ]
+
+    def __init__(self, airports_path="processed/clean_airports.csv",
+                 airlines_path="processed/clean_airlines.csv",
+                 output_path="merged/place_index.npz"):
+        super().__init__(airports_path, output_path)
+        self.airlines_path = self.resolve_path(airlines_path)
+        self.airports = None
+        self.airlines = None
+        for name in self.array_names:
+            setattr(self, name, None)
+
+    @classmethod
+    def load_or_build(cls, index_path="merged/place_index.npz", mmap=False):
+        """Load the index, rebuilding it if missing or older than the
+        clean airport and airline tables."""
+        index = cls(output_path=index_path)
+        sources = [path for path in (index.input_path, index.airlines_path)
+                   if os.path.exists(path)]
+        if os.path.exists(index.output_path) and all(
+                os.path.getmtime(path) <= os.path.getmtime(index.output_path)
+                for path in sources):
+            index.load_index(index.output_path, mmap=mmap)
+            return index
+        logging.info(f"Building place index {index.output_path}")
+        index.execute()
+        if mmap and index.grams is not None:
+            index.load_index(index.output_path, mmap=True)
+        return index
+
+    def load_data(self):
+        """Load the searchable columns of the clean airport and airline
+        tables."""
+        frames = read_csv_files({
+            "airports": (self.input_path,
+                         ["Airport-ID"] + list(self.airport_fields)),
+            "airlines": (self.airlines_path,
+                         ["Airline-ID", "Airline-Country"]
+                         + list(self.airline_fields))
+        })
+        self.airports = frames.get("airports")
+        self.airlines = frames.get("airlines")
+
+    def receive(self, outputs):
+        """Index the clean tables of the same pipeline run."""
+        if "df_clean_airports" not in outputs:
+            return False
+        self.airports = outputs["df_clean_airports"]
+        self.airlines = outputs.get("df_clean_airlines")
+        return "df_clean_airlines" in outputs
+
+    def process_data(self):
+        """Build the inverted index from the loaded tables."""
+        if self.airports is None and self.airlines is None:
+            logging.warning("No airports or airlines to index!")
+            return
+        self.build(self.airports, self.airlines)
+
+    def save_data(self):
+        """Save the index arrays to one uncompressed .npz file."""
+        if self.grams is None:
+            logging.warning("No index to save!")
+            return
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+        save_npz(self.output_path,
+                 {name: getattr(self, name) for name in self.array_names})
+        logging.info(f"Place index saved to {self.output_path}")
+
+    def load_index(self, path, mmap=False):
+        if mmap:
+            arrays = mmap_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as index:
+                arrays = {key: index[key] for key in index.files}
+        for name in self.array_names:
+            setattr(self, name, arrays[name])
+        logging.info(f"Place index loaded from {path}: "
+                     f"{len(self.place_code)} places, "
+                     f"{len(self.grams)} trigrams")
+
+    def build(self, airports=None, airlines=None):
+        """Fold every searchable field into terms and index their
+        trigrams."""
+        import pandas as pd
+        places, terms = [], []
+        tables = (("airport", airports, self.airport_fields,
+                   "Airport-IATA", "Airport-ICAO", "Airport-Name",
+                   ["Airport-City", "Airport-Country"]),
+                  ("airline", airlines, self.airline_fields,
+                   "Airline-IATA", "Airline-ICAO", "Airline-Name",
+                   ["Airline-Country"]))
+        for kind, table, fields, iata, icao, name, detail in tables:
+            if table is None or not len(table):
+                continue
+            table = table.reset_index(drop=True)
+            first = sum(len(frame) for frame in places)
+            detail = table[detail].astype("string").fillna("")
+            places.append(pd.DataFrame({
+                "place_kind": kind,
+                "place_code": table[iata].fillna(table[icao]).fillna(""),
+                "place_name": table[name].fillna(""),
+                "place_detail": detail.agg(", ".join, axis=1)
+                .str.strip(", ")
+            }))
+            for field, weight in fields.items():
+                values = table[field].dropna().astype(str).map(fold_name)
+                # Words of longer names as terms of their own, so that
+                # "hercilio" finds "Hercilio Luz International Airport"
+                words = values.str.split().explode()
+                words = words[words.str.len() >= 3]
+                for found, scale in ((values, 1.0), (words, 0.9)):
+                    terms.append(pd.DataFrame({
+                        "term": found.to_numpy(dtype=str),
+                        "term_place": found.index.to_numpy() + first,
+                        "term_weight": weight * scale
+                    }))
+        if not places:
+            logging.warning("No airports or airlines to index!")
+            return
+        places = pd.concat(places, ignore_index=True)
+        terms = pd.concat(terms, ignore_index=True)
+        # One term per place and text, with the best weight it has
+        terms = terms[terms["term"] != ""].sort_values(
+            "term_weight", ascending=False
+        ).drop_duplicates(["term_place", "term"]).sort_values(
+            ["term_place", "term"], ignore_index=True)
+
+        for column in places.columns:
+            setattr(self, column, places[column].to_numpy(dtype=str))
+        self.term_place = terms["term_place"].to_numpy(dtype=np.int64)
+        self.term_weight = terms["term_weight"].to_numpy(dtype=np.float32)
+
+        codes, term = trigrams(terms["term"].tolist())
+        self.term_grams = np.bincount(term, minlength=len(terms))
+        order = np.argsort(codes, kind="stable")
+        self.grams, counts = np.unique(codes[order], return_counts=True)
+        self.gram_indptr = np.concatenate(([0], np.cumsum(counts)))
+        self.gram_terms = term[order]
+        logging.info(f"Indexed {len(terms)} terms of {len(places)} places "
+                     f"with {len(self.grams)} trigrams")
+
+    def lookup(self, text, limit=10, kind=None, min_score=0.3):
+        """Best matching places for free text, best first.
+
+        `kind` restricts matches to "airport" or "airline". Returns
+        (place ids, scores); scores are the field-weighted Dice
+        similarity of the query and the place's best matching term, plus
+        a tenth of its second best as a tie-break, so that matching both
+        the city and the name outranks matching the city alone.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = fold_name(text)
+        if not query or self.grams is None or not len(self.grams):
+            return empty
+        codes = query_trigrams(query)
+        found = np.minimum(np.searchsorted(self.grams, codes),
+                           len(self.grams) - 1)
+        found = found[self.grams[found] == codes]
+        positions, _ = csr_gather(self.gram_indptr, found)
+        if not len(positions):
+            return empty
+        # Trigrams shared with the query, per term
+        if len(positions) * 8 < len(self.term_place):
+            terms, shared = np.unique(self.gram_terms[positions],
+                                      return_counts=True)
+        else:
+            shared = np.bincount(self.gram_terms[positions],
+                                 minlength=len(self.term_place))
+            terms = np.flatnonzero(shared)
+            shared = shared[terms]
+        scores = (2 * shared / (len(codes) + self.term_grams[terms])
+                  * self.term_weight[terms])
+        places = self.term_place[terms]
+        keep = scores >= min_score
+        if kind is not None:
+            keep &= self.place_kind[places] == kind
+        places, scores = places[keep], scores[keep]
+        # The tie-break adds at most a tenth of a place's best term, so
+        # places whose best term is under the `limit`-th best over 1.1
+        # cannot rank; the others are scored with all of their terms
+        best = np.zeros(len(self.place_code))
+        np.maximum.at(best, places, scores)
+        ranked = best[best > 0]
+        if len(ranked) > limit:
+            cutoff = np.partition(ranked, len(ranked) - limit)[
+                len(ranked) - limit]
+            keep = best[places] * 1.1 >= cutoff
+            places, scores = places[keep], scores[keep]
+        order = np.lexsort((-scores, places))
+        places, scores = places[order], scores[order]
+        first = np.ones(len(places), dtype=bool)
+        first[1:] = places[1:] != places[:-1]
+        second = np.flatnonzero(~first & np.roll(first, 1))
+        scores[second - 1] += 0.1 * scores[second]
+        places, scores = places[first], scores[first]
+        # Ties go to the lower place id, whatever the limit
+        order = np.lexsort((places, -scores))[:limit]
+        return places[order], scores[order].astype(np.float32)
+
+    def records(self, text, limit=10, kind=None):
+        """`lookup` results as row dicts for the query front-end."""
+        places, scores = self.lookup(text, limit, kind)
+        return [
+            {"Kind": place_kind, "Code": code, "Name": name,
+             "Detail": detail, "Score": round(float(score), 3)}
+            for place_kind, code, name, detail, score in zip(
+                self.place_kind[places].tolist(),
+                self.place_code[places].tolist(),
+                self.place_name[places].tolist(),
+                self.place_detail[places].tolist(),
+                scores.tolist())
+        ]
+
+
+if __name__ == "__main__":
+    index = PlaceIndex()
+    index.execute()
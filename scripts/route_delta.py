@@ -0,0 +1,181 @@
+import logging
+import os
+import pandas as pd
+from data_cleaner import RoutesDataProcessor
+from data_handler import DataHandler, read_csv_files
+from data_merger import FlightItineraryCrafter
+from route_graph import (DELTA_KEY, RouteGraph, delta_log_path,
+                         newer_sources)
+
+
+def _route_keys(frame):
+    keys = frame[DELTA_KEY].copy()
+    keys["Airline-ID"] = pd.to_numeric(
+        keys["Airline-ID"], errors="coerce").astype(pd.Int64Dtype())
+    return pd.MultiIndex.from_frame(keys.astype(object))
+
+
+def apply_log(itinerary, log):
+    """Replay a delta log on itinerary rows, batch by batch.
+
+    Within a batch removals are applied before additions, so a route can
+    be replaced by removing and re-adding it in one delta.
+    """
+    for _, batch in log.groupby("Batch", sort=True):
+        removed = batch[batch["Op"] == "remove"]
+        if len(removed):
+            itinerary = itinerary[
+                ~_route_keys(itinerary).isin(_route_keys(removed))]
+        added = batch[batch["Op"] == "add"]
+        if len(added):
+            itinerary = pd.concat(
+                [itinerary, added.reindex(columns=itinerary.columns)],
+                ignore_index=True)
+    return itinerary.reset_index(drop=True)
+
+
+class RouteDeltaIngestor(DataHandler):
+    """Apply added and removed raw route rows without a full rebuild.
+
+    Only the delta rows are cleaned and enriched. They are appended to
+    the itinerary log and patched into the route graph snapshot and, if
+    it is up to date, the itinerary store; the log is folded into the
+    itinerary once it grows past `compact_ratio` of the routes.
+    """
+    def __init__(self, added_path="raw/routes_added.csv",
+                 removed_path="raw/routes_removed.csv",
+                 itinerary_path="merged/itinerary.csv",
+                 snapshot_path="merged/route_graph.npz",
+                 database_path="merged/itinerary.sqlite",
+                 directory="processed",
+                 compact_ratio=0.1):
+        super().__init__(input_path=added_path, output_path=itinerary_path)
+        self.removed_path = self.resolve_path(removed_path)
+        self.log_path = delta_log_path(self.output_path)
+        self.itinerary_path = itinerary_path
+        self.snapshot_path = snapshot_path
+        self.database_path = self.resolve_path(database_path)
+        self.crafter = FlightItineraryCrafter(directory=directory)
+        self.compact_ratio = compact_ratio
+        self.added = None
+        self.removed = None
+        self.graph = None
+
+    def read_routes(self, path, keys_only=False):
+        """Clean raw route rows as RoutesDataProcessor does, adding the
+        rejected ones to its quarantine.
+
+        Removed rows only need their route key, so with `keys_only` rows
+        are kept whenever Airline-ID, Departure-IATA and Arrival-IATA are.
+        """
+        if not os.path.exists(path) or not os.path.getsize(path):
+            logging.info(f"No route delta at {path}")
+            return None
+        processor = RoutesDataProcessor(input_path=path)
+        processor.append_quarantine = True
+        processor.load_data()
+        if keys_only:
+            processor.df.columns = processor.column_names
+            processor.df.replace("", pd.NA, inplace=True)
+            processor.df.replace("\\N", pd.NA, inplace=True)
+            processor.ensure_dtypes()
+            processor.df.dropna(subset=DELTA_KEY, inplace=True)
+        else:
+            processor.process_data()
+        logging.info(f"Loaded {len(processor.df)} route rows from {path}")
+        return processor.df
+
+    def load_data(self):
+        """Clean the delta rows and load the lookup tables they join."""
+        columns = dict(self.crafter.required_dfs)
+        del columns["df_clean_routes"]
+        # Coordinates for airports the delta adds to the graph
+        columns["df_clean_airports"] = columns["df_clean_airports"] + [
+            "Airport-IATA", "Airport-Latitude", "Airport-Longitude"]
+        files = self.crafter.input_files(columns)
+        missing = sorted(path for path, _ in files.values()
+                         if not os.path.exists(path))
+        if missing:
+            raise FileNotFoundError(
+                f"Route deltas need the clean lookup tables, missing: "
+                f"{', '.join(missing)}. Run `airplanes.py clean` or "
+                f"`airplanes.py run` with them persisted first.")
+        self.crafter.dataframes.update(read_csv_files(files))
+        self.added = self.read_routes(self.input_path)
+        self.removed = self.read_routes(self.removed_path, keys_only=True)
+
+    def process_data(self):
+        """Enrich the added rows and patch the route graph."""
+        if self.added is None and self.removed is None:
+            logging.warning("No route delta to apply!")
+            return
+        routes = self.added if self.added is not None else self.removed[:0]
+        self.df = self.crafter.enrich(routes)
+        self.graph = RouteGraph.load_or_build(self.snapshot_path,
+                                              self.itinerary_path)
+        self.graph.apply_delta(
+            self.df, self.removed,
+            airport_table=self.crafter.dataframes["df_clean_airports"])
+
+    def save_data(self):
+        """Append the delta to the log, save the graph, patch the store
+        and compact if due."""
+        if self.df is None:
+            logging.warning("No data to save!")
+            return
+        store_current = self.store_current()
+        batch = 0
+        if os.path.exists(self.log_path):
+            batch = pd.read_csv(self.log_path, usecols=["Batch"])[
+                "Batch"].max() + 1
+        frames = [self.df.assign(Op="add")]
+        if self.removed is not None:
+            frames.insert(0, self.removed.reindex(
+                columns=self.df.columns).assign(Op="remove"))
+        log = pd.concat(frames, ignore_index=True)
+        log.insert(0, "Batch", batch)
+        log.to_csv(self.log_path, mode="a", index=False,
+                   header=not os.path.exists(self.log_path))
+        logging.info(f"Appended {len(log)} delta rows to {self.log_path}")
+        self.graph.save_snapshot(self.graph.output_path)
+        if store_current:
+            from itinerary_store import apply_store_delta
+            apply_store_delta(self.database_path, self.df, self.removed)
+        elif os.path.exists(self.database_path):
+            logging.warning(f"Itinerary store {self.database_path} is out "
+                            f"of date and was not patched")
+
+        with open(self.log_path) as handle:
+            logged = sum(1 for _ in handle) - 1
+        if logged > self.compact_ratio * self.graph.n_routes:
+            self.compact()
+
+    def store_current(self):
+        """Whether the itinerary store holds the itinerary and log."""
+        return os.path.exists(self.database_path) and not newer_sources(
+            self.database_path, [self.output_path, self.log_path])
+
+    def compact(self):
+        """Fold the delta log into the itinerary file and clear it."""
+        if not os.path.exists(self.log_path):
+            return
+        snapshot = self.resolve_path(self.snapshot_path)
+        current = [path for path in (snapshot, self.database_path)
+                   if os.path.exists(path) and not newer_sources(
+                       path, [self.output_path, self.log_path])]
+        itinerary = apply_log(pd.read_csv(self.output_path),
+                              pd.read_csv(self.log_path))
+        temporary = f"{self.output_path}.tmp"
+        itinerary.to_csv(temporary, index=False)
+        os.replace(temporary, self.output_path)
+        os.remove(self.log_path)
+        # A current snapshot and store already hold the compacted routes
+        for path in current:
+            os.utime(path)
+        logging.info(f"Compacted delta log into {self.output_path} "
+                     f"({len(itinerary)} routes)")
+
+
+if __name__ == "__main__":
+    ingestor = RouteDeltaIngestor()
+    ingestor.execute()
@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from data_handler import DataHandler
+from route_graph import RouteGraph
+from route_pool import RouteQueryPool, worker_finder
+
+
+def partition_path(output_dir, origin):
+    return os.path.join(output_dir, f"origin={origin}", "part-0.parquet")
+
+
+def _export_origin(task):
+    """Write the route table of one origin to its Parquet partition.
+
+    The partition is written to a temporary file and renamed into place,
+    so a partition that exists is always complete.
+    """
+    origin, destinations, output_dir, filters = task
+    finder = worker_finder(filters)
+    graph = finder.graph
+
+    # Collect raw path arrays for all destinations, then build one table
+    found = {stops: ([], [], [], []) for stops in range(3)}
+    for destination in destinations:
+        paths, leg_counts, combinations = finder.find_paths(origin,
+                                                            destination)
+        for stops, (legs, counts, totals, targets) in found.items():
+            if len(paths[stops]):
+                legs.append(paths[stops])
+                counts.append(leg_counts[stops])
+                totals.append(combinations[stops])
+                targets.append(np.full(len(paths[stops]), destination))
+
+    tables = []
+    for stops, (legs, counts, totals, targets) in found.items():
+        if not legs:
+            legs = counts = [np.empty((0, stops + 1), dtype=np.int64)]
+            totals = targets = [np.empty(0, dtype=np.int64)]
+        table = finder.path_table(stops, np.concatenate(legs),
+                                  np.concatenate(counts),
+                                  np.concatenate(totals))
+        table.insert(0, "Destination",
+                     graph.airports[np.concatenate(targets)])
+        tables.append(table)
+    # Path numbers only index a single search, so they are not exported
+    table = pd.concat(tables, ignore_index=True).drop(columns="Path")
+
+    code = str(graph.airports[origin])
+    path = partition_path(output_dir, code)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    table.to_parquet(temporary, index=False)
+    os.replace(temporary, path)
+    return code, len(table), int(table["Combinations"].sum())
+
+
+class RouteTableExporter(DataHandler):
+    """All-pairs 0/1/2-stop route tables for sets of countries or airports.
+
+    Work is partitioned by origin airport across a RouteQueryPool and each
+    origin is streamed to its own `origin=<IATA>` Parquet partition. Runs
+    are resumable: origins whose partition already exists are skipped.
+    """
+    def __init__(self, countries=None,
+                 airports=None,
+                 output_dir="ready/route_tables",
+                 snapshot_path="merged/route_graph.npz",
+                 itinerary_path="merged/itinerary.csv",
+                 processes=None,
+                 **filters):
+        super().__init__(input_path=snapshot_path, output_path=output_dir)
+        self.countries = countries
+        self.airports = airports
+        self.snapshot_path = snapshot_path
+        self.itinerary_path = itinerary_path
+        self.processes = processes
+        self.filters = filters
+        self.graph = None
+        self.selected = None
+        self.exported = []
+
+    def load_data(self):
+        """Map the graph snapshot and resolve the airport set."""
+        self.graph = RouteGraph.load_or_build(self.snapshot_path,
+                                              self.itinerary_path,
+                                              mmap=True)
+        selected = self.graph.airports_in(countries=self.countries)
+        if self.airports is not None:
+            codes = [self.graph.airport_id(code) for code in self.airports]
+            selected = np.union1d(selected,
+                                  [code for code in codes if code >= 0])
+        self.selected = selected.astype(np.int64)
+        logging.info(f"Selected {len(self.selected)} airports "
+                     f"({len(self.selected) ** 2} ordered pairs)")
+
+    def process_data(self):
+        """Export every pending origin, logging progress as they finish."""
+        if self.selected is None or not len(self.selected):
+            logging.warning("No airports selected for export!")
+            return
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logging.error("Parquet export requires pyarrow")
+            return
+
+        pending = [
+            origin for origin in self.selected
+            if not os.path.exists(partition_path(
+                self.output_path, self.graph.airports[origin]))
+        ]
+        done = len(self.selected) - len(pending)
+        if done:
+            logging.info(f"Resuming: {done} origins already exported")
+
+        total = len(self.selected)
+        tasks = ((origin, self.selected, self.output_path, self.filters)
+                 for origin in pending)
+        started = time.perf_counter()
+        with RouteQueryPool(self.snapshot_path, self.processes) as pool:
+            for index, (code, rows, combinations) in enumerate(
+                    pool.imap_unordered(_export_origin, tasks), start=1):
+                self.exported.append((code, rows, combinations))
+                elapsed = time.perf_counter() - started
+                remaining = elapsed / index * (len(pending) - index)
+                logging.info(
+                    f"[{done + index}/{total}] {code}: {rows} paths, "
+                    f"{combinations} airline combinations "
+                    f"(ETA {remaining:.0f}s)"
+                )
+
+    def save_data(self):
+        """Partitions are written by the workers; log the summary only."""
+        rows = sum(rows for _, rows, _ in self.exported)
+        logging.info(f"Exported {len(self.exported)} origins, {rows} paths "
+                     f"to {self.output_path}")
+
+
+if __name__ == "__main__":
+    exporter = RouteTableExporter(
+        countries=["ARG", "BOL", "BRA", "CHL", "COL", "ECU",
+                   "GUY", "PRY", "PER", "SUR", "URY", "VEN"]
+    )
+    exporter.execute()
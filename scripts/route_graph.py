@@ -0,0 +1,704 @@
+import logging
+import os
+import struct
+import unicodedata
+import zipfile
+import numpy as np
+from data_handler import DataHandler
+
+# Columns that identify a route when it is removed by a delta
+DELTA_KEY = ["Airline-ID", "Departure-IATA", "Arrival-IATA"]
+EARTH_RADIUS_KM = 6371.0088
+
+
+class RouteGraph(DataHandler):
+    """Airport-level route graph in compressed sparse row (CSR) form.
+
+    Airports are integer-coded in sorted IATA order. Every itinerary row
+    is kept as a route, and routes are sorted by airport pair so the
+    routes flying one edge form a contiguous slice of the route arrays.
+    The graph is persisted as a single .npz snapshot that also carries
+    cached analytics results.
+    """
+    itinerary_columns = [
+        "Airline-ID",
+        "Airline-IATA",
+        "Airline-Name",
+        "Departure-IATA",
+        "Arrival-IATA",
+        "Codeshare",
+        "Airplane-IATA",
+        "Airport-City_departure",
+        "Airport-Country_departure",
+        "Country-ISO-3_departure",
+        "Airport-City_arrival",
+        "Airport-Country_arrival",
+        "Country-ISO-3_arrival"
+    ]
+    array_names = [
+        "airports",
+        "airport_lat",
+        "airport_lon",
+        "airport_city",
+        "airport_country",
+        "airport_country_iso3",
+        "airline_ids",
+        "airline_iata",
+        "airline_names",
+        "route_src",
+        "route_dst",
+        "route_airline",
+        "route_codeshare",
+        "equipment",
+        "route_equipment_ptr",
+        "route_equipment",
+        "indptr",
+        "indices",
+        "edge_route_ptr",
+        "rev_indptr",
+        "rev_indices",
+        "rev_edge",
+        "src_airline_keys",
+        "src_airline_ptr",
+        "src_airline_routes"
+    ]
+
+    def __init__(self, input_path="merged/itinerary.csv",
+                 output_path="merged/route_graph.npz",
+                 airports_path="processed/clean_airports.csv"):
+        super().__init__(input_path, output_path)
+        self.airports_path = self.resolve_path(airports_path)
+        self.airport_table = None
+        for name in self.array_names:
+            setattr(self, name, None)
+        self.cache = {}
+        self._airport_index = None
+        self._airline_index = None
+
+    @classmethod
+    def load_or_build(cls, snapshot_path="merged/route_graph.npz",
+                      itinerary_path="merged/itinerary.csv", mmap=False):
+        """Load the graph snapshot, building and saving it if missing or
+        older than the itinerary or its delta log.
+
+        With `mmap` the snapshot arrays are read-only memory maps, shared
+        through the page cache by every process that opens the snapshot.
+        """
+        graph = cls(input_path=snapshot_path, output_path=snapshot_path)
+        itinerary = graph.resolve_path(itinerary_path)
+        newer = newer_sources(graph.input_path,
+                              [itinerary, delta_log_path(itinerary)])
+        if newer:
+            logging.info(f"Graph snapshot {graph.input_path} is older "
+                         f"than {newer[0]}")
+        elif os.path.exists(graph.input_path):
+            try:
+                graph.load_snapshot(graph.input_path, mmap=mmap)
+                return graph
+            except ValueError as e:
+                logging.warning(f"{e}, rebuilding")
+        else:
+            logging.info(f"No graph snapshot at {graph.input_path}")
+        logging.info(f"Building route graph from {itinerary_path}")
+        graph.input_path = graph.resolve_path(itinerary_path)
+        graph.execute()
+        if mmap:
+            graph.load_snapshot(graph.output_path, mmap=True)
+        return graph
+
+    def load_data(self):
+        """Load a .npz snapshot, or the itinerary columns for a build."""
+        if not os.path.exists(self.input_path):
+            logging.error(f"Input file {self.input_path} not found!")
+            self.df = None
+            return
+        if self.input_path.endswith(".npz"):
+            self.load_snapshot(self.input_path)
+            self.df = None
+        else:
+            import pandas as pd
+            self.df = self.replay_delta_log(
+                pd.read_csv(self.input_path, usecols=self.itinerary_columns))
+            logging.info(f"Loaded {len(self.df)} routes "
+                         f"from {self.input_path}")
+            if os.path.exists(self.airports_path):
+                self.airport_table = pd.read_csv(
+                    self.airports_path,
+                    usecols=["Airport-IATA",
+                             "Airport-Latitude",
+                             "Airport-Longitude"]
+                )
+            else:
+                logging.warning(f"Airports file {self.airports_path} not "
+                                f"found, coordinates will be missing")
+
+    def replay_delta_log(self, itinerary):
+        """Apply routes ingested since the last compaction, if any."""
+        from route_delta import apply_log
+        log_path = delta_log_path(self.input_path)
+        if not os.path.exists(log_path):
+            return itinerary
+        import pandas as pd
+        return apply_log(itinerary, pd.read_csv(log_path))
+
+    def receive(self, outputs):
+        """Build from an itinerary merged upstream in the same process."""
+        if "df_itinerary" not in outputs:
+            return False
+        self.df = self.replay_delta_log(
+            outputs["df_itinerary"][self.itinerary_columns])
+        self.airport_table = outputs.get("df_clean_airports")
+        return True
+
+    def outputs(self):
+        return {"route_graph": self} if self.indptr is not None else {}
+
+    def process_data(self):
+        """Build the CSR arrays from the loaded itinerary rows."""
+        if self.df is None:
+            return
+        self.build(self.df, self.airport_table)
+        self.df = None
+
+    def save_data(self):
+        """Save the graph arrays and analytics cache as a snapshot."""
+        if self.indptr is None:
+            logging.warning("No graph to save!")
+            return
+        self.save_snapshot(self.output_path)
+
+    def build(self, itinerary, airport_table=None):
+        """Integer-code airports and airlines and group routes by edge.
+
+        Coordinates are taken from `airport_table` (clean airports) when
+        given and are NaN for airports it does not cover.
+        """
+        itinerary = itinerary.dropna(
+            subset=["Airline-ID", "Departure-IATA", "Arrival-IATA"]
+        )
+        dep = itinerary["Departure-IATA"].to_numpy(dtype=str)
+        arr = itinerary["Arrival-IATA"].to_numpy(dtype=str)
+        self.airports = np.unique(np.concatenate([dep, arr]))
+        n = len(self.airports)
+        src = np.searchsorted(self.airports, dep).astype(np.int32)
+        dst = np.searchsorted(self.airports, arr).astype(np.int32)
+        self.airport_lat = np.full(n, np.nan)
+        self.airport_lon = np.full(n, np.nan)
+        places = airport_places(itinerary).reindex(self.airports)
+        self.airport_city = places["City"].fillna("").to_numpy(dtype=str)
+        self.airport_country = (
+            places["Country"].fillna("").to_numpy(dtype=str))
+        self.airport_country_iso3 = (
+            places["ISO-3"].fillna("").to_numpy(dtype=str))
+        if airport_table is not None:
+            coordinates = (
+                airport_table.dropna(subset=["Airport-IATA"])
+                .drop_duplicates("Airport-IATA")
+                .set_index("Airport-IATA")
+                .reindex(self.airports)
+            )
+            self.airport_lat = (
+                coordinates["Airport-Latitude"].to_numpy(dtype=np.float64))
+            self.airport_lon = (
+                coordinates["Airport-Longitude"].to_numpy(dtype=np.float64))
+
+        airline_keys = itinerary["Airline-ID"].to_numpy(dtype=np.int64)
+        self.airline_ids, route_airline = np.unique(airline_keys,
+                                                    return_inverse=True)
+        airlines = (
+            itinerary.drop_duplicates("Airline-ID")
+            .set_index("Airline-ID")
+            .reindex(self.airline_ids)
+        )
+        self.airline_iata = (
+            airlines["Airline-IATA"].fillna("").to_numpy(dtype=str)
+        )
+        self.airline_names = (
+            airlines["Airline-Name"].fillna("Unknown Airline")
+            .to_numpy(dtype=str)
+        )
+
+        # Sort routes by (src, dst) so each edge owns a contiguous slice
+        order = np.lexsort((dst, src))
+        self.route_src = src[order]
+        self.route_dst = dst[order]
+        self.route_airline = route_airline[order].astype(np.int32)
+        self.route_codeshare = (
+            itinerary["Codeshare"].eq("Y").fillna(False)
+            .to_numpy(dtype=bool)[order]
+        )
+
+        # Equipment lists ("320 738") become integer codes in a
+        # route-indexed CSR so filters never touch strings
+        equipment = (
+            itinerary["Airplane-IATA"].iloc[order]
+            .reset_index(drop=True)
+            .fillna("").astype(str).str.split().explode().dropna()
+        )
+        self.equipment, codes = np.unique(equipment.to_numpy(dtype=str),
+                                          return_inverse=True)
+        self.route_equipment = codes.astype(np.int32)
+        self.route_equipment_ptr = self._offsets(
+            equipment.index.to_numpy(), len(order))
+
+        self.cache = {}
+        self._airport_index = None
+        self._airline_index = None
+        self.index_routes()
+        logging.info(
+            f"Route graph built: {n} airports, "
+            f"{self.n_edges} airport pairs, {self.n_routes} routes, "
+            f"{len(self.airline_ids)} airlines"
+        )
+
+    def index_routes(self, src_airline_routes=None):
+        """Derive edges, both CSRs and the (airport, airline) route index
+        from the (src, dst)-sorted route arrays.
+
+        `src_airline_routes`, the route ids ordered by (departure
+        airport, airline) and then id, is sorted here unless given.
+        """
+        n = self.n_airports
+        keys = self.route_src.astype(np.int64) * n + self.route_dst
+        edge_start = np.flatnonzero(np.diff(keys, prepend=-1))
+        edge_src = self.route_src[edge_start]
+        self.indices = self.route_dst[edge_start]
+        self.indptr = self._offsets(edge_src, n)
+        self.edge_route_ptr = np.append(
+            edge_start, len(keys)).astype(np.int64)
+
+        # Reverse CSR over the same edges, for in-neighbour lookups
+        rev_order = np.lexsort((edge_src, self.indices))
+        self.rev_indices = edge_src[rev_order]
+        self.rev_edge = rev_order.astype(np.int32)
+        self.rev_indptr = self._offsets(self.indices, n)
+
+        # Routes grouped by (departure airport, airline), for searches
+        # that must stay on one airline across connections
+        src_airline = (self.route_src.astype(np.int64)
+                       * len(self.airline_ids) + self.route_airline)
+        if src_airline_routes is None:
+            src_airline_routes = np.argsort(src_airline, kind="stable")
+        self.src_airline_routes = src_airline_routes.astype(np.int32)
+        src_airline = src_airline[self.src_airline_routes]
+        key_start = np.flatnonzero(np.diff(src_airline, prepend=-1))
+        self.src_airline_keys = src_airline[key_start]
+        self.src_airline_ptr = np.append(
+            key_start, len(keys)).astype(np.int64)
+
+    def apply_delta(self, added=None, removed=None, airport_table=None):
+        """Patch the graph with enriched itinerary rows and removed routes.
+
+        `removed` needs only Airline-ID, Departure-IATA and Arrival-IATA
+        and drops every route with that key. Unknown airports and airlines
+        are appended, so the ids of existing ones stay valid. Only the
+        delta rows are encoded and sorted; they are spliced into the
+        route arrays and the (airport, airline) route index with
+        `np.insert`. That still copies every array, so a patch costs time
+        linear in the graph size, plus an O(E log E) sort of the edges
+        for the reverse CSR, instead of the O(n log n) sort of all routes
+        a build does. Cached analytics are dropped.
+        """
+        keep = np.ones(self.n_routes, dtype=bool)
+        if removed is not None:
+            removed = removed.dropna(subset=DELTA_KEY)
+            for airline, dep, arr in removed[DELTA_KEY].itertuples(
+                    index=False):
+                u, v = self.airport_id(dep), self.airport_id(arr)
+                edge = self.edge_id(u, v) if u >= 0 and v >= 0 else -1
+                airline = self.airline_id(airline)
+                if edge < 0 or airline < 0:
+                    continue
+                routes = np.arange(self.edge_route_ptr[edge],
+                                   self.edge_route_ptr[edge + 1])
+                keep[routes[self.route_airline[routes] == airline]] = False
+
+        if added is not None:
+            added = added.dropna(subset=DELTA_KEY)
+            if not len(added):
+                added = None
+        if added is None and keep.all():
+            return
+        if added is not None:
+            self._append_airports(added, airport_table)
+            self._append_airlines(added)
+
+        # Splice the delta into the kept routes at their (src, dst) rank
+        n = self.n_airports
+        route_keys = self.route_src.astype(np.int64) * n + self.route_dst
+        lengths = np.diff(self.route_equipment_ptr)
+        equipment = self.route_equipment[np.repeat(keep, lengths)]
+        lengths = lengths[keep]
+        src = dst = airline = codeshare = np.empty(0, dtype=np.int32)
+        added_lengths = codes = np.empty(0, dtype=np.int64)
+        if added is not None:
+            src = np.array([self.airport_id(code) for code
+                            in added["Departure-IATA"]], dtype=np.int32)
+            dst = np.array([self.airport_id(code) for code
+                            in added["Arrival-IATA"]], dtype=np.int32)
+            order = np.lexsort((dst, src))
+            src, dst = src[order], dst[order]
+            airline = np.array([self.airline_id(key) for key
+                                in added["Airline-ID"]],
+                               dtype=np.int32)[order]
+            codeshare = (added["Codeshare"].eq("Y").fillna(False)
+                         .to_numpy(dtype=bool)[order])
+            lists = (added["Airplane-IATA"].fillna("").astype(str)
+                     .str.split().to_numpy()[order])
+            added_lengths = np.array([len(codes) for codes in lists],
+                                     dtype=np.int64)
+            codes = self._equipment_codes(
+                [code for codes in lists for code in codes])
+        at = np.searchsorted(route_keys[keep],
+                             src.astype(np.int64) * n + dst, side="right")
+        ptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+        self.route_src = np.insert(self.route_src[keep], at, src)
+        self.route_dst = np.insert(self.route_dst[keep], at, dst)
+        self.route_airline = np.insert(self.route_airline[keep], at,
+                                       airline)
+        self.route_codeshare = np.insert(self.route_codeshare[keep], at,
+                                         codeshare)
+        self.route_equipment = np.insert(
+            equipment, np.repeat(ptr[at], added_lengths), codes
+        ).astype(np.int32)
+        self.route_equipment_ptr = np.concatenate([[0], np.cumsum(
+            np.insert(lengths, at, added_lengths))]).astype(np.int64)
+
+        # Renumber the kept routes of the (airport, airline) index and
+        # merge the added routes into it in (key, route id) order
+        kept = self.src_airline_routes[keep[self.src_airline_routes]]
+        kept = np.cumsum(keep)[kept] - 1
+        kept = kept + np.searchsorted(at, kept, side="right")
+        new = at + np.arange(len(at))
+        n_routes = len(self.route_src)
+        rank = ((self.route_src.astype(np.int64) * len(self.airline_ids)
+                 + self.route_airline) * n_routes + np.arange(n_routes))
+        new = new[np.argsort(rank[new])]
+        self.index_routes(np.insert(
+            kept, np.searchsorted(rank[kept], rank[new]), new))
+        self.cache = {}
+        logging.info(
+            f"Route graph patched: {int((~keep).sum())} routes removed, "
+            f"{len(src)} added ({self.n_routes} routes)"
+        )
+
+    def _append_airports(self, itinerary, airport_table=None):
+        places = airport_places(itinerary)
+        new = places.index[[self.airport_id(code) < 0
+                            for code in places.index]]
+        if not len(new):
+            return
+        places = places.loc[new]
+        lat = lon = np.full(len(new), np.nan)
+        if airport_table is not None:
+            coordinates = (
+                airport_table.dropna(subset=["Airport-IATA"])
+                .drop_duplicates("Airport-IATA")
+                .set_index("Airport-IATA")
+                .reindex(new)
+            )
+            lat = coordinates["Airport-Latitude"].to_numpy(dtype=np.float64)
+            lon = coordinates["Airport-Longitude"].to_numpy(dtype=np.float64)
+        self.airports = np.append(self.airports, new.to_numpy(dtype=str))
+        self.airport_lat = np.append(self.airport_lat, lat)
+        self.airport_lon = np.append(self.airport_lon, lon)
+        for name, column in (("airport_city", "City"),
+                             ("airport_country", "Country"),
+                             ("airport_country_iso3", "ISO-3")):
+            setattr(self, name, np.append(
+                getattr(self, name),
+                places[column].fillna("").to_numpy(dtype=str)))
+        self._airport_index = None
+
+    def _append_airlines(self, itinerary):
+        airlines = itinerary.drop_duplicates("Airline-ID")
+        airlines = airlines[[self.airline_id(key) < 0
+                             for key in airlines["Airline-ID"]]]
+        if not len(airlines):
+            return
+        self.airline_ids = np.append(
+            self.airline_ids, airlines["Airline-ID"].to_numpy(np.int64))
+        self.airline_iata = np.append(
+            self.airline_iata,
+            airlines["Airline-IATA"].fillna("").to_numpy(dtype=str))
+        self.airline_names = np.append(
+            self.airline_names,
+            airlines["Airline-Name"].fillna("Unknown Airline")
+            .to_numpy(dtype=str))
+        self._airline_index = None
+
+    def _equipment_codes(self, codes):
+        """Integer codes of equipment strings, appending unknown ones."""
+        index = {code: i for i, code in enumerate(self.equipment.tolist())}
+        new = [code for code in dict.fromkeys(codes) if code not in index]
+        if new:
+            index.update(zip(new, range(len(index), len(index) + len(new))))
+            self.equipment = np.append(self.equipment, new)
+        return np.array([index[code] for code in codes], dtype=np.int64)
+
+    @staticmethod
+    def _offsets(rows, n):
+        """CSR row offsets for a row-sorted array of row ids."""
+        counts = np.bincount(rows, minlength=n)
+        return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def save_snapshot(self, path):
+        """Write all graph arrays and cached results to one .npz file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {name: getattr(self, name) for name in self.array_names}
+        for key, value in self.cache.items():
+            arrays[f"cache__{key}"] = value
+        # Uncompressed so that loading is a plain read
+        save_npz(path, arrays)
+        logging.info(f"Route graph snapshot saved to {path}")
+
+    def load_snapshot(self, path, mmap=False):
+        """Populate the graph arrays and cache from a .npz snapshot."""
+        if mmap:
+            arrays = mmap_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as snapshot:
+                arrays = {key: snapshot[key] for key in snapshot.files}
+        missing = [name for name in self.array_names if name not in arrays]
+        if missing:
+            raise ValueError(f"Snapshot {path} predates arrays {missing}")
+        for name in self.array_names:
+            setattr(self, name, arrays[name])
+        self.cache = {
+            key[len("cache__"):]: value
+            for key, value in arrays.items() if key.startswith("cache__")
+        }
+        self._airport_index = None
+        self._airline_index = None
+        logging.info(
+            f"Route graph snapshot loaded from {path}: "
+            f"{self.n_airports} airports, {self.n_routes} routes"
+        )
+
+    @property
+    def n_airports(self):
+        return len(self.airports)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    @property
+    def n_routes(self):
+        return len(self.route_src)
+
+    @property
+    def edge_src(self):
+        """Source airport of every edge, in edge order."""
+        return np.repeat(np.arange(self.n_airports, dtype=np.int32),
+                         np.diff(self.indptr))
+
+    @property
+    def route_edge(self):
+        """Edge id of every route, in route order."""
+        return np.repeat(np.arange(self.n_edges, dtype=np.int32),
+                         self.edge_multiplicity)
+
+    @property
+    def edge_multiplicity(self):
+        """Number of routes (airline services) flying every edge."""
+        return np.diff(self.edge_route_ptr)
+
+    @property
+    def edge_km(self):
+        """Great-circle length of every edge in km, NaN where an
+        endpoint has no coordinates."""
+        src, dst = self.edge_src, self.indices
+        return haversine_km(self.airport_lat[src], self.airport_lon[src],
+                            self.airport_lat[dst], self.airport_lon[dst])
+
+    def airports_in(self, countries=None, cities=None):
+        """Ids of airports in any of `countries` (names or ISO-3 codes)
+        or `cities`."""
+        mask = np.zeros(self.n_airports, dtype=bool)
+        if countries is not None:
+            countries = list(countries)
+            mask |= np.isin(self.airport_country, countries)
+            mask |= np.isin(self.airport_country_iso3, countries)
+        if cities is not None:
+            mask |= np.isin(self.airport_city, list(cities))
+        return np.flatnonzero(mask)
+
+    def resolve_place(self, name):
+        """Airport ids for an IATA code, a city or a country (name or
+        ISO-3 code), matched ignoring case and accents.
+
+        The most specific match wins: an airport code, then a city, then
+        a country, so "PER" is Perth airport and "Peru" the country.
+        """
+        airport = self.airport_id(name.strip().upper())
+        if airport >= 0:
+            return np.array([airport])
+        key = fold_name(name)
+        for columns in ((self.airport_city,),
+                        (self.airport_country, self.airport_country_iso3)):
+            mask = np.zeros(self.n_airports, dtype=bool)
+            for values in columns:
+                names, inverse = np.unique(values, return_inverse=True)
+                mask |= np.array([fold_name(value) == key
+                                  for value in names.tolist()],
+                                 dtype=bool)[inverse]
+            if mask.any():
+                return np.flatnonzero(mask)
+        return np.empty(0, dtype=np.int64)
+
+    def airport_id(self, code):
+        """Integer id of an IATA code, or -1 if it is not in the graph."""
+        if self._airport_index is None:
+            self._airport_index = {
+                code: i for i, code in enumerate(self.airports.tolist())
+            }
+        return self._airport_index.get(code, -1)
+
+    def airline_id(self, key):
+        """Integer id of an OpenFlights Airline-ID, or -1 if unknown."""
+        if self._airline_index is None:
+            self._airline_index = {
+                key: i for i, key in enumerate(self.airline_ids.tolist())
+            }
+        return self._airline_index.get(int(key), -1)
+
+    def edge_id(self, u, v):
+        """Edge id of the airport pair (u, v), or -1 if there is none."""
+        start, stop = self.indptr[u], self.indptr[u + 1]
+        pos = start + np.searchsorted(self.indices[start:stop], v)
+        if pos < stop and self.indices[pos] == v:
+            return int(pos)
+        return -1
+
+    def successors(self, u):
+        return self.indices[self.indptr[u]:self.indptr[u + 1]]
+
+    def predecessors(self, v):
+        return self.rev_indices[self.rev_indptr[v]:self.rev_indptr[v + 1]]
+
+    def expand_frontier(self, frontier):
+        """Return (edge ids, sources) of all edges leaving `frontier`."""
+        return csr_expand(self.indptr, frontier)
+
+
+def delta_log_path(itinerary_path):
+    """Append log kept next to an itinerary (itinerary_log.csv)."""
+    root, extension = os.path.splitext(itinerary_path)
+    return f"{root}_log{extension}"
+
+
+def newer_sources(path, sources):
+    """Existing `sources` modified after `path`, if `path` exists."""
+    if not os.path.exists(path):
+        return []
+    modified = os.path.getmtime(path)
+    return [source for source in sources
+            if os.path.exists(source) and os.path.getmtime(source) > modified]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in km between coordinates."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def fold_name(name):
+    """Case- and accent-insensitive form of a place name."""
+    name = unicodedata.normalize("NFKD", str(name))
+    return name.encode("ascii", "ignore").decode().casefold().strip()
+
+
+def airport_places(itinerary):
+    """City and country of every airport in itinerary rows, indexed by
+    IATA code and taken from whichever side of a route it appears on."""
+    import pandas as pd
+    return pd.concat([
+        itinerary[[f"{iata}-IATA",
+                   f"Airport-City_{side}",
+                   f"Airport-Country_{side}",
+                   f"Country-ISO-3_{side}"]]
+        .set_axis(["IATA", "City", "Country", "ISO-3"], axis=1)
+        for iata, side in (("Departure", "departure"),
+                           ("Arrival", "arrival"))
+    ]).drop_duplicates("IATA").set_index("IATA")
+
+
+def save_npz(path, arrays):
+    """Write an uncompressed .npz archive and move it over `path`.
+
+    Readers may have the old archive memory-mapped, so it is replaced
+    rather than rewritten in place, which would truncate their mappings.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as handle:
+        np.savez(handle, **arrays)
+    os.replace(temporary, path)
+
+
+def mmap_npz(path):
+    """Memory-map every member of an uncompressed .npz archive read-only.
+
+    `np.savez` stores members uncompressed, so each .npy payload sits at a
+    fixed offset in the archive and can be mapped without extracting it.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as handle:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be "
+                                 f"memory-mapped")
+            # Skip the local file header to reach the .npy payload
+            handle.seek(info.header_offset)
+            name_length, extra_length = struct.unpack(
+                "<HH", handle.read(30)[26:30])
+            handle.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(handle)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(handle)
+            else:
+                header = np.lib.format.read_array_header_2_0(handle)
+            shape, fortran_order, dtype = header
+            key = os.path.splitext(info.filename)[0]
+            if 0 in shape:
+                arrays[key] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[key] = np.asarray(np.memmap(
+                path, dtype=dtype, mode="r", offset=handle.tell(),
+                shape=shape, order="F" if fortran_order else "C"
+            ))
+    return arrays
+
+
+def csr_gather(indptr, rows):
+    """Vectorized gather of the CSR positions belonging to `rows`.
+
+    Returns the flat positions into the CSR column array together with
+    the index into `rows` each position belongs to, without a
+    Python-level loop.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    positions = (np.repeat(starts - offsets, counts)
+                 + np.arange(total, dtype=np.int64))
+    return positions, np.repeat(np.arange(len(rows)), counts)
+
+
+def csr_expand(indptr, rows):
+    """Like `csr_gather`, but returns the row ids instead of indexes."""
+    rows = np.asarray(rows, dtype=np.int64)
+    positions, group = csr_gather(indptr, rows)
+    return positions, rows[group]
+
+
+if __name__ == "__main__":
+    graph = RouteGraph()
+    graph.execute()
@@ -0,0 +1,93 @@
+import logging
+import os
+from multiprocessing import Pool
+from route_graph import RouteGraph
+from route_query import RouteFinder
+
+_worker_graph = None
+_worker_finders = {}
+
+
+def attach_worker(snapshot_path):
+    """Attach a worker to the snapshot; arrays stay in the page cache."""
+    global _worker_graph
+    _worker_graph = RouteGraph.load_or_build(snapshot_path, mmap=True)
+
+
+def worker_finder(filters):
+    """One RouteFinder per filter set, so filters compile once per worker."""
+    key = tuple(sorted(
+        (name, tuple(sorted(value)) if isinstance(value, (list, set, tuple))
+         else value)
+        for name, value in filters.items()
+    ))
+    if key not in _worker_finders:
+        finder = RouteFinder(**filters)
+        finder.graph = _worker_graph
+        finder.compile_filters()
+        _worker_finders[key] = finder
+    return _worker_finders[key]
+
+
+def _run_query(task):
+    start_airport, end_airport, filters = task
+    finder = worker_finder(filters)
+    finder.start_airport = start_airport
+    finder.end_airport = end_airport
+    finder.process_data()
+    return start_airport, end_airport, finder.df
+
+
+class RouteQueryPool:
+    """Process pool of RouteFinder workers sharing one mapped snapshot.
+
+    Every worker memory-maps the same uncompressed graph snapshot
+    read-only, so adding workers adds no copies of the graph arrays.
+    """
+    def __init__(self, snapshot_path="merged/route_graph.npz",
+                 processes=None):
+        self.snapshot_path = snapshot_path
+        self.processes = processes or os.cpu_count()
+        # Build the snapshot once up front rather than in every worker
+        RouteGraph.load_or_build(snapshot_path, mmap=True)
+        self.pool = Pool(self.processes, initializer=attach_worker,
+                         initargs=(snapshot_path,))
+        logging.info(f"Started {self.processes} route query workers "
+                     f"on {snapshot_path}")
+
+    def query(self, pairs, chunksize=16, **filters):
+        """Yield (start, end, path table) for every (start, end) pair.
+
+        Keyword arguments are RouteFinder filters applied to all pairs.
+        """
+        tasks = ((start, end, filters) for start, end in pairs)
+        yield from self.pool.imap(_run_query, tasks, chunksize=chunksize)
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """Run any worker-side task; `worker_finder` is available to it."""
+        yield from self.pool.imap_unordered(func, iterable,
+                                            chunksize=chunksize)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    with RouteQueryPool() as pool:
+        for start, end, paths in pool.query([("FLN", "LIM"),
+                                             ("LIM", "FLN")]):
+            print(f"{start} -> {end}: {len(paths)} airport paths")
@@ -1,134 +1,439 @@
-import pandas as pd
-import numpy as np  # noqa: F401
+import numpy as np
 import os
 import logging
-from collections import defaultdict
 from data_handler import DataHandler
+from route_graph import RouteGraph, csr_expand, csr_gather
 
 
 class RouteFinder(DataHandler):
+    """Direct, 1-stop and 2-stop search on the airport-level route graph.
+
+    The search only visits deduplicated airport pairs and returns airport
+    paths with the number of airline services on every leg. Airline
+    combinations for a path are expanded on demand, one page at a time.
+
+    Airline, codeshare and equipment constraints are compiled to masks
+    over the graph's integer codes and applied while searching, so legs
+    without an allowed route are pruned before they are expanded.
+
+    With `backend="sqlite"` the same search runs as indexed joins in the
+    itinerary store written by FlightItineraryCrafter instead, without
+    loading the graph or the itinerary.
+
+    Origins and destinations may be cities or countries. By default a
+    group search returns the union of the pairwise searches; with
+    `exclude_group_stops` it leaves out paths that stop at another
+    airport of either group.
+    """
     def __init__(self, input_path="merged/itinerary.csv",
                  output_dir="ready",
                  start_airport="FLN",
-                 end_airport="LIM"):
+                 end_airport="LIM",
+                 snapshot_path="merged/route_graph.npz",
+                 expand_flights=False,
+                 page_size=100000,
+                 airlines=None,
+                 exclude_codeshare=False,
+                 same_airline=False,
+                 equipment=None,
+                 backend="graph",
+                 database_path="merged/itinerary.sqlite",
+                 exclude_group_stops=False):
         super().__init__(
             input_path=input_path,
-            output_path=os.path.join(output_dir, "direct_flights.csv")
+            output_path=os.path.join(output_dir, "route_paths.csv")
         )
+        self.itinerary_path = input_path
+        self.snapshot_path = snapshot_path
         self.output_dir = os.path.join(self.data_dir, output_dir)
         self.start_airport = start_airport
         self.end_airport = end_airport
-        self.route_dict = defaultdict(list)
-        self.airports_from = defaultdict(set)
-        self.airports_to = defaultdict(set)
-        self.itineraries = None
+        self.expand_flights = expand_flights
+        self.page_size = page_size
+        self.airlines = airlines
+        self.exclude_codeshare = exclude_codeshare
+        self.same_airline = same_airline
+        self.equipment = equipment
+        self.exclude_group_stops = exclude_group_stops
+        self.airline_mask = None
+        self.equipment_mask = None
+        self.route_mask = None
+        self.edge_allowed = None
+        self.search_indptr = None
+        self.search_edges = None
+        self.graph = None
+        self.backend = backend
+        self.database_path = self.resolve_path(database_path)
+        self.store = None
+        self.paths = {}
+        self.leg_counts = {}
+        self.path_combinations = {}
 
     def load_data(self):
-        """Load itineraries and precompute tuple-based structures."""
-        full_path = os.path.join(self.data_dir, self.input_path)
-        if not os.path.exists(full_path):
-            logging.error(f"Itineraries file not found at {full_path}")
-            self.df = None
+        """Load the route graph snapshot, building it if necessary, or
+        open the itinerary store."""
+        if self.backend == "sqlite":
+            from itinerary_store import ItineraryStore
+            self.store = ItineraryStore(
+                self.database_path, airlines=self.airlines,
+                exclude_codeshare=self.exclude_codeshare,
+                same_airline=self.same_airline, equipment=self.equipment,
+                itinerary_path=self.input_path)
             return
+        self.graph = RouteGraph.load_or_build(self.snapshot_path,
+                                              self.itinerary_path)
+        self.compile_filters()
 
-        self.itineraries = pd.read_csv(full_path)
-        for idx, row in self.itineraries.iterrows():
-            route_tuple = (row['Departure-IATA'], row['Arrival-IATA'])
-            self.route_dict[route_tuple].append(row)
-            self.airports_from[row['Departure-IATA']].add(row['Arrival-IATA'])
-            self.airports_to[row['Arrival-IATA']].add(row['Departure-IATA'])
+    def receive(self, outputs):
+        """Search a route graph built upstream in the same process."""
+        graph = outputs.get("route_graph")
+        if graph is None and "df_itinerary" in outputs:
+            graph = RouteGraph()
+            graph.receive(outputs)
+            graph.process_data()
+        if graph is None:
+            return False
+        self.graph = graph
+        self.compile_filters()
+        return True
 
-        logging.info(f"Loaded {len(self.itineraries)} routes from {full_path}")
-        self.df = self.itineraries
+    def compile_filters(self):
+        """Compile the route constraints against the graph's codes.
 
-    def process_data(self):
-        """Find direct, 1-stop, and 2-stop routes with vector operations."""
-        if self.itineraries is None:
-            logging.warning("No itineraries loaded!")
+        Airline and equipment codes become masks over the graph tables,
+        which yield one boolean per route and the number of allowed routes
+        per edge. Edges without an allowed route are left out of the CSR
+        the search expands.
+        """
+        graph = self.graph
+        if graph is None or graph.indptr is None:
+            return
+        self.airline_mask = (
+            None if self.airlines is None
+            else np.isin(graph.airline_iata, list(self.airlines))
+        )
+        self.equipment_mask = (
+            None if self.equipment is None
+            else np.isin(graph.equipment, list(self.equipment))
+        )
+        if not self.filtered:
+            self.route_mask = None
+            self.edge_allowed = graph.edge_multiplicity
+            self.search_indptr = graph.indptr
+            self.search_edges = np.arange(graph.n_edges)
             return
 
-        # Direct flights
-        direct_key = (self.start_airport, self.end_airport)
-        direct_rows = self.route_dict[direct_key]
-        direct_routes = pd.DataFrame(
-            direct_rows) if direct_rows else pd.DataFrame()
-
-        # 1-stop flights: Vectorized merge
-        mid_airports = (
-            self.airports_from[self.start_airport] &
-            self.airports_to[self.end_airport]
+        self.route_mask = self.allowed(np.arange(graph.n_routes))
+        self.edge_allowed = np.bincount(
+            graph.route_edge, weights=self.route_mask,
+            minlength=graph.n_edges).astype(np.int64)
+        self.search_edges = np.flatnonzero(self.edge_allowed)
+        self.search_indptr = graph._offsets(
+            graph.edge_src[self.search_edges], graph.n_airports)
+        logging.info(
+            f"Route filters keep {int(self.route_mask.sum())} of "
+            f"{graph.n_routes} routes on {len(self.search_edges)} of "
+            f"{graph.n_edges} airport pairs"
         )
-        if mid_airports:
-            start_df = self.itineraries[
-                self.itineraries['Departure-IATA'] == self.start_airport
-            ]
-            end_df = self.itineraries[
-                self.itineraries['Arrival-IATA'] == self.end_airport
-            ]
-            one_stop_routes = start_df[start_df['Arrival-IATA'].isin(
-                mid_airports)].merge(
-                end_df[end_df['Departure-IATA'].isin(mid_airports)],
-                left_on='Arrival-IATA',
-                right_on='Departure-IATA',
-                how='inner',
-                suffixes=('_leg1', '_leg2')
-            )
-        else:
-            one_stop_routes = pd.DataFrame()
-
-        # 2-stop flights: Vectorized chained merges
-        mid1_candidates = self.airports_from[self.start_airport]
-        mid2_candidates = self.airports_to[self.end_airport]
-        mid_connections = self.itineraries[
-            (self.itineraries['Departure-IATA'].isin(mid1_candidates)) &
-            (self.itineraries['Arrival-IATA'].isin(mid2_candidates))
-        ]
-        if not mid_connections.empty:
-            leg1_df = self.itineraries[
-                self.itineraries['Departure-IATA'] == self.start_airport
-            ]
-            leg3_df = self.itineraries[
-                self.itineraries['Arrival-IATA'] == self.end_airport
-            ]
-            two_stop_leg1_mid = leg1_df[leg1_df['Arrival-IATA'].isin(
-                mid_connections['Departure-IATA'])].merge(
-                mid_connections,
-                left_on='Arrival-IATA',
-                right_on='Departure-IATA',
-                how='inner',
-                suffixes=('_leg1', '_leg2')
-            )
-            two_stop_routes = two_stop_leg1_mid[two_stop_leg1_mid[
-                'Arrival-IATA_leg2'].isin(leg3_df['Departure-IATA'])].merge(
-                leg3_df,
-                left_on='Arrival-IATA_leg2',
-                right_on='Departure-IATA',
-                how='inner',
-                suffixes=('_mid', '_leg3')  # Adjusted suffixes for clarity
+
+    @property
+    def filtered(self):
+        return (self.airline_mask is not None
+                or self.exclude_codeshare
+                or self.equipment_mask is not None)
+
+    def allowed(self, routes):
+        """Boolean mask of the `routes` that pass every route filter."""
+        graph = self.graph
+        mask = np.ones(len(routes), dtype=bool)
+        if self.airline_mask is not None:
+            mask &= self.airline_mask[graph.route_airline[routes]]
+        if self.exclude_codeshare:
+            mask &= ~graph.route_codeshare[routes]
+        if self.equipment_mask is not None:
+            positions, group = csr_gather(graph.route_equipment_ptr, routes)
+            hits = self.equipment_mask[graph.route_equipment[positions]]
+            mask &= np.bincount(group[hits], minlength=len(routes)) > 0
+        return mask
+
+    def edge_routes(self, edges):
+        """Allowed routes on `edges` and the index of the edge of each."""
+        routes, group = csr_gather(self.graph.edge_route_ptr, edges)
+        if self.route_mask is not None:
+            keep = self.route_mask[routes]
+            routes, group = routes[keep], group[keep]
+        return routes, group
+
+    def airline_counts(self, edges, airports):
+        """Sorted (airport, airline) keys with allowed route counts.
+
+        `airports[i]` is the airport that keys the routes of `edges[i]`.
+        """
+        routes, group = self.edge_routes(edges)
+        keys = (airports[group].astype(np.int64) * len(self.graph.airline_ids)
+                + self.graph.route_airline[routes])
+        return np.unique(keys, return_counts=True)
+
+    def find_paths(self, start, end):
+        """Search airport paths start -> end with up to two stops.
+
+        Returns three dicts keyed by number of stops: the leg edge ids of
+        every path (one row per path), the allowed routes on each leg and
+        the number of airline combinations of each path. Paths never
+        revisit an airport.
+        """
+        graph = self.graph
+        n = graph.n_airports
+        allowed = self.edge_allowed
+        paths = {s: np.empty((0, s + 1), dtype=np.int64) for s in range(3)}
+        leg_counts = {s: np.empty((0, s + 1), dtype=np.int64)
+                      for s in range(3)}
+        if start < 0 or end < 0 or start == end:
+            return paths, leg_counts, {s: np.empty(0, dtype=np.int64)
+                                       for s in range(3)}
+
+        direct = graph.edge_id(start, end)
+        if direct >= 0 and allowed[direct]:
+            paths[0] = np.array([[direct]], dtype=np.int64)
+            leg_counts[0] = np.array([[allowed[direct]]], dtype=np.int64)
+
+        # First legs out of start, keyed by the airport they reach
+        first_edges = self.search_edges[
+            self.search_indptr[start]:self.search_indptr[start + 1]]
+        first_mid = graph.indices[first_edges]
+        keep = (first_mid != start) & (first_mid != end)
+        first_edges, first_mid = first_edges[keep], first_mid[keep]
+        leg1 = np.full(n, -1, dtype=np.int64)
+        leg1[first_mid] = first_edges
+        count1 = np.zeros(n, dtype=np.int64)
+        count1[first_mid] = allowed[first_edges]
+
+        # Last legs into end, keyed by the airport they leave from
+        rev = slice(graph.rev_indptr[end], graph.rev_indptr[end + 1])
+        last_edges = graph.rev_edge[rev]
+        last_src = graph.rev_indices[rev]
+        keep = ((last_src != start) & (last_src != end)
+                & (allowed[last_edges] > 0))
+        last_edges, last_src = last_edges[keep], last_src[keep]
+        last = np.full(n, -1, dtype=np.int64)
+        last[last_src] = last_edges
+        count3 = np.zeros(n, dtype=np.int64)
+        count3[last_src] = allowed[last_edges]
+
+        # 1 stop: out-neighbours of start that fly into end
+        mids = first_mid[last[first_mid] >= 0]
+        paths[1] = np.column_stack([leg1[mids], last[mids]])
+        leg_counts[1] = np.column_stack([count1[mids], count3[mids]])
+
+        if not self.same_airline:
+            # 2 stops: expand every first-leg airport once, keep the
+            # middle legs that land on an airport with a last leg into end
+            positions, mid1 = csr_expand(self.search_indptr, first_mid)
+            middle = self.search_edges[positions]
+            mid2 = graph.indices[middle]
+            keep = (last[mid2] >= 0) & (mid2 != mid1)
+            middle, mid1, mid2 = middle[keep], mid1[keep], mid2[keep]
+            paths[2] = np.column_stack([leg1[mid1], middle, last[mid2]])
+            leg_counts[2] = np.column_stack(
+                [count1[mid1], allowed[middle], count3[mid2]])
+            combinations = {
+                stops: np.prod(counts, axis=1, dtype=np.int64)
+                for stops, counts in leg_counts.items()
+            }
+            return paths, leg_counts, combinations
+
+        # Same-airline connections: match legs on (airport, airline) keys
+        n_airlines = len(graph.airline_ids)
+        first_keys, first_n = self.airline_counts(first_edges, first_mid)
+        last_keys, last_n = self.airline_counts(last_edges, last_src)
+        common, i1, i3 = np.intersect1d(first_keys, last_keys,
+                                        return_indices=True)
+        per_mid = np.bincount(common // n_airlines,
+                              weights=first_n[i1] * last_n[i3], minlength=n)
+
+        # 2 stops: only follow the routes of the airline that flew into
+        # each first-leg airport, via the (airport, airline) route index
+        slot = np.searchsorted(graph.src_airline_keys, first_keys)
+        slot = np.minimum(slot, len(graph.src_airline_keys) - 1)
+        found = graph.src_airline_keys[slot] == first_keys
+        positions, group = csr_gather(graph.src_airline_ptr, slot[found])
+        routes = graph.src_airline_routes[positions]
+        mid1 = graph.route_src[routes]
+        mid2 = graph.route_dst[routes]
+        weight = first_n[found][group] * _lookup(
+            last_keys, last_n,
+            mid2.astype(np.int64) * n_airlines + graph.route_airline[routes])
+        keep = (weight > 0) & (mid2 != mid1)
+        if self.route_mask is not None:
+            keep &= self.route_mask[routes]
+        route_edge = np.searchsorted(graph.edge_route_ptr, routes[keep],
+                                     side="right") - 1
+        middle, inverse = np.unique(route_edge, return_inverse=True)
+        mid1 = graph.route_src[graph.edge_route_ptr[middle]]
+        mid2 = graph.indices[middle]
+        paths[2] = np.column_stack([leg1[mid1], middle, last[mid2]])
+        leg_counts[2] = np.column_stack(
+            [count1[mid1], allowed[middle], count3[mid2]])
+
+        combinations = {
+            0: leg_counts[0][:, 0],
+            1: per_mid[mids].astype(np.int64),
+            2: np.bincount(inverse, weights=weight[keep],
+                           minlength=len(middle)).astype(np.int64)
+        }
+        keep = combinations[1] > 0
+        paths[1], leg_counts[1] = paths[1][keep], leg_counts[1][keep]
+        combinations[1] = combinations[1][keep]
+        return paths, leg_counts, combinations
+
+    def find_group_paths(self, sources, targets):
+        """`find_paths` from any airport in `sources` to any in `targets`.
+
+        The groups act as a super-source and a super-sink: first legs of
+        all origins and last legs into all destinations are expanded in
+        one search and joined on their connecting airports. The result is
+        the union of `find_paths` over every (origin, destination) pair:
+        a path never revisits an airport but may connect through another
+        airport of either group, e.g. FLN -> GRU -> LIM for Brazil ->
+        Peru. With `exclude_group_stops` such connections are left out,
+        as the part of the trip from or to that airport is a result of
+        its own.
+        """
+        graph = self.graph
+        allowed = self.edge_allowed
+        sources = np.unique(sources[sources >= 0])
+        targets = np.unique(targets[targets >= 0])
+        is_target = np.zeros(graph.n_airports, dtype=bool)
+        is_target[targets] = True
+        in_group = np.zeros(graph.n_airports, dtype=bool)
+        if self.exclude_group_stops:
+            in_group[targets] = True
+            in_group[sources] = True
+
+        # Legs out of the super-source and into the super-sink
+        positions, origin = csr_expand(self.search_indptr, sources)
+        out_edges = self.search_edges[positions]
+        out_dst = graph.indices[out_edges]
+        direct = out_edges[is_target[out_dst] & (out_dst != origin)]
+        keep = ~in_group[out_dst] & (out_dst != origin)
+        first, first_src = out_edges[keep], origin[keep]
+        first_mid = graph.indices[first]
+        positions, last_dst = csr_expand(graph.rev_indptr, targets)
+        last = graph.rev_edge[positions]
+        last_src = graph.rev_indices[positions]
+        keep = (~in_group[last_src] & (last_src != last_dst)
+                & (allowed[last] > 0))
+        last, last_src, last_dst = last[keep], last_src[keep], last_dst[keep]
+
+        # Per path, as in find_paths: origin, stops and destination are
+        # distinct airports
+        paths = {0: direct[:, None].astype(np.int64)}
+        i, j = _join(first_mid, last_src)
+        keep = ((first_src[i] != last_dst[j]) & (first_mid[i] != last_dst[j])
+                & (last_src[j] != first_src[i]))
+        paths[1] = np.column_stack(
+            [first[i][keep], last[j][keep]]).astype(np.int64)
+
+        # 2 stops: expand each first-leg airport once, keep middle legs
+        # that land on an airport with a last leg into the group
+        has_last = np.zeros(graph.n_airports, dtype=bool)
+        has_last[last_src] = True
+        positions, mid1 = csr_expand(self.search_indptr, np.unique(first_mid))
+        middle = self.search_edges[positions]
+        mid2 = graph.indices[middle]
+        keep = has_last[mid2] & ~in_group[mid2] & (mid2 != mid1)
+        middle, mid1, mid2 = middle[keep], mid1[keep], mid2[keep]
+        a, b = _join(first_mid, mid1)
+        c, d = _join(mid2[b], last_src)
+        origin, stop = first_src[a][c], first_mid[a][c]
+        keep = ((origin != last_dst[d]) & (stop != last_dst[d])
+                & (mid2[b][c] != origin))
+        paths[2] = np.column_stack(
+            [first[a][c], middle[b][c], last[d]])[keep].astype(np.int64)
+
+        leg_counts = {stops: allowed[legs].astype(np.int64)
+                      for stops, legs in paths.items()}
+        if not self.same_airline:
+            combinations = {
+                stops: np.prod(counts, axis=1, dtype=np.int64)
+                for stops, counts in leg_counts.items()
+            }
+            return paths, leg_counts, combinations
+        combinations = {0: leg_counts[0][:, 0]}
+        for stops in (1, 2):
+            combinations[stops] = self.same_airline_combinations(
+                paths[stops])
+            keep = combinations[stops] > 0
+            paths[stops] = paths[stops][keep]
+            leg_counts[stops] = leg_counts[stops][keep]
+            combinations[stops] = combinations[stops][keep]
+        return paths, leg_counts, combinations
+
+    def same_airline_combinations(self, legs):
+        """Single-airline combinations of every path (row of edge ids),
+        summed over the airlines that fly all of its legs."""
+        n_airlines = len(self.graph.airline_ids)
+        edges = np.unique(legs)
+        keys, counts = self.airline_counts(edges, edges)
+        # (path, airline) pairs for every airline on the first leg
+        key_edge = keys // n_airlines
+        lo = np.searchsorted(key_edge, legs[:, 0])
+        hi = np.searchsorted(key_edge, legs[:, 0], side="right")
+        path, position = _expand_ranges(lo, hi)
+        airline = keys[position] % n_airlines
+        weight = counts[position]
+        for leg in range(1, legs.shape[1]):
+            weight = weight * _lookup(
+                keys, counts, legs[path, leg] * n_airlines + airline)
+        return np.bincount(path, weights=weight,
+                           minlength=len(legs)).astype(np.int64)
+
+    def resolve(self, place):
+        """Airport ids of an IATA code, city or country name."""
+        return self.graph.resolve_place(place)
+
+    def search(self, sources, targets):
+        """Paths between airport groups; single airports use the dense
+        pairwise search."""
+        sources, targets = np.atleast_1d(sources), np.atleast_1d(targets)
+        if len(sources) == 1 and len(targets) == 1:
+            return self.find_paths(int(sources[0]), int(targets[0]))
+        return self.find_group_paths(sources, targets)
+
+    def process_data(self):
+        """Find all airport paths with up to two stops."""
+        if self.store is not None:
+            self.df = self.store_table(self.store_airport(self.start_airport),
+                                       self.store_airport(self.end_airport))
+            logging.info(
+                f"Found in {self.database_path}: "
+                f"{len(self.paths[0])} direct, {len(self.paths[1])} 1-stop, "
+                f"{len(self.paths[2])} 2-stop airport paths"
             )
-        else:
-            two_stop_routes = pd.DataFrame()
-
-        # Store results
-        self.direct_routes = direct_routes
-        self.one_stop_routes = one_stop_routes
-        self.two_stop_routes = two_stop_routes
-
-        total_routes = len(self.itineraries)
-        found_routes = (
-            len(direct_routes) +
-            len(one_stop_routes) +
-            len(two_stop_routes)
-        )
-        completeness = (
-            found_routes / total_routes
-        ) * 100 if total_routes > 0 else 0
+            if self.df.empty:
+                print(f"No flight information found for "
+                      f"{self.start_airport} to {self.end_airport}.")
+            return
+        graph = self.graph
+        if graph is None or graph.indptr is None:
+            logging.warning("No route graph loaded!")
+            return
+
+        self.df = self.route_table(self.resolve(self.start_airport),
+                                   self.resolve(self.end_airport))
+
+        counts = {
+            stops: int(combinations.sum())
+            for stops, combinations in self.path_combinations.items()
+        }
+        found_routes = sum(counts.values())
         logging.info(
-            f"Analyzed {total_routes} routes. "
-            f"Found: {len(direct_routes)} direct, "
-            f"{len(one_stop_routes)} 1-stop, "
-            f"{len(two_stop_routes)} 2-stop. "
-            f"Completeness: {completeness:.2f}%"
+            f"Searched {graph.n_edges} airport pairs "
+            f"({graph.n_routes} routes). "
+            f"Found: {len(self.paths[0])} direct, "
+            f"{len(self.paths[1])} 1-stop, "
+            f"{len(self.paths[2])} 2-stop airport paths "
+            f"({counts[0]} / {counts[1]} / {counts[2]} airline combinations)"
         )
 
         if found_routes == 0:
@@ -136,90 +441,237 @@ class RouteFinder(DataHandler):
                 f"No flight information found for "
                 f"{self.start_airport} to {self.end_airport}."
             )
-            print(f"Number of routes analyzed: {total_routes}")
-            print(f"Database completeness score: {completeness:.2f}%")
+            print(f"Number of routes analyzed: {graph.n_routes}")
+
+    def route_table(self, start, end):
+        """Search start -> end (airport ids or groups of them) and return
+        all path rows."""
+        self.paths, self.leg_counts, self.path_combinations = (
+            self.search(start, end)
+        )
+        return self.sorted_table(
+            [self.path_table(stops) for stops in sorted(self.paths)])
+
+    def store_airport(self, place):
+        """IATA code of `place` in the itinerary store.
+
+        The store only searches airport pairs, so a city or country name
+        is an error rather than an empty result.
+        """
+        code = place.strip().upper()
+        if not self.store.has_airport(code):
+            raise ValueError(
+                f"{place!r} is not an airport IATA code in "
+                f"{self.database_path}; the sqlite backend does not "
+                f"resolve cities or countries, use the graph backend")
+        return code
+
+    def store_table(self, start, end):
+        """`route_table` run in the itinerary store (IATA codes)."""
+        self.paths, self.leg_counts, self.path_combinations = (
+            self.store.find_paths(start, end)
+        )
+        return self.sorted_table([
+            self.path_frame(self.store.path_columns(
+                stops, self.paths[stops], self.leg_counts[stops],
+                self.path_combinations[stops]))
+            for stops in sorted(self.paths)
+        ])
+
+    @staticmethod
+    def sorted_table(tables):
+        import pandas as pd
+        return pd.concat(tables, ignore_index=True).sort_values(
+            ["Stops", "Combinations"], ascending=[True, False],
+            ignore_index=True)
+
+    def path_columns(self, stops, legs=None, leg_counts=None,
+                     combinations=None):
+        """Path rows as plain NumPy columns, without building a DataFrame.
+
+        Defaults to the paths of the last search. `Path` is the row of
+        `self.paths[stops]` to pass to `iter_flights` when expanding that
+        path's airline combinations.
+        """
+        graph = self.graph
+        if legs is None:
+            legs = self.paths[stops]
+            leg_counts = self.leg_counts[stops]
+            combinations = self.path_combinations[stops]
+        airports = [graph.edge_src[legs[:, 0]]]
+        airports += [graph.indices[legs[:, leg]] for leg in range(stops + 1)]
+        route = graph.airports[airports[0]].astype(object)
+        for airport in airports[1:]:
+            route = route + "_to_" + graph.airports[airport]
+        columns = {
+            "Stops": np.full(len(legs), stops),
+            "Path": np.arange(len(legs)),
+            "Route": route
+        }
+        for leg in range(stops + 1):
+            columns[f"Airlines_{leg + 1}"] = leg_counts[:, leg]
+        columns["Combinations"] = combinations
+        return columns
+
+    def path_table(self, stops, legs=None, leg_counts=None,
+                   combinations=None):
+        """One row per airport path with per-leg allowed route counts."""
+        return self.path_frame(
+            self.path_columns(stops, legs, leg_counts, combinations))
+
+    @staticmethod
+    def path_frame(columns):
+        import pandas as pd
+        table = pd.DataFrame({
+            name: columns[name] for name in ("Stops", "Path", "Route")
+        })
+        for leg in range(3):
+            name = f"Airlines_{leg + 1}"
+            table[name] = pd.array(
+                columns[name] if name in columns
+                else [pd.NA] * len(table),
+                dtype=pd.Int64Dtype()
+            )
+        table["Combinations"] = columns["Combinations"]
+        return table
+
+    def combination_groups(self, legs):
+        """Allowed route ids per leg, split by airline if required.
+
+        Every group is a list with one route array per leg; the airline
+        combinations of the path are the union of the groups' products.
+        """
+        graph = self.graph
+        routes = [self.edge_routes(np.array([edge]))[0] for edge in legs]
+        if not self.same_airline:
+            return [routes]
+        airlines = np.unique(graph.route_airline[routes[0]])
+        for leg_routes in routes[1:]:
+            airlines = np.intersect1d(airlines,
+                                      graph.route_airline[leg_routes])
+        return [
+            [r[graph.route_airline[r] == airline] for r in routes]
+            for airline in airlines
+        ]
+
+    def flight_columns(self, legs, offset=0, limit=None):
+        """Airline combinations [offset, offset + limit) of one path.
+
+        Combinations are enumerated in mixed-radix order over the allowed
+        routes of each leg, so any page can be produced directly without
+        materializing the ones before it. Returns NumPy columns, or an
+        empty dict past the last combination.
+        """
+        graph = self.graph
+        chosen = [[] for _ in legs]
+        position = 0
+        for group in self.combination_groups(legs):
+            sizes = [len(routes) for routes in group]
+            total = int(np.prod(sizes))
+            stop = position + total if limit is None else offset + limit
+            lo, hi = max(offset, position), min(stop, position + total)
+            if lo < hi:
+                digits = np.unravel_index(
+                    np.arange(lo - position, hi - position), sizes)
+                for leg, (routes, digit) in enumerate(zip(group, digits)):
+                    chosen[leg].append(routes[digit])
+            position += total
+            if limit is not None and position >= offset + limit:
+                break
+        if not chosen[0]:
+            return {}
+
+        flights = {}
+        for leg, parts in enumerate(chosen, start=1):
+            route = np.concatenate(parts)
+            airline = graph.route_airline[route]
+            src = graph.route_src[route[0]]
+            dst = graph.route_dst[route[0]]
+            flights[f"Airline-IATA_{leg}"] = graph.airline_iata[airline]
+            flights[f"Airline-Name_{leg}"] = graph.airline_names[airline]
+            flights[f"Route_{leg}"] = np.full(
+                len(route), f"{graph.airports[src]}_to_{graph.airports[dst]}")
+        return flights
+
+    def expand_path(self, legs, offset=0, limit=None):
+        """`flight_columns` as a DataFrame."""
+        import pandas as pd
+        return pd.DataFrame(self.flight_columns(legs, offset, limit))
+
+    def iter_flights(self, stops, paths=None, page_size=None):
+        """Stream airline combinations for selected paths in pages.
+
+        `paths` indexes rows of `self.paths[stops]` and defaults to all.
+        """
+        page_size = page_size or self.page_size
+        legs = self.paths[stops]
+        selected = range(len(legs)) if paths is None else paths
+        if self.store is not None:
+            import pandas as pd
+            for index in selected:
+                for page in self.store.iter_flights(legs[index], page_size):
+                    yield pd.DataFrame(page)
+            return
+        for index in selected:
+            total = int(self.path_combinations[stops][index])
+            for offset in range(0, total, page_size):
+                yield self.expand_path(legs[index], offset, page_size)
 
     def save_data(self):
-        """Save route combinations to separate files."""
+        """Save airport paths, and airline combinations if requested."""
+        if self.df is None:
+            logging.warning("No data to save!")
+            return
         os.makedirs(self.output_dir, exist_ok=True)
+        self.df.to_csv(self.output_path, index=False)
+        logging.info(f"Saved {len(self.df)} airport paths to "
+                     f"{self.output_path}")
+        if not self.expand_flights:
+            return
 
-        # Direct flights
-        if not self.direct_routes.empty:
-            direct_output = self.direct_routes[
-                ['Airline-IATA', 'Airline-Name', 'Route']
-            ]
-            direct_output.to_csv(
-                os.path.join(self.output_dir, "direct_flights.csv"),
-                index=False
-            )
-            logging.info(
-                f"Saved {len(direct_output)} direct flights to "
-                f"{self.output_dir}/direct_flights.csv"
-            )
-        else:
-            logging.info("No direct flights to save")
-
-        # 1-stop flights
-        if not self.one_stop_routes.empty:
-            one_stop_output = self.one_stop_routes[[
-                'Airline-IATA_leg1',
-                'Airline-Name_leg1',
-                'Route_leg1',
-                'Airline-IATA_leg2',
-                'Airline-Name_leg2',
-                'Route_leg2'
-            ]].rename(columns={
-                'Airline-IATA_leg1': 'Airline-IATA_1',
-                'Airline-Name_leg1': 'Airline-Name_1',
-                'Route_leg1': 'Route_1',
-                'Airline-IATA_leg2': 'Airline-IATA_2',
-                'Airline-Name_leg2': 'Airline-Name_2',
-                'Route_leg2': 'Route_2'
-            })
-            one_stop_output.to_csv(
-                os.path.join(self.output_dir, "one_stop_flights.csv"),
-                index=False
-            )
-            logging.info(
-                f"Saved {len(one_stop_output)} 1-stop flights to "
-                f"{self.output_dir}/one_stop_flights.csv"
-            )
-        else:
-            logging.info("No 1-stop flights to save")
-
-        # 2-stop flights
-        if not self.two_stop_routes.empty:
-            two_stop_output = self.two_stop_routes[[
-                'Airline-IATA_leg1',
-                'Airline-Name_leg1',
-                'Route_leg1',
-                'Airline-IATA_leg2',
-                'Airline-Name_leg2',
-                'Route_leg2',
-                'Airline-IATA',      # Adjusted to match actual column
-                'Airline-Name',      # Adjusted to match actual column
-                'Route'              # Adjusted to match actual column
-            ]].rename(columns={
-                'Airline-IATA_leg1': 'Airline-IATA_1',
-                'Airline-Name_leg1': 'Airline-Name_1',
-                'Route_leg1': 'Route_1',
-                'Airline-IATA_leg2': 'Airline-IATA_2',
-                'Airline-Name_leg2': 'Airline-Name_2',
-                'Route_leg2': 'Route_2',
-                'Airline-IATA': 'Airline-IATA_3',
-                'Airline-Name': 'Airline-Name_3',
-                'Route': 'Route_3'
-            })
-            two_stop_output.to_csv(
-                os.path.join(self.output_dir, "two_stop_flights.csv"),
-                index=False
-            )
-            logging.info(
-                f"Saved {len(two_stop_output)} 2-stop flights to "
-                f"{self.output_dir}/two_stop_flights.csv"
-            )
-        else:
-            logging.info("No 2-stop flights to save")
+        filenames = {
+            0: "direct_flights.csv",
+            1: "one_stop_flights.csv",
+            2: "two_stop_flights.csv"
+        }
+        for stops, filename in filenames.items():
+            path = os.path.join(self.output_dir, filename)
+            written = 0
+            for page in self.iter_flights(stops):
+                page.to_csv(path, mode="a" if written else "w",
+                            header=not written, index=False)
+                written += len(page)
+            if written:
+                logging.info(f"Saved {written} {stops}-stop flights "
+                             f"to {path}")
+            else:
+                logging.info(f"No {stops}-stop flights to save")
+
+
+def _expand_ranges(lo, hi):
+    """(range id, position) for every position of ranges [lo, hi)."""
+    counts = hi - lo
+    group = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return group, offsets + np.arange(counts.sum())
+
+
+def _join(left, right):
+    """Index pairs (i, j) with left[i] == right[j], as an equi-join."""
+    order = np.argsort(right, kind="stable")
+    ordered = right[order]
+    lo = np.searchsorted(ordered, left)
+    hi = np.searchsorted(ordered, left, side="right")
+    i, position = _expand_ranges(lo, hi)
+    return i, order[position]
+
+
+def _lookup(keys, counts, query):
+    """Counts for `query` in sorted unique `keys`, 0 where absent."""
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=np.int64)
+    position = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[position] == query, counts[position], 0)
 
 
 if __name__ == "__main__":
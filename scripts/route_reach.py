@@ -0,0 +1,117 @@
+import logging
+import os
+import numpy as np
+from route_graph import csr_expand, haversine_km
+from route_query import RouteFinder
+
+
+class ReachabilityFinder(RouteFinder):
+    """Every airport reachable from one origin within k stops or D km.
+
+    One level-synchronous search from the origin replaces a pairwise
+    query per destination: each level expands the whole frontier with a
+    CSR gather and relaxes flown distances with `np.minimum.at`, which
+    is a hop-bounded Bellman-Ford. The minimum stops and the shortest
+    flown distance of every airport come out of the same pass. Airline,
+    codeshare and equipment filters apply as in RouteFinder.
+    """
+    def __init__(self, start_airport="FLN",
+                 max_stops=2,
+                 max_km=None,
+                 output_dir="ready",
+                 **kwargs):
+        super().__init__(start_airport=start_airport, output_dir=output_dir,
+                         **kwargs)
+        self.max_stops = max_stops
+        self.max_km = max_km
+        self.output_path = os.path.join(
+            self.output_dir, f"reachable_from_{start_airport}.csv")
+        self.edge_km = None
+
+    def compile_filters(self):
+        super().compile_filters()
+        if self.graph is not None and self.graph.indptr is not None:
+            self.edge_km = self.graph.edge_km
+            if self.same_airline:
+                logging.warning("same_airline is not applied to "
+                                "reachability searches")
+
+    def reachable(self, start):
+        """Stops and flown km of every airport reachable from `start`.
+
+        Returns (airport ids, minimum stops, shortest flown distance) for
+        all airports within `max_stops` stops (None: any number) and,
+        with `max_km`, within that flown distance. Legs touching an
+        airport without coordinates count for stops but have no
+        distance, so they are skipped when `max_km` is set.
+        """
+        n = self.graph.n_airports
+        stops = np.full(n, -1, dtype=np.int64)
+        km = np.full(n, np.inf)
+        if start < 0:
+            return np.empty(0, dtype=np.int64), stops[:0], km[:0]
+        stops[start] = -2  # the origin itself is not a destination
+        km[start] = 0.0
+        frontier = np.array([start])
+        level = 0
+        while frontier.size and (self.max_stops is None
+                                 or level <= self.max_stops):
+            positions, source = csr_expand(self.search_indptr, frontier)
+            edges = self.search_edges[positions]
+            target = self.graph.indices[edges]
+            # Distances via the previous level only, so a level adds
+            # exactly one leg
+            candidate = km[source] + self.edge_km[edges]
+            candidate[np.isnan(candidate)] = np.inf
+            if self.max_km is not None:
+                within = candidate <= self.max_km
+                target, candidate = target[within], candidate[within]
+            reached = np.unique(target[stops[target] == -1])
+            stops[reached] = level
+            relaxed = km.copy()
+            np.minimum.at(relaxed, target, candidate)
+            improved = np.flatnonzero(relaxed < km)
+            km = relaxed
+            frontier = np.union1d(reached, improved)
+            level += 1
+        found = np.flatnonzero(stops >= 0)
+        return found, stops[found], km[found]
+
+    def process_data(self):
+        """Reachable airports from the origin, nearest first."""
+        import pandas as pd
+        graph = self.graph
+        if graph is None or graph.indptr is None:
+            logging.warning("No route graph loaded!")
+            return
+        start = graph.airport_id(self.start_airport)
+        airports, stops, km = self.reachable(start)
+        self.df = pd.DataFrame({
+            "Airport-IATA": graph.airports[airports],
+            "Airport-City": graph.airport_city[airports],
+            "Airport-Country": graph.airport_country[airports],
+            "Stops": stops,
+            "Flown-km": np.where(np.isinf(km), np.nan, km).round(1),
+            "Great-Circle-km": haversine_km(
+                graph.airport_lat[start], graph.airport_lon[start],
+                graph.airport_lat[airports], graph.airport_lon[airports]
+            ).round(1) if start >= 0 else np.empty(0)
+        }).sort_values(["Stops", "Flown-km"], ignore_index=True)
+        logging.info(
+            f"{len(self.df)} airports reachable from {self.start_airport} "
+            f"(by stops: {np.bincount(stops).tolist()})"
+        )
+
+    def save_data(self):
+        if self.df is None:
+            logging.warning("No data to save!")
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.df.to_csv(self.output_path, index=False)
+        logging.info(f"Saved {len(self.df)} reachable airports to "
+                     f"{self.output_path}")
+
+
+if __name__ == "__main__":
+    finder = ReachabilityFinder(start_airport="FLN", max_stops=2)
+    finder.execute()
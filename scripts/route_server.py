@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from route_graph import RouteGraph
+from route_query import RouteFinder
+
+
+class RouteService:
+    """Answers route queries from one memory-mapped graph snapshot.
+
+    Finders are compiled once per filter set and then only used through
+    their stateless search methods, so request threads can share them.
+    """
+    def __init__(self, snapshot_path="merged/route_graph.npz"):
+        self.graph = RouteGraph.load_or_build(snapshot_path, mmap=True)
+        self.finders = {}
+        self.lock = threading.Lock()
+        self.place_index = None
+
+    def finder(self, filters):
+        key = tuple(sorted(
+            (name, tuple(sorted(value)) if isinstance(value, list) else value)
+            for name, value in filters.items()
+        ))
+        with self.lock:
+            if key not in self.finders:
+                finder = RouteFinder(**filters)
+                finder.graph = self.graph
+                finder.compile_filters()
+                self.finders[key] = finder
+            return self.finders[key]
+
+    def search(self, start, end, limit=50, **filters):
+        """Airport paths start -> end, best connected first per stops.
+
+        Either end may be an airport code, a city or a country; paths
+        are those of every airport pair unless `exclude_group_stops`
+        leaves out stops at other airports of the groups.
+        """
+        finder = self.finder(filters)
+        paths, leg_counts, combinations = finder.search(
+            finder.resolve(start), finder.resolve(end))
+        result = {"from": start, "to": end, "paths": {}}
+        for stops in sorted(paths):
+            columns = finder.path_columns(stops, paths[stops],
+                                          leg_counts[stops],
+                                          combinations[stops])
+            order = np.argsort(-combinations[stops], kind="stable")[:limit]
+            result["paths"][stops] = _records(columns, order)
+        return result
+
+    def flights(self, start, end, stops, path, offset=0, limit=100,
+                **filters):
+        """One page of airline combinations for a path of `search`."""
+        finder = self.finder(filters)
+        paths, _, _ = finder.search(finder.resolve(start),
+                                    finder.resolve(end))
+        if path >= len(paths[stops]):
+            return {"flights": []}
+        columns = finder.flight_columns(paths[stops][path], offset, limit)
+        rows = np.arange(len(columns.get("Route_1", [])))
+        return {"flights": _records(columns, rows)}
+
+    def places(self, text, limit=10, kind=None):
+        """Type-ahead matches of free text to airports and airlines."""
+        with self.lock:
+            if self.place_index is None:
+                from place_index import PlaceIndex
+                self.place_index = PlaceIndex.load_or_build(mmap=True)
+        return {"query": text,
+                "places": self.place_index.records(text, limit, kind)}
+
+
+def _records(columns, order):
+    """Row dicts of the selected rows of NumPy columns, JSON-ready."""
+    picked = {name: np.asarray(values)[order].tolist()
+              for name, values in columns.items()}
+    return [dict(zip(picked, row)) for row in zip(*picked.values())]
+
+
+def _query_filters(query):
+    return {
+        "airlines": query.get("airline"),
+        "equipment": query.get("equipment"),
+        "exclude_codeshare": query.get("exclude_codeshare", ["0"])[0] == "1",
+        "same_airline": query.get("same_airline", ["0"])[0] == "1",
+        "exclude_group_stops":
+            query.get("exclude_group_stops", ["0"])[0] == "1"
+    }
+
+
+class RouteRequestHandler(BaseHTTPRequestHandler):
+    """GET /route?from=FLN&to=LIM, GET /flights?...&stops=1&path=0 and
+    GET /places?q=florianopo."""
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            filters = _query_filters(query)
+            if url.path == "/route":
+                body = self.service.search(
+                    query["from"][0], query["to"][0],
+                    int(query.get("limit", ["50"])[0]),
+                    **filters)
+            elif url.path == "/flights":
+                body = self.service.flights(
+                    query["from"][0], query["to"][0],
+                    int(query["stops"][0]),
+                    int(query["path"][0]),
+                    int(query.get("offset", ["0"])[0]),
+                    int(query.get("limit", ["100"])[0]),
+                    **filters)
+            elif url.path == "/places":
+                body = self.service.places(
+                    query["q"][0],
+                    int(query.get("limit", ["10"])[0]),
+                    query.get("kind", [None])[0])
+            else:
+                self.send_error(404)
+                return
+        except (KeyError, ValueError) as e:
+            self.send_error(400, f"Bad query: {e}")
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+def serve(host="127.0.0.1", port=8000,
+          snapshot_path="merged/route_graph.npz"):
+    RouteRequestHandler.service = RouteService(snapshot_path)
+    server = ThreadingHTTPServer((host, port), RouteRequestHandler)
+    logging.info(f"Serving route queries on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()
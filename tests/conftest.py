@@ -0,0 +1,161 @@
+import csv
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from data_handler import DataHandler  # noqa: E402
+from route_graph import RouteGraph  # noqa: E402
+
+COUNTRIES = [
+    ("Brazil", "BR", "BRA", (-60, -30, -40, -5)),
+    ("Peru", "PE", "PER", (-80, -18, -70, -2)),
+    ("Chile", "CL", "CHL", (-75, -55, -68, -18))
+]
+EQUIPMENT = ["320", "738", "E90", "AT7"]
+
+
+def synthetic_airports(n=24, seed=0):
+    """Airports with IATA codes, cities and countries, spread over the
+    synthetic countries."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        country, _, iso3, (x0, y0, x1, y1) = COUNTRIES[i % len(COUNTRIES)]
+        rows.append({
+            "Airport-ID": i + 1,
+            "Airport-IATA": "".join(chr(65 + (i // 26 ** k) % 26)
+                                    for k in (2, 1, 0)),
+            "Airport-City": f"{country} City {i % 4}",
+            "Airport-Country": country,
+            "Country-ISO-3": iso3,
+            "Airport-Latitude": rng.uniform(y0, y1),
+            "Airport-Longitude": rng.uniform(x0, x1)
+        })
+    return pd.DataFrame(rows)
+
+
+def synthetic_itinerary(airports, n_routes=400, n_airlines=6, seed=1):
+    """Itinerary rows with hubs, repeated airline services on one pair,
+    codeshares and equipment lists."""
+    rng = np.random.default_rng(seed)
+    hubs = np.arange(6)
+    weights = np.ones(len(airports))
+    weights[hubs] = 6
+    weights /= weights.sum()
+    dep = rng.choice(len(airports), n_routes, p=weights)
+    arr = rng.choice(len(airports), n_routes, p=weights)
+    keep = dep != arr
+    dep, arr = dep[keep], arr[keep]
+    airline = rng.integers(1, n_airlines + 1, len(dep))
+    equipment = [" ".join(rng.choice(EQUIPMENT, rng.integers(0, 3),
+                                     replace=False))
+                 for _ in range(len(dep))]
+    a, b = airports.iloc[dep], airports.iloc[arr]
+    itinerary = pd.DataFrame({
+        "Airline-ID": airline,
+        "Airline-IATA": [f"A{k}" for k in airline],
+        "Airline-Name": [f"Airline {k}" for k in airline],
+        "Departure-IATA": a["Airport-IATA"].to_numpy(),
+        "Arrival-IATA": b["Airport-IATA"].to_numpy(),
+        "Codeshare": np.where(rng.random(len(dep)) < 0.2, "Y", None),
+        "Airplane-IATA": [codes or None for codes in equipment],
+        "Airport-City_departure": a["Airport-City"].to_numpy(),
+        "Airport-Country_departure": a["Airport-Country"].to_numpy(),
+        "Country-ISO-3_departure": a["Country-ISO-3"].to_numpy(),
+        "Airport-City_arrival": b["Airport-City"].to_numpy(),
+        "Airport-Country_arrival": b["Airport-Country"].to_numpy(),
+        "Country-ISO-3_arrival": b["Country-ISO-3"].to_numpy()
+    })
+    return itinerary[RouteGraph.itinerary_columns]
+
+
+@pytest.fixture
+def airports():
+    return synthetic_airports()
+
+
+@pytest.fixture
+def itinerary(airports):
+    return synthetic_itinerary(airports)
+
+
+@pytest.fixture
+def graph(itinerary, airports):
+    graph = RouteGraph()
+    graph.build(itinerary, airports)
+    return graph
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """An empty data directory every DataHandler resolves paths in."""
+    for name in ("raw", "processed", "merged"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(DataHandler, "data_dir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def raw_data(data_dir, airports):
+    """Raw OpenFlights-style files and Natural Earth shapefiles, with a
+    few rows the cleaning stages must quarantine."""
+    import geopandas as gpd
+    from shapely.geometry import Point, box
+    raw = data_dir / "raw"
+    (raw / "shapefiles").mkdir()
+    gpd.GeoDataFrame({
+        "GEOUNIT": [c[0] for c in COUNTRIES],
+        "ISO_A2": [c[1] for c in COUNTRIES],
+        "ISO_A3": [c[2] for c in COUNTRIES]
+    }, geometry=[box(*c[3]) for c in COUNTRIES], crs="EPSG:4326").to_file(
+        raw / "shapefiles" / "ne_110m_admin_0_countries.shp")
+    cities = airports.drop_duplicates("Airport-City")
+    gpd.GeoDataFrame({
+        "NAME": cities["Airport-City"].to_numpy(),
+        "ADM0_A3": cities["Country-ISO-3"].to_numpy(),
+        "ISO_A2": [dict((c[0], c[1]) for c in COUNTRIES)[country]
+                   for country in cities["Airport-Country"]]
+    }, geometry=[Point(xy) for xy in zip(cities["Airport-Longitude"],
+                                         cities["Airport-Latitude"])],
+        crs="EPSG:4326").to_file(
+        raw / "shapefiles" / "ne_110m_populated_places.shp")
+
+    rows = [[row["Airport-ID"], f"{row['Airport-City']} Airport",
+             row["Airport-City"], row["Airport-Country"],
+             row["Airport-IATA"], "S" + row["Airport-IATA"],
+             row["Airport-Latitude"], row["Airport-Longitude"], 10, "-3",
+             "S", "America/Sao_Paulo", "airport", "OurAirports"]
+            for row in airports.to_dict("records")]
+    rows.append([len(rows) + 1, "Nowhere", "Nowhere", "Brazil", "\\N", "\\N",
+                 -10, -50, 1, "\\N", "\\N", "\\N", "airport", "OurAirports"])
+    write_rows(raw / "raw_airports.csv", rows)
+    write_rows(raw / "raw_airlines.csv", [
+        [k, f"Airline {k}", "\\N", f"CALL{k}", f"A{k}", f"AA{chr(64 + k)}",
+         "Brazil", "Y"] for k in range(1, 7)
+    ] + [[-1, "Unknown", "\\N", "-", "-", "N/A", "\\N", "Y"]])
+    write_rows(raw / "raw_planes.csv", [
+        ["Airbus A320", "320", "A320"], ["Boeing 737-800", "738", "B738"],
+        ["Embraer 190", "E90", "E190"], ["ATR 72", "AT7", "AT72"]])
+
+    ids = airports.set_index("Airport-IATA")["Airport-ID"]
+    routes = synthetic_itinerary(airports, n_routes=300, seed=2)
+    rows = [[row["Airline-IATA"], row["Airline-ID"], row["Departure-IATA"],
+             ids[row["Departure-IATA"]], row["Arrival-IATA"],
+             ids[row["Arrival-IATA"]], row["Codeshare"] or "", 0,
+             row["Airplane-IATA"] or ""]
+            for row in routes.to_dict("records")]
+    # Unknown airline, malformed code and an airport ID/IATA mismatch
+    rows += [["ZZ", 99, "AAA", 1, "AAB", 2, "", 0, "320"],
+             ["A1", 1, "aa", 1, "AAB", 2, "", 0, "320"],
+             ["A1", 1, "AAC", 1, "AAB", 2, "", 0, "320"]]
+    write_rows(raw / "raw_routes.csv", rows)
+    return data_dir
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as handle:
+        csv.writer(handle).writerows(rows)
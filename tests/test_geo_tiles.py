@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from airplanes import main
+from geo_tiles import TileSet, quadkeys, tile_xy, write_tiles
+from route_graph import RouteGraph
+
+gpd = pytest.importorskip("geopandas")
+shapely = pytest.importorskip("shapely")
+
+
+def layers(graph):
+    """Airport points and one line per airport pair, shaped like
+    GeoShapeCrafter.route_layers."""
+    degree = np.bincount(np.r_[graph.route_src, graph.route_dst],
+                         minlength=graph.n_airports)
+    airports = gpd.GeoDataFrame({
+        "Airport-IATA": graph.airports,
+        "Degree": degree,
+        "Layer": "airport"
+    }, geometry=gpd.points_from_xy(graph.airport_lon, graph.airport_lat),
+        crs="EPSG:4326")
+    src, dst = graph.edge_src, graph.indices
+    routes = gpd.GeoDataFrame({
+        "Route-ID": np.arange(graph.n_edges),
+        "Departure-IATA": graph.airports[src],
+        "Arrival-IATA": graph.airports[dst],
+        "Routes": graph.edge_multiplicity,
+        "Layer": "route"
+    }, geometry=shapely.linestrings(np.stack([
+        graph.airport_lon[src], graph.airport_lat[src],
+        graph.airport_lon[dst], graph.airport_lat[dst]
+    ], axis=1).reshape(-1, 2, 2)), crs="EPSG:4326")
+    return airports, routes
+
+
+@pytest.fixture
+def tile_graph(itinerary, airports):
+    """The synthetic graph with a route between two airports on one
+    latitude, 90 degrees apart: from zoom 17 their tile ids differ
+    only in the bits a 64-bit (tile << 32) | route key loses."""
+    airports.loc[[0, 1], "Airport-Longitude"] = [-100.0, -10.0]
+    airports.loc[[0, 1], "Airport-Latitude"] = -20.0
+    route = itinerary.iloc[[0]].assign(**{"Departure-IATA": "AAA",
+                                          "Arrival-IATA": "AAB"})
+    graph = RouteGraph()
+    graph.build(pd.concat([itinerary, route], ignore_index=True), airports)
+    return graph
+
+
+@pytest.mark.parametrize("max_zoom", [12, 17, 18])
+def test_viewport_at_deepest_zoom(tmp_path, tile_graph, max_zoom):
+    graph = tile_graph
+    airports, routes = layers(graph)
+    write_tiles(str(tmp_path), airports, routes, [0, 4, max_zoom],
+                max_features=2)
+    tiles = TileSet(str(tmp_path))
+    lon, lat = graph.airport_lon, graph.airport_lat
+    for i in range(graph.n_airports):
+        # Boxes of a few tiles around each airport, one of them empty
+        for dx in (0.0, 0.05):
+            bbox = (lon[i] - 0.01 + dx, lat[i] - 0.01,
+                    lon[i] + 0.01 + dx, lat[i] + 0.01)
+            found_airports, found_routes = tiles.viewport(bbox, max_zoom)
+            inside = ((lon >= bbox[0]) & (lon <= bbox[2])
+                      & (lat >= bbox[1]) & (lat <= bbox[3]))
+            assert sorted(found_airports.get("Airport-IATA", [])) == \
+                sorted(graph.airports[inside])
+
+            touching = set(routes["Route-ID"][
+                inside[graph.edge_src] | inside[graph.indices]])
+            found = list(found_routes.get("Route-ID", []))
+            assert len(found) == len(set(found))
+            found = set(found)
+            assert touching <= found
+            # Anything else touches an airport of the tiles read
+            x, y = tile_xy(lon, lat, max_zoom)
+            read = np.isin(quadkeys(x, y, max_zoom),
+                           tiles.tiles(bbox, max_zoom))
+            assert found <= set(routes["Route-ID"][
+                read[graph.edge_src] | read[graph.indices]])
+
+
+def test_run_writes_tiles(raw_data):
+    assert main(["-q", "run", "--tiles", "3"]) is None
+    tiles = TileSet(str(raw_data / "merged" / "tiles"))
+    assert tiles.zooms.tolist() == [0, 1, 2, 3]
+    assert os.path.exists(raw_data / "merged" / "geo_points.shp")
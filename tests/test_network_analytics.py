@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from network_analytics import (NetworkAnalytics, approximate_betweenness,
+                               betweenness_from_sources, pagerank)
+
+nx = pytest.importorskip("networkx")
+
+
+def digraph(graph):
+    """The route graph as a networkx DiGraph weighted by routes."""
+    g = nx.DiGraph()
+    g.add_nodes_from(range(graph.n_airports))
+    g.add_weighted_edges_from(zip(graph.edge_src.tolist(),
+                                  graph.indices.tolist(),
+                                  graph.edge_multiplicity.tolist()))
+    return g
+
+
+def test_pagerank_matches_networkx(graph):
+    rank = pagerank(graph.indptr, graph.indices,
+                    graph.edge_multiplicity.astype(np.float64),
+                    tol=1e-14, max_iter=1000)
+    expected = nx.pagerank(digraph(graph), alpha=0.85, weight="weight",
+                           tol=1e-15, max_iter=1000)
+    np.testing.assert_allclose(rank, [expected[i] for i in range(len(rank))],
+                               atol=1e-12)
+    assert rank.sum() == pytest.approx(1.0)
+
+
+def test_betweenness_matches_networkx(graph):
+    expected = nx.betweenness_centrality(digraph(graph), normalized=False)
+    expected = [expected[i] for i in range(graph.n_airports)]
+    np.testing.assert_allclose(
+        betweenness_from_sources(graph.indptr, graph.indices,
+                                 np.arange(graph.n_airports)),
+        expected, atol=1e-9)
+    # Sampling every airport is exact, in one process or several
+    for processes in (None, 2):
+        np.testing.assert_allclose(
+            approximate_betweenness(graph.indptr, graph.indices,
+                                    samples=graph.n_airports,
+                                    processes=processes),
+            expected, atol=1e-9)
+
+
+def test_sampled_betweenness_is_scaled_sources(graph):
+    n = graph.n_airports
+    sources = np.random.default_rng(3).choice(n, size=8, replace=False)
+    np.testing.assert_allclose(
+        approximate_betweenness(graph.indptr, graph.indices, samples=8,
+                                seed=3),
+        betweenness_from_sources(graph.indptr, graph.indices, sources)
+        * n / 8)
+
+
+def test_cache_is_dropped_by_apply_delta(graph, itinerary, airports):
+    analytics = NetworkAnalytics()
+    analytics.graph = graph
+    analytics.process_data()
+    assert "pagerank_0.85" in graph.cache
+    before = analytics.df.set_index("Airport-IATA")["PageRank"]
+
+    hub = graph.airports[np.argmax(before.reindex(graph.airports))]
+    graph.apply_delta(removed=itinerary[(itinerary["Departure-IATA"] == hub)
+                                        | (itinerary["Arrival-IATA"] == hub)])
+    assert not graph.cache
+    analytics.process_data()
+    after = analytics.df.set_index("Airport-IATA")["PageRank"]
+    expected = nx.pagerank(digraph(graph), alpha=0.85, weight="weight",
+                           tol=1e-15, max_iter=1000)
+    np.testing.assert_allclose(
+        after.reindex(graph.airports),
+        [expected[i] for i in range(graph.n_airports)], atol=1e-8)
+    assert after[hub] < before[hub]
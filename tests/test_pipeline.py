@@ -0,0 +1,123 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from airplanes import DEFAULT_PERSIST
+from data_cleaner import cleaning_stages
+from data_handler import Pipeline
+from data_merger import FlightItineraryCrafter
+from geo_shape_crafter import GeoShapeCrafter
+from route_delta import RouteDeltaIngestor, apply_log
+from route_graph import RouteGraph
+from route_query import RouteFinder
+from conftest import write_rows
+
+
+def read_back(df):
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+
+def write_delta(raw_data, removed=slice(0, 10), added=slice(10, 20)):
+    """Split raw route rows into removed and added delta files."""
+    routes = pd.read_csv(raw_data / "raw" / "raw_routes.csv", header=None,
+                         dtype=str, keep_default_na=False)
+    write_rows(raw_data / "raw" / "routes_added.csv",
+               routes.iloc[added].values.tolist())
+    write_rows(raw_data / "raw" / "routes_removed.csv",
+               routes.iloc[removed].values.tolist())
+    return routes.iloc[removed], routes.iloc[added]
+
+
+def test_pipeline_itinerary_matches_files(raw_data):
+    for handler in cleaning_stages():
+        handler.execute()
+    FlightItineraryCrafter().execute()
+    on_disk = pd.read_csv(raw_data / "merged" / "itinerary.csv")
+    graph_on_disk = RouteGraph.load_or_build()
+
+    os.rename(raw_data / "merged" / "itinerary.csv",
+              raw_data / "merged" / "itinerary_files.csv")
+    outputs = Pipeline(cleaning_stages() + [FlightItineraryCrafter(),
+                                            RouteGraph()]).run()
+    assert not os.path.exists(raw_data / "merged" / "itinerary.csv")
+    pd.testing.assert_frame_equal(read_back(outputs["df_itinerary"]),
+                                  on_disk)
+    graph = outputs["route_graph"]
+    for name in RouteGraph.array_names:
+        np.testing.assert_array_equal(getattr(graph, name),
+                                      getattr(graph_on_disk, name))
+
+
+def test_default_persist_serves_delta_and_geo(raw_data):
+    Pipeline(cleaning_stages() + [FlightItineraryCrafter(), RouteGraph()],
+             persist=set(DEFAULT_PERSIST)).run()
+    assert not os.path.exists(raw_data / "processed" / "clean_routes.csv")
+    write_delta(raw_data)
+    RouteDeltaIngestor().execute()
+    merged = raw_data / "merged"
+    itinerary = apply_log(pd.read_csv(merged / "itinerary.csv"),
+                          pd.read_csv(merged / "itinerary_log.csv"))
+    assert RouteGraph.load_or_build().n_routes == len(itinerary)
+
+    GeoShapeCrafter(tile_zooms=range(2)).execute()
+    assert os.path.exists(raw_data / "merged" / "geo_points.shp")
+    assert os.listdir(raw_data / "merged" / "tiles")
+
+
+def test_route_delta_needs_lookup_tables(raw_data):
+    Pipeline(cleaning_stages() + [FlightItineraryCrafter()],
+             persist={"itinerary"}).run()
+    write_delta(raw_data)
+    with pytest.raises(FileNotFoundError, match="clean_airlines.csv"):
+        RouteDeltaIngestor().execute()
+    assert not os.path.exists(raw_data / "merged" / "itinerary_log.csv")
+
+
+def test_route_delta_patches_store(raw_data):
+    Pipeline(cleaning_stages() + [
+        FlightItineraryCrafter(database_path="merged/itinerary.sqlite")
+    ], persist=True).run()
+    removed, _ = write_delta(raw_data)
+    RouteDeltaIngestor(compact_ratio=1.0).execute()
+    for start, end in zip(removed[2], removed[4]):
+        tables = []
+        for backend in ("graph", "sqlite"):
+            finder = RouteFinder(start_airport=start, end_airport=end,
+                                 backend=backend)
+            finder.load_data()
+            finder.process_data()
+            tables.append(finder.df[["Stops", "Route", "Combinations"]]
+                          .sort_values(["Stops", "Route"], ignore_index=True)
+                          .astype(str))
+        pd.testing.assert_frame_equal(*tables)
+
+
+def test_pipeline_quarantines_without_persisting(raw_data):
+    Pipeline(cleaning_stages(), persist=False).run()
+    assert not os.listdir(raw_data / "processed")
+    quarantined = pd.read_csv(raw_data / "quarantine" / "clean_routes.csv")
+    assert len(quarantined) == 3
+    assert set(quarantined["Reason"]) == {
+        "unknown_airline", "bad_departure_iata;departure_mismatch",
+        "departure_mismatch"}
+    counts = pd.read_csv(raw_data / "quarantine" / "clean_airports_counts.csv",
+                         index_col="Rule")["Rows"]
+    assert counts["missing_iata"] == 1
+
+
+def test_route_delta_appends_to_quarantine(raw_data):
+    Pipeline(cleaning_stages() + [FlightItineraryCrafter()],
+             persist=True).run()
+    routes = pd.read_csv(raw_data / "raw" / "raw_routes.csv", header=None,
+                         dtype=str, keep_default_na=False)
+    added = routes.iloc[10:20].copy()
+    added.iloc[0, 0], added.iloc[0, 1] = "ZZ", "99"
+    write_rows(raw_data / "raw" / "routes_added.csv", added.values.tolist())
+    RouteDeltaIngestor().execute()
+
+    quarantined = pd.read_csv(raw_data / "quarantine" / "clean_routes.csv")
+    assert len(quarantined) == 4
+    counts = pd.read_csv(raw_data / "quarantine" / "clean_routes_counts.csv",
+                         index_col="Rule")["Rows"]
+    assert counts["unknown_airline"] == 2
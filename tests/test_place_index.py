@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from place_index import PlaceIndex, query_trigrams
+from route_graph import fold_name
+
+QUERIES = ["lima", "florianopo", "guarul", "airport", "jorge chavez",
+           "sao paulo", "LA", "airline 2", "peru"]
+
+
+def place_tables():
+    """Forty airports in Lima, the last one also named after it, next to
+    a few that share words and an airline table."""
+    rows = [(f"A{i:02d}", f"SA{i:02d}", f"Field {i:02d}", "Lima", "Peru")
+            for i in range(39)]
+    rows += [
+        ("LIM", "SPJC", "Jorge Chavez Lima", "Lima", "Peru"),
+        ("FLN", "SBFL", "Hercilio Luz International Airport",
+         "Florianopolis", "Brazil"),
+        ("GRU", "SBGR", "Guarulhos International Airport", "Sao Paulo",
+         "Brazil"),
+        ("CGH", "SBSP", "Congonhas Airport", "Sao Paulo", "Brazil"),
+        ("VCP", None, "Viracopos Airport", "Campinas", "Brazil"),
+        ("SCL", "SCEL", "Arturo Merino Benitez Airport", "Santiago", "Chile")
+    ]
+    airports = pd.DataFrame(rows, columns=[
+        "Airport-IATA", "Airport-ICAO", "Airport-Name", "Airport-City",
+        "Airport-Country"])
+    airports.insert(0, "Airport-ID", np.arange(len(airports)) + 1)
+    airlines = pd.DataFrame({
+        "Airline-ID": [1, 2, 3],
+        "Airline-IATA": ["LA", "G3", None],
+        "Airline-ICAO": ["LAN", "GLO", "LPE"],
+        "Airline-Name": ["Airline 1 Lima", "Airline 2", "Peruvian Airline"],
+        "Airline-Alias": [None, "Gol", None],
+        "Airline-Callsign": ["LAN CHILE", "GOL", "LIMA AIR"],
+        "Airline-Country": ["Chile", "Brazil", "Peru"]
+    })
+    return airports, airlines
+
+
+def brute_force_lookup(index, airports, airlines, text, min_score=0.3):
+    """Every place scored with every one of its terms, best first."""
+    query = set(query_trigrams(fold_name(text)).tolist())
+    scores = {}
+    place = 0
+    for table, fields in ((airports, PlaceIndex.airport_fields),
+                          (airlines, PlaceIndex.airline_fields)):
+        for row in table.to_dict("records"):
+            terms = {}
+            for field, weight in fields.items():
+                if pd.isna(row[field]):
+                    continue
+                value = fold_name(row[field])
+                found = [(value, weight)] + [
+                    (word, weight * 0.9) for word in value.split()
+                    if len(word) >= 3]
+                for term, term_weight in found:
+                    terms[term] = max(terms.get(term, 0), term_weight)
+            matches = []
+            for term, weight in terms.items():
+                grams = set(query_trigrams(term).tolist())
+                score = (2 * len(query & grams) / (len(query) + len(grams))
+                         * float(np.float32(weight)))
+                if len(query & grams) and score >= min_score:
+                    matches.append(score)
+            matches.sort(reverse=True)
+            if matches:
+                scores[place] = matches[0] + 0.1 * (
+                    matches[1] if len(matches) > 1 else 0)
+            place += 1
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [place for place, _ in ranked], [score for _, score in ranked]
+
+
+@pytest.fixture
+def index():
+    index = PlaceIndex()
+    index.build(*place_tables())
+    return index
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_lookup_matches_brute_force(index, text):
+    expected, scores = brute_force_lookup(index, *place_tables(), text)
+    assert expected
+    for limit in (1, 3, 10, 100):
+        places, found = index.lookup(text, limit)
+        assert places.tolist() == expected[:limit]
+        np.testing.assert_allclose(found, scores[:limit], rtol=1e-6)
+
+
+def test_lookup_ranks_second_term_whatever_the_limit(index):
+    top = [index.lookup("lima", limit)[0][0] for limit in (1, 3, 10)]
+    assert index.place_code[top].tolist() == ["LIM"] * 3
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import synthetic_airports, synthetic_itinerary
+from route_delta import apply_log
+from route_graph import RouteGraph
+from test_route_query import airport_pairs, finder, found_paths
+
+
+def canonical_routes(graph):
+    """Every route as sorted (departure, arrival, airline, codeshare,
+    equipment) tuples, independent of the graph's integer codes."""
+    lengths = np.diff(graph.route_equipment_ptr)
+    equipment = np.split(graph.equipment[graph.route_equipment],
+                         np.cumsum(lengths)[:-1])
+    return sorted(zip(graph.airports[graph.route_src].tolist(),
+                      graph.airports[graph.route_dst].tolist(),
+                      graph.airline_ids[graph.route_airline].tolist(),
+                      graph.route_codeshare.tolist(),
+                      [" ".join(sorted(codes)) for codes in equipment]))
+
+
+def check_indexes(graph):
+    keys = graph.route_src.astype(np.int64) * graph.n_airports \
+        + graph.route_dst
+    assert (np.diff(keys) >= 0).all()
+    assert np.array_equal(graph.route_edge, np.searchsorted(
+        graph.edge_route_ptr, np.arange(graph.n_routes), side="right") - 1)
+    src_airline = (graph.route_src.astype(np.int64) * len(graph.airline_ids)
+                   + graph.route_airline)
+    assert np.array_equal(graph.src_airline_routes,
+                          np.argsort(src_airline, kind="stable"))
+    assert np.array_equal(graph.src_airline_keys, np.unique(src_airline))
+
+
+@pytest.fixture
+def delta(itinerary):
+    """Base itinerary and a delta that removes routes, re-adds one of
+    them and adds routes with a new airport and a new airline."""
+    base = itinerary.sample(frac=0.8, random_state=0)
+    removed = base.sample(25, random_state=1)
+    extra = synthetic_airports(30, seed=5).iloc[24:]
+    extra = extra.assign(**{"Airport-IATA": ["ZZA", "ZZB", "ZZC", "ZZD",
+                                             "ZZE", "ZZF"]})
+    new = synthetic_itinerary(
+        pd.concat([synthetic_airports()[:4], extra], ignore_index=True),
+        n_routes=40, seed=7)
+    new.loc[new.index[:5], ["Airline-ID", "Airline-IATA"]] = [9, "A9"]
+    added = pd.concat([itinerary.drop(base.index), new, removed.head(3)],
+                      ignore_index=True)
+    return base, added, removed, extra
+
+
+def test_apply_delta_matches_build(delta, airports):
+    base, added, removed, extra = delta
+    all_airports = pd.concat([airports, extra], ignore_index=True)
+    patched = RouteGraph()
+    patched.build(base, airports)
+    patched.apply_delta(added, removed, airport_table=all_airports)
+
+    log = pd.concat([removed.assign(Op="remove"), added.assign(Op="add")])
+    expected = RouteGraph()
+    expected.build(apply_log(base, log.assign(Batch=0)), all_airports)
+
+    assert patched.n_routes == expected.n_routes
+    assert canonical_routes(patched) == canonical_routes(expected)
+    check_indexes(patched)
+    assert patched.airport_id("ZZA") >= 0
+    assert not np.isnan(patched.airport_lat[patched.airport_id("ZZA")])
+    for filters in ({}, {"same_airline": True}, {"airlines": ["A1", "A9"]}):
+        for start, end in airport_pairs(expected):
+            found = found_paths(patched, *finder(patched, **filters)
+                                .find_paths(patched.airport_id(start),
+                                            patched.airport_id(end))[::2])
+            assert found == found_paths(
+                expected, *finder(expected, **filters).find_paths(
+                    expected.airport_id(start),
+                    expected.airport_id(end))[::2])
+
+
+def test_load_or_build_rebuilds_stale_snapshot(data_dir, itinerary):
+    path = data_dir / "merged" / "itinerary.csv"
+    itinerary.to_csv(path, index=False)
+    graph = RouteGraph.load_or_build()
+    assert graph.n_routes == len(itinerary)
+
+    first = itinerary.iloc[0]
+    itinerary[(itinerary["Departure-IATA"] != first["Departure-IATA"])
+              | (itinerary["Arrival-IATA"] != first["Arrival-IATA"])].to_csv(
+        path, index=False)
+    snapshot = os.path.getmtime(data_dir / "merged" / "route_graph.npz")
+    os.utime(path, (snapshot + 1, snapshot + 1))
+    graph = RouteGraph.load_or_build()
+    assert graph.edge_id(graph.airport_id(first["Departure-IATA"]),
+                         graph.airport_id(first["Arrival-IATA"])) < 0
+    assert graph.n_routes < len(itinerary)
+
+
+def test_save_snapshot_keeps_mapped_readers_valid(tmp_path, graph, itinerary,
+                                                  airports):
+    path = str(tmp_path / "route_graph.npz")
+    graph.save_snapshot(path)
+    mapped = RouteGraph()
+    mapped.load_snapshot(path, mmap=True)
+    indices = graph.indices.copy()
+
+    smaller = RouteGraph()
+    smaller.build(itinerary.iloc[:50], airports)
+    smaller.save_snapshot(path)
+    assert not os.path.exists(f"{path}.tmp")
+    # The old mapping still reads the arrays it was opened on
+    assert np.array_equal(mapped.indices, indices)
+    reloaded = RouteGraph()
+    reloaded.load_snapshot(path, mmap=True)
+    assert np.array_equal(reloaded.indices, smaller.indices)
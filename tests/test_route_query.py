@@ -0,0 +1,158 @@
+from collections import Counter
+import numpy as np
+import pytest
+from itinerary_store import ItineraryStore, write_itinerary_store
+from route_query import RouteFinder
+
+FILTERS = [
+    {},
+    {"same_airline": True},
+    {"airlines": ["A1", "A2", "A3"]},
+    {"exclude_codeshare": True},
+    {"equipment": ["738", "E90"]},
+    {"airlines": ["A2", "A4", "A5"], "exclude_codeshare": True,
+     "same_airline": True},
+    {"equipment": ["320"], "same_airline": True}
+]
+
+
+def allowed_routes(itinerary, airlines=None, exclude_codeshare=False,
+                   equipment=None, **_):
+    rows = itinerary
+    if airlines is not None:
+        rows = rows[rows["Airline-IATA"].isin(airlines)]
+    if exclude_codeshare:
+        rows = rows[rows["Codeshare"] != "Y"]
+    if equipment is not None:
+        rows = rows[[bool(set(str(codes).split()) & set(equipment))
+                     for codes in rows["Airplane-IATA"].fillna("")]]
+    return list(rows[["Departure-IATA", "Arrival-IATA",
+                      "Airline-ID"]].itertuples(index=False))
+
+
+def brute_force_paths(itinerary, start, end, same_airline=False, **filters):
+    """Airline combinations of every airport path start -> end with up to
+    two stops, counted by walking every route sequence."""
+    leaving = {}
+    for dep, arr, airline in allowed_routes(itinerary, **filters):
+        leaving.setdefault(dep, []).append((arr, airline))
+    found = Counter()
+
+    def walk(path, airline):
+        if path[-1] == end:
+            found[tuple(path)] += 1
+            return
+        if len(path) == 4:
+            return
+        for arr, leg_airline in leaving.get(path[-1], []):
+            if arr in path:
+                continue
+            if same_airline and airline is not None \
+                    and leg_airline != airline:
+                continue
+            walk(path + [arr], leg_airline)
+
+    if start != end:
+        walk([start], None)
+    return dict(found)
+
+
+def found_paths(graph, paths, combinations):
+    """Search results as {airport path: airline combinations}."""
+    found = {}
+    for stops, legs in paths.items():
+        for row, count in zip(legs, combinations[stops]):
+            airports = [graph.airports[graph.edge_src[row[0]]]]
+            airports += graph.airports[graph.indices[row]].tolist()
+            found[tuple(airports)] = int(count)
+    return found
+
+
+def finder(graph, **filters):
+    finder = RouteFinder(**filters)
+    finder.graph = graph
+    finder.compile_filters()
+    return finder
+
+
+def airport_pairs(graph, n=12, seed=0):
+    rng = np.random.default_rng(seed)
+    return [tuple(graph.airports[rng.choice(graph.n_airports, 2,
+                                            replace=False)])
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_find_paths_matches_brute_force(graph, itinerary, filters):
+    search = finder(graph, **filters)
+    for start, end in airport_pairs(graph):
+        paths, leg_counts, combinations = search.find_paths(
+            graph.airport_id(start), graph.airport_id(end))
+        assert found_paths(graph, paths, combinations) == \
+            brute_force_paths(itinerary, start, end, **filters)
+        for stops, legs in paths.items():
+            assert leg_counts[stops].shape == (len(legs), stops + 1)
+
+
+@pytest.mark.parametrize("filters", FILTERS[:3])
+def test_group_search_is_union_of_pairs(graph, filters):
+    search = finder(graph, **filters)
+    for origin, destination in [("Brazil", "Peru"), ("Chile", "Chile"),
+                                ("Peru City 1", "Brazil")]:
+        sources, targets = search.resolve(origin), search.resolve(destination)
+        assert len(sources) > 1 and len(targets) > 1
+        union = {}
+        for source in sources:
+            for target in targets:
+                union.update(found_paths(
+                    graph, *search.find_paths(int(source), int(target))[::2]))
+        paths, _, combinations = search.search(sources, targets)
+        assert found_paths(graph, paths, combinations) == union
+
+
+def test_group_search_can_exclude_group_stops(graph):
+    search = finder(graph, exclude_group_stops=True)
+    sources, targets = search.resolve("Brazil"), search.resolve("Peru")
+    paths, _, _ = search.search(sources, targets)
+    groups = set(graph.airports[np.r_[sources, targets]])
+    for path in found_paths(graph, paths, {s: np.zeros(len(p))
+                                           for s, p in paths.items()}):
+        assert not groups & set(path[1:-1])
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_itinerary_store_matches_graph(graph, itinerary, tmp_path, filters):
+    path = str(tmp_path / "itinerary.sqlite")
+    write_itinerary_store(itinerary, path)
+    store = ItineraryStore(path, **filters)
+    search = finder(graph, **filters)
+    try:
+        for start, end in airport_pairs(graph):
+            paths, leg_counts, combinations = store.find_paths(start, end)
+            expected = search.find_paths(graph.airport_id(start),
+                                         graph.airport_id(end))
+            found = {tuple(path): int(count)
+                     for stops in paths
+                     for path, count in zip(paths[stops],
+                                            combinations[stops])}
+            assert found == found_paths(graph, expected[0], expected[2])
+    finally:
+        store.close()
+
+
+def test_itinerary_store_rejects_places(data_dir, itinerary):
+    itinerary.to_csv(data_dir / "merged" / "itinerary.csv", index=False)
+    write_itinerary_store(itinerary,
+                          str(data_dir / "merged" / "itinerary.sqlite"))
+    for start, end in [("AAA", "Peru"), ("Brazil City 1", "AAB"),
+                       ("AAA", "ZZZ")]:
+        finder = RouteFinder(start_airport=start, end_airport=end,
+                             backend="sqlite")
+        finder.load_data()
+        with pytest.raises(ValueError, match="not an airport IATA code"):
+            finder.process_data()
+    finder = RouteFinder(start_airport="aaa", end_airport="AAB",
+                         backend="sqlite")
+    finder.load_data()
+    finder.process_data()
+    assert (finder.df["Route"].str.startswith("AAA")).all()
@@ -0,0 +1,92 @@
+import math
+import numpy as np
+import pytest
+from route_graph import RouteGraph
+from route_reach import ReachabilityFinder
+from test_route_query import FILTERS, allowed_routes
+
+
+def leg_km(airports, dep, arr):
+    """Great-circle km between two airports, NaN without coordinates."""
+    a, b = airports.loc[dep], airports.loc[arr]
+    lat1, lon1, lat2, lon2 = map(math.radians, (
+        a["Airport-Latitude"], a["Airport-Longitude"],
+        b["Airport-Latitude"], b["Airport-Longitude"]))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2)
+         * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+def bellman_ford(itinerary, airports, start, max_stops=2, max_km=None,
+                 **filters):
+    """{airport: (stops, km)} by relaxing every allowed route once per
+    level, keeping the distances of the previous level apart."""
+    airports = airports.set_index("Airport-IATA")
+    legs = {(dep, arr) for dep, arr, _ in allowed_routes(itinerary,
+                                                         **filters)}
+    km = {start: 0.0}
+    stops = {}
+    level = 0
+    while max_stops is None or level <= max_stops:
+        relaxed = dict(km)
+        for dep, arr in legs:
+            if dep not in km:
+                continue
+            candidate = km[dep] + leg_km(airports, dep, arr)
+            if math.isnan(candidate):
+                candidate = math.inf
+            if max_km is not None and not candidate <= max_km:
+                continue
+            relaxed[arr] = min(relaxed.get(arr, math.inf), candidate)
+            if arr != start:
+                stops.setdefault(arr, level)
+        if relaxed == km and max_stops is None:
+            break
+        km = relaxed
+        level += 1
+    return {airport: (stops[airport], km[airport]) for airport in stops}
+
+
+def reachable(graph, start, **options):
+    finder = ReachabilityFinder(start, **options)
+    finder.graph = graph
+    finder.compile_filters()
+    found, stops, km = finder.reachable(graph.airport_id(start))
+    return dict(zip(graph.airports[found].tolist(),
+                    zip(stops.tolist(), km.tolist())))
+
+
+def assert_same_reach(found, expected):
+    assert found.keys() == expected.keys()
+    for airport, (stops, km) in expected.items():
+        assert found[airport][0] == stops
+        assert found[airport][1] == pytest.approx(km, rel=1e-9)
+
+
+@pytest.mark.parametrize("filters", [f for f in FILTERS
+                                     if "same_airline" not in f])
+@pytest.mark.parametrize("limits", [
+    {"max_stops": 0}, {"max_stops": 1}, {"max_stops": 2},
+    {"max_stops": None}, {"max_stops": 2, "max_km": 2500},
+    {"max_stops": None, "max_km": 4000}
+])
+def test_reachable_matches_bellman_ford(graph, itinerary, airports, filters,
+                                        limits):
+    for start in graph.airports[::5]:
+        assert_same_reach(reachable(graph, start, **limits, **filters),
+                          bellman_ford(itinerary, airports, start,
+                                       **limits, **filters))
+
+
+@pytest.mark.parametrize("limits", [{"max_stops": 2},
+                                    {"max_stops": 3, "max_km": 3000}])
+def test_reachable_skips_legs_without_coordinates(itinerary, airports,
+                                                  limits):
+    # Hubs without coordinates still count for stops
+    airports.loc[[1, 4], ["Airport-Latitude", "Airport-Longitude"]] = np.nan
+    graph = RouteGraph()
+    graph.build(itinerary, airports)
+    for start in ("AAA", "AAB", "AAF", "AAK"):
+        assert_same_reach(reachable(graph, start, **limits),
+                          bellman_ford(itinerary, airports, start, **limits))